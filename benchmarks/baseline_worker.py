@@ -0,0 +1,50 @@
+# baseline_worker.py
+#
+# Runs the baseline converter, benchmarks/baseline/app.py as the repository
+# first had it with the package it imported, on aba files named one per
+# line on stdin, answering each with a json line: {} when it converted, or
+# the type and message of what it raised. The baseline converts when it is
+# run and writes ./<name>.afi, so each file is converted by running it
+# afresh in the file's directory, with its package imported anew. It runs
+# in a process of its own, away from the package under test.
+#
+# python benchmarks/baseline_worker.py < filenames
+
+import json
+import os
+import runpy
+import sys
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'baseline')
+APP = os.path.join(BASELINE, 'app.py')
+
+
+def run(aba_filename):
+    for name in list(sys.modules):
+        if name.split('.')[0] == 'banktransactionfile':
+            del sys.modules[name]
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(os.path.abspath(aba_filename)))
+    sys.argv = [APP, os.path.basename(aba_filename)]
+    try:
+        runpy.run_path(APP, run_name='__main__')
+    except Exception as e:
+        return {'error_type': e.__class__.__name__, 'error': str(e)}
+    finally:
+        os.chdir(cwd)
+    return {}
+
+
+def main():
+    sys.path.insert(0, BASELINE)
+    # anything the baseline prints goes to stderr, stdout is for results
+    out = sys.stdout
+    sys.stdout = sys.stderr
+    for line in sys.stdin:
+        out.write(json.dumps(run(line.rstrip('\n'))) + '\n')
+        out.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,818 @@
+# equivalence.py
+#
+# Differential test of the conversion engines. Randomised and edge case ABA
+# files are converted by the baseline, app.py and the package it imported
+# as the repository first had them (benchmarks/baseline, run by
+# baseline_worker.py in a process of its own), and by every engine. Each
+# engine has to give the same afi files, or raise the same error, byte for
+# byte, or differ from the baseline in one of the ways listed in
+# EXPECTED_DIFFERENCES. The throughput of every engine on a large synthetic
+# file is reported beside its result.
+#
+# Engines that write one afi stream (convert, the process pool and the
+# incremental converter) and the mmap reader are compared with the
+# baseline's conversion of the whole file. Engines that split a file into
+# parts are compared with the baseline's conversion of each part as a file
+# of its own, with a small transaction limit so the cases have several
+# parts.
+#
+# The cases are ASCII, as ABA files are.
+#
+# python benchmarks/equivalence.py [--cases 300] [--seed 0] [--size 100000]
+#     [--engines convert,split,...] [--keep-failures <dir>]
+#     [--output report.json]
+
+import argparse
+import datetime
+import gzip
+import io
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from banktransactionfile.cache import ConversionCache
+from banktransactionfile.checkpoint import (DEFAULT_CHECKPOINT_EVERY,
+    convert_resumable)
+from banktransactionfile.converter import (ConversionOptions,
+    IncrementalConverter, convert, convert_file)
+from banktransactionfile.packed import convert_packed, pack_file
+from banktransactionfile.parallel import convert_parallel
+from banktransactionfile.reconvert import Reconversion
+from banktransactionfile.split import MAX_BULK_TRANSACTIONS, convert_split
+
+import synthetic
+
+# Transactions per part for the split engines on the generated cases
+CASE_MAX_TRANSACTIONS = 7
+
+# Failures of each engine kept in the report
+MAX_FAILURES_REPORTED = 5
+
+
+#######################################################
+#                                                     #
+#                      Reference                      #
+#                                                     #
+#######################################################
+
+# The baseline converter, app.py as the repository first had it
+BASELINE_WORKER = os.path.join(HERE, 'baseline_worker.py')
+
+# What AbaFile.parse raises in the baseline, reading the file before it
+# converts any of it
+PARSE_ERRORS = (
+    'Input ABA file must contain 120 characters per line to be converted' +
+        ' correctly',
+    'ABA file must contain header,transaction and control record to be' +
+        ' converted',
+    'ABA file must contain only one header and control record',
+)
+
+SPLIT_HEADER_ERROR = ('error', 'InvalidFormatError', 'ABA file must start' +
+    ' with a header record to be split')
+RECORD_TYPE_ERROR = ('error', 'InvalidFormatError', 'First number of record' +
+    ' must be 1, 2 or 7')
+
+
+class Baseline(object):
+    """
+    The baseline converter, run by baseline_worker.py in a process of its
+    own so none of the package under test is imported into it.
+    """
+
+    def __init__(self):
+        self.process = subprocess.Popen([sys.executable, BASELINE_WORKER],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            universal_newlines=True)
+
+    def convert(self, aba_filename):
+        """
+        Convert aba_filename as app.py first did, to the afi file it writes
+        beside it. Returns ('ok', [afi text]) or ('error', error type,
+        message), removing the afi file.
+        """
+        self.process.stdin.write(aba_filename + '\n')
+        self.process.stdin.flush()
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError('the baseline worker exited')
+        result = json.loads(line)
+        afi_filename = os.path.splitext(aba_filename)[0] + '.afi'
+        try:
+            if result:
+                return ('error', result['error_type'], result['error'])
+            return ('ok', [read_text(afi_filename)])
+        finally:
+            if os.path.exists(afi_filename):
+                os.remove(afi_filename)
+
+    def convert_parts(self, aba_filename, max_transactions):
+        """
+        Convert aba_filename split into parts of max_transactions
+        transactions, each part a file of the header, its transactions and
+        the control record converted by the baseline on its own. The
+        sender's name and account are put into each part where the
+        baseline looks them up, the first and second records, as they are
+        in the whole file. Returns ('ok', [afi text of each part]) or the
+        first error of a part. A file the baseline can't read, or that has
+        transactions before its header and so can't be split, gives the
+        outcome of converting it whole.
+        """
+        whole = self.convert(aba_filename)
+        if whole[0] == 'error' and whole[2] in PARSE_ERRORS:
+            return whole
+        with open(aba_filename) as f:
+            records = [line.rstrip('\r\n') for line in f]
+        types = [record[0] for record in records]
+        if types.index('1') < types.index('0'):
+            return whole
+
+        # the sender's name and account as the whole file gives them
+        header = put(records[types.index('0')], 30, records[0][30:56])
+        control = records[types.index('7')]
+        chunks = [[]]
+        count = 0
+        for record in records:
+            if record[0] in '07':
+                continue
+            if record[0] == '1':
+                if count == max_transactions:
+                    chunks.append([])
+                    count = 0
+                count += 1
+            chunks[-1].append(record)
+
+        parts = []
+        for number, chunk in enumerate(chunks):
+            chunk[0] = put(chunk[0], 80, records[1][80:96])
+            part_filename = '{}-part{}.aba'.format(
+                os.path.splitext(aba_filename)[0], number)
+            with open(part_filename, 'w') as f:
+                f.write(''.join(record + '\n'
+                    for record in [header] + chunk + [control]))
+            try:
+                result = self.convert(part_filename)
+            finally:
+                os.remove(part_filename)
+            if result[0] == 'error':
+                return result
+            parts.extend(result[1])
+        return ('ok', parts)
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+#######################################################
+#                                                     #
+#                       Engines                       #
+#                                                     #
+#######################################################
+
+# Every engine takes (aba filename, output directory, options,
+# max_transactions) and returns the afi files it wrote, or the text
+# it wrote for engines that write a stream.
+
+def read_text(filename):
+    if filename.endswith('.gz'):
+        with gzip.open(filename, 'rt', newline='') as f:
+            return f.read()
+    with open(filename, newline='') as f:
+        return f.read()
+
+
+def engine_convert(aba_filename, output_dir, options, max_transactions):
+    dst = io.StringIO()
+    with open(aba_filename) as src:
+        convert(src, dst, options)
+    return [dst.getvalue()]
+
+
+def engine_convert_mmap(aba_filename, output_dir, options, max_transactions):
+    afi_filename = os.path.join(output_dir, 'out.afi')
+    convert_file(aba_filename, afi_filename, ConversionOptions(
+        options.transaction_code, options.file_type, options.creation_date,
+        reader='mmap'))
+    return [read_text(afi_filename)]
+
+
+def engine_parallel(aba_filename, output_dir, options, max_transactions):
+    dst = io.StringIO()
+    with open(aba_filename) as src:
+        if max_transactions == CASE_MAX_TRANSACTIONS:
+            # small chunks so the cases are spread over the pool
+            convert_parallel(src, dst, options, processes=2, chunk_size=3)
+        else:
+            convert_parallel(src, dst, options, processes=2)
+    return [dst.getvalue()]
+
+
+def engine_incremental(aba_filename, output_dir, options, max_transactions):
+    with open(aba_filename) as src:
+        lines = src.readlines()
+    rng = random.Random(len(lines))
+    converter = IncrementalConverter(options)
+    output = []
+    while lines:
+        n = rng.randint(1, 5)
+        output.extend(converter.feed(lines[:n]))
+        del lines[:n]
+    output.extend(converter.finish())
+    return [''.join(line + '\n' for line in output)]
+
+
+def parts_filenames(parts):
+    return [filename for filename, totals in parts]
+
+
+def engine_split(aba_filename, output_dir, options, max_transactions):
+    return parts_filenames(convert_split(aba_filename,
+        os.path.join(output_dir, 'out'), options, max_transactions,
+        processes=1))
+
+
+def engine_split_pool(aba_filename, output_dir, options, max_transactions):
+    return parts_filenames(convert_split(aba_filename,
+        os.path.join(output_dir, 'out'), options, max_transactions,
+        processes=2))
+
+
+def engine_split_gz(aba_filename, output_dir, options, max_transactions):
+    gz_filename = aba_filename + '.gz'
+    with open(aba_filename, 'rb') as src, gzip.open(gz_filename, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    return parts_filenames(convert_split(gz_filename,
+        os.path.join(output_dir, 'out'), options, max_transactions,
+        processes=1, compression='gz'))
+
+
+def engine_cache(aba_filename, output_dir, options, max_transactions):
+    # converted once into the cache, then copied out of it
+    cache = ConversionCache(os.path.join(os.path.dirname(aba_filename),
+        'cache'))
+    afi_name = os.path.join(output_dir, 'out')
+    first = [read_text(filename) for filename in parts_filenames(
+        cache.convert_split(aba_filename, afi_name, options,
+        max_transactions, processes=1))]
+    second = parts_filenames(cache.convert_split(aba_filename, afi_name,
+        options, max_transactions, processes=1))
+    if [read_text(filename) for filename in second] != first:
+        raise AssertionError('a cache hit gave different afi files')
+    return second
+
+
+def engine_resumable(aba_filename, output_dir, options, max_transactions):
+    checkpoint_every = DEFAULT_CHECKPOINT_EVERY
+    if max_transactions == CASE_MAX_TRANSACTIONS:
+        # checkpoints in the middle of the cases
+        checkpoint_every = 3
+    return parts_filenames(convert_resumable(aba_filename,
+        os.path.join(output_dir, 'out'), options, max_transactions,
+        checkpoint_every))
+
+
+def engine_reconvert(aba_filename, output_dir, options, max_transactions):
+    # once to fill the state, then again from it
+    reconversion = Reconversion(os.path.join(os.path.dirname(aba_filename),
+        'state'), options, max_transactions)
+    afi_name = os.path.join(output_dir, 'out')
+    first = [read_text(filename) for filename in parts_filenames(
+        reconversion.run(aba_filename, afi_name))]
+    second = parts_filenames(reconversion.run(aba_filename, afi_name))
+    if [read_text(filename) for filename in second] != first:
+        raise AssertionError('reconverting from the state gave different' +
+            ' afi files')
+    return second
+
+
+def engine_packed(aba_filename, output_dir, options, max_transactions):
+    packed_filename = os.path.join(os.path.dirname(aba_filename), 'in.abp')
+    pack_file(aba_filename, packed_filename)
+    return parts_filenames(convert_packed(packed_filename,
+        os.path.join(output_dir, 'out'), options, max_transactions))
+
+
+# How an engine is held to the reference
+STREAM = 'stream'
+SPLIT = 'split'
+SPLIT_STRUCTURE_FIRST = 'split_structure_first'
+MODES = (STREAM, SPLIT, SPLIT_STRUCTURE_FIRST)
+
+# The baseline conversion each mode is compared with, of the whole file or
+# of its parts
+REFERENCE_MODES = {STREAM: STREAM, SPLIT: SPLIT, SPLIT_STRUCTURE_FIRST: SPLIT}
+
+# name: (function, how it is held to the reference)
+ENGINES = {
+    'convert': (engine_convert, STREAM),
+    'convert_mmap': (engine_convert_mmap, STREAM),
+    'parallel': (engine_parallel, STREAM),
+    'incremental': (engine_incremental, STREAM),
+    'split': (engine_split, SPLIT),
+    'split_pool': (engine_split_pool, SPLIT),
+    'split_gz': (engine_split_gz, SPLIT),
+    'cache': (engine_cache, SPLIT),
+    'resumable': (engine_resumable, SPLIT),
+    'reconvert': (engine_reconvert, SPLIT),
+    'packed': (engine_packed, SPLIT_STRUCTURE_FIRST),
+}
+
+
+def expected_outcome(baseline, aba_filename, reference, max_transactions):
+    if reference == STREAM:
+        return baseline.convert(aba_filename)
+    return baseline.convert_parts(aba_filename, max_transactions)
+
+
+#######################################################
+#                                                     #
+#                Expected differences                 #
+#                                                     #
+#######################################################
+
+# Where the engines mean to differ from the baseline. Each is given as
+# (name, modes it applies to, predicate), the predicate taking the
+# baseline's outcome, the engine's and the records of the file. A case
+# only passes on one of them when the engine's outcome differs from the
+# baseline's in that way.
+
+def invalid_literal(result):
+    # the text int() was given, when result is its ValueError
+    match = re.match(r"invalid literal for int\(\) with base 10: '(.*)'$",
+        result[2]) if result[:2] == ('error', 'ValueError') else None
+    return match.group(1) if match else None
+
+
+# The baseline reads the whole file before it converts any of it, so a
+# broken line or record count fails a file however broken its other
+# records are. The engines stream, checking each line as they read it, and
+# fail a file at its first problem, of whatever kind.
+def structure_checked_as_read(expected, got, records):
+    return (expected[0] == 'error' and expected[2] in PARSE_ERRORS and
+        got[0] == 'error')
+
+
+# The baseline hashes the receiver accounts when it reaches the control
+# record, so an account with no digits where the hash takes them fails
+# there, after any error in the records between. The engines hash each
+# account as they convert its transaction.
+def account_read_at_its_transaction(expected, got, records):
+    text = invalid_literal(got)
+    return (expected[0] == 'error' and text is not None and
+        any(record[:1] == '1' and
+        record[1:17].replace('-', '').strip()[1:13] == text
+        for record in records))
+
+
+# A packed batch is checked in full when it is packed, so a record of no
+# known type fails it before any record is converted.
+def structure_checked_when_packed(expected, got, records):
+    return (expected[0] == 'error' and got == RECORD_TYPE_ERROR and
+        any(record[:1] not in ('0', '1', '7') for record in records))
+
+
+# A split conversion needs the header before any transaction, to begin
+# every part with it.
+def split_needs_the_header_first(expected, got, records):
+    types = [record[:1] for record in records]
+    return (got == SPLIT_HEADER_ERROR and '0' in types and '1' in types and
+        types.index('1') < types.index('0'))
+
+
+EXPECTED_DIFFERENCES = (
+    ('structure checked as read', MODES, structure_checked_as_read),
+    ('account read at its transaction', MODES,
+        account_read_at_its_transaction),
+    ('structure checked when packed', (SPLIT_STRUCTURE_FIRST,),
+        structure_checked_when_packed),
+    ('split needs the header first', (SPLIT, SPLIT_STRUCTURE_FIRST),
+        split_needs_the_header_first),
+)
+
+
+def expected_difference(mode, expected, got, records):
+    # the name of the expected difference got is, or None
+    for name, modes, predicate in EXPECTED_DIFFERENCES:
+        if mode in modes and predicate(expected, got, records):
+            return name
+    return None
+
+
+#######################################################
+#                                                     #
+#                        Cases                        #
+#                                                     #
+#######################################################
+
+# Line endings the cases are written with, the text reader takes all of them
+LINE_ENDINGS = {'lf': '\n', 'crlf': '\r\n', 'cr': '\r'}
+
+
+# Put text into record at start, keeping its length
+def put(record, start, text):
+    return record[:start] + text + record[start + len(text):]
+
+
+# Text with characters the converter removes or the bank doesn't take
+AWKWARD_TEXT = ('SMITH, JOHN', 'O"NEIL & CO', 'NAME#1_2!', '100% *REF*',
+    'TAB\tIN NAME', '~`@$^{}[]|\\', "D'ARCY-LEE", 'A' * 32, '', ' ' * 5,
+    'X')
+
+# Amounts, the converter reads record[21:30]
+AMOUNTS = ('0000000000', '0000000001', '0999999999', '9999999999',
+    '00000 1234', '000000001a', '-000000001', '          ')
+
+ACCOUNTS = (
+    '020-100123456789', # 15 digits once the hyphen goes
+    '0201001234567890', # 16 digits
+    '020100123456789 ', # 15 digits, padded
+    '02010012345678  ', # 14 digits
+    '020-10012345678A', # letters
+    '                ',
+    '0-2-0-1-0-0-1234',
+)
+
+# Process dates as days from today, and ones that aren't dates
+PROCESS_DAYS = (0, 1, 30, 364, 365, 366, -1, -30)
+PROCESS_DATES = ('000000', '999999', 'ABCDEF', '311399', '      ')
+
+
+def detail(rng, trace_account, remitter, edge):
+    record = synthetic.detail_record(rng, rng.randint(1, 5000000),
+        trace_account, remitter)
+    if not edge:
+        return record
+    for n in range(rng.randint(1, 3)):
+        choice = rng.randrange(6)
+        if choice == 0:
+            record = put(record, 1, rng.choice(ACCOUNTS))
+        elif choice == 1:
+            record = put(record, 20, rng.choice(AMOUNTS))
+        elif choice == 2:
+            record = put(record, 30, rng.choice(AWKWARD_TEXT)[:32].ljust(32))
+        elif choice == 3:
+            record = put(record, 62, rng.choice(AWKWARD_TEXT)[:18].ljust(18))
+        elif choice == 4:
+            record = put(record, 96, rng.choice(AWKWARD_TEXT)[:16].ljust(16))
+        else:
+            record = put(record, 18, rng.choice(('50', '52', '13', '  ')))
+    return record
+
+
+def header(rng, edge):
+    user_name = rng.choice(synthetic.COMPANIES)
+    if edge and rng.random() < 0.5:
+        user_name = rng.choice(AWKWARD_TEXT)
+    process_date = datetime.date.today() + datetime.timedelta(days=1)
+    record = synthetic.header_record(user_name, process_date)
+    if edge and rng.random() < 0.5:
+        if rng.random() < 0.7:
+            process_date = datetime.date.today() + datetime.timedelta(
+                days=rng.choice(PROCESS_DAYS))
+            record = put(record, 74, process_date.strftime('%d%m%y'))
+        else:
+            record = put(record, 74, rng.choice(PROCESS_DATES))
+    return record
+
+
+# Break the structure of a file given as a list of records
+def restructure(rng, records):
+    choice = rng.randrange(10)
+    if choice == 0:
+        del records[0] # no header
+    elif choice == 1:
+        del records[-1] # no control
+    elif choice == 2:
+        records.insert(rng.randrange(1, len(records)), records[0])
+    elif choice == 3:
+        records.insert(rng.randrange(1, len(records)), records[-1])
+    elif choice == 4:
+        # control before the last transactions
+        records.insert(rng.randrange(1, len(records)), records.pop())
+    elif choice == 5:
+        # transactions before the header
+        records.insert(rng.randrange(1, len(records)), records.pop(0))
+    elif choice == 6:
+        n = rng.randrange(len(records))
+        records[n] = put(records[n], 0, rng.choice('23589 A'))
+    elif choice == 7:
+        n = rng.randrange(len(records))
+        records[n] = records[n] + rng.choice(('X', ' ', 'XX'))
+    elif choice == 8:
+        n = rng.randrange(len(records))
+        records[n] = records[n][:-rng.randint(1, 3)]
+    else:
+        n = rng.randrange(len(records))
+        records.insert(n, '')
+    return records
+
+
+def random_case(rng):
+    """
+    Return (description, text) of a random ABA file: valid, with awkward
+    field values, with its structure broken, or with random characters
+    changed.
+    """
+    kind = rng.choice(('valid', 'valid', 'fields', 'fields', 'structure',
+        'characters'))
+    transactions = rng.choice((1, 2, 3, CASE_MAX_TRANSACTIONS - 1,
+        CASE_MAX_TRANSACTIONS, CASE_MAX_TRANSACTIONS + 1,
+        rng.randint(1, 4 * CASE_MAX_TRANSACTIONS)))
+    trace_account = rng.choice(ACCOUNTS[:2])
+    remitter = rng.choice(synthetic.COMPANIES)
+    edge = kind == 'fields'
+
+    records = [header(rng, edge)]
+    for n in range(transactions):
+        records.append(detail(rng, trace_account, remitter,
+            edge and rng.random() < 0.3))
+    records.append(synthetic.control_record(rng.randint(0, 10 ** 9),
+        transactions))
+
+    if kind == 'structure':
+        records = restructure(rng, records)
+    elif kind == 'characters':
+        for n in range(rng.randint(1, 4)):
+            line = rng.randrange(len(records))
+            if records[line]:
+                position = rng.randrange(len(records[line]))
+                records[line] = put(records[line], position,
+                    rng.choice('0123456789 -,A#\t'))
+
+    endings = rng.choice(('lf', 'crlf', 'cr', 'mixed'))
+    text = ''
+    for record in records:
+        if endings == 'mixed':
+            text += record + rng.choice(tuple(LINE_ENDINGS.values()))
+        else:
+            text += record + LINE_ENDINGS[endings]
+    if rng.random() < 0.2:
+        # no line ending on the last record
+        text = text.rstrip('\r\n')
+    description = '{} {} transactions {}'.format(kind, transactions, endings)
+    return description, text
+
+
+def fixed_cases():
+    rng = random.Random(0)
+    valid = synthetic.header_record('ACME PAYROLL LTD',
+        datetime.date.today() + datetime.timedelta(days=1))
+    records = [valid, synthetic.detail_record(rng, 100, ACCOUNTS[0],
+        'ACME'), synthetic.control_record(100, 1)]
+    return [
+        ('empty file', ''),
+        ('one newline', '\n'),
+        ('header only', valid + '\n'),
+        ('one transaction', '\n'.join(records) + '\n'),
+        ('one transaction crlf', '\r\n'.join(records) + '\r\n'),
+        ('one transaction no final newline', '\n'.join(records)),
+        ('blank line at end', '\n'.join(records) + '\n\n'),
+    ]
+
+
+#######################################################
+#                                                     #
+#                       Running                       #
+#                                                     #
+#######################################################
+
+def outcome(function, *args):
+    """
+    Run function and return ('ok', result) or ('error', error type,
+    message).
+    """
+    try:
+        return ('ok', function(*args))
+    except Exception as e:
+        return ('error', e.__class__.__name__, str(e))
+
+
+def run_engine(name, aba_filename, workdir, options, max_transactions):
+    """
+    Run an engine on a copy of aba_filename in a directory of its own and
+    return its outcome, with the text of the afi files it wrote. An engine
+    that leaves files behind when it fails, or files it didn't report, has
+    the names added to its outcome so it can't match.
+    """
+    function, mode = ENGINES[name]
+    engine_dir = tempfile.mkdtemp(prefix=name + '-', dir=workdir)
+    output_dir = os.path.join(engine_dir, 'out')
+    os.mkdir(output_dir)
+    source = os.path.join(engine_dir, 'in.aba')
+    shutil.copyfile(aba_filename, source)
+    try:
+        result = outcome(function, source, output_dir, options,
+            max_transactions)
+        written = sorted(os.listdir(output_dir))
+        if result[0] == 'ok':
+            outputs = result[1]
+            if mode != STREAM:
+                reported = sorted(os.path.basename(filename)
+                    for filename in outputs)
+                outputs = [read_text(filename) for filename in outputs]
+                if written != reported:
+                    result = ('ok', outputs, 'also wrote', written)
+                else:
+                    result = ('ok', outputs)
+        elif written:
+            result = result + ('left behind', written)
+        return result
+    finally:
+        shutil.rmtree(engine_dir)
+
+
+def summary(result):
+    # shorten afi text for the report
+    if result[0] == 'ok':
+        return ['ok'] + [[text[:200] + ('...' if len(text) > 200 else '')
+            for text in result[1]]] + list(result[2:])
+    return list(result)
+
+
+def check_cases(cases, engines, workdir, options, keep_failures=None):
+    """
+    Convert every case with the baseline and each engine. Returns
+    {engine: {'passed': n, 'differences': {name: n}, 'failed': n,
+    'failures': [...]}}, a case the engine converts differently in an
+    expected way being counted under the name of the difference.
+    """
+    results = dict((name, {'passed': 0, 'differences': {}, 'failed': 0,
+        'failures': []}) for name in engines)
+    references = set(REFERENCE_MODES[ENGINES[name][1]] for name in engines)
+    aba_filename = os.path.join(workdir, 'case.aba')
+    baseline = Baseline()
+
+    try:
+        for number, (description, text) in enumerate(cases):
+            with open(aba_filename, 'w', newline='') as f:
+                f.write(text)
+            with open(aba_filename) as f:
+                records = [line.rstrip('\r\n') for line in f]
+            expected = dict((reference, expected_outcome(baseline,
+                aba_filename, reference, CASE_MAX_TRANSACTIONS))
+                for reference in references)
+
+            for name in engines:
+                mode = ENGINES[name][1]
+                reference = expected[REFERENCE_MODES[mode]]
+                got = run_engine(name, aba_filename, workdir, options,
+                    CASE_MAX_TRANSACTIONS)
+                result = results[name]
+                if got == reference:
+                    result['passed'] += 1
+                    continue
+                difference = expected_difference(mode, reference, got,
+                    records)
+                if difference is not None:
+                    result['differences'][difference] = result[
+                        'differences'].get(difference, 0) + 1
+                    continue
+
+                result['failed'] += 1
+                case_name = 'case{}.aba'.format(number)
+                if len(result['failures']) < MAX_FAILURES_REPORTED:
+                    result['failures'].append({
+                        'case': case_name,
+                        'description': description,
+                        'expected': summary(reference),
+                        'got': summary(got),
+                    })
+                if keep_failures is not None:
+                    if not os.path.isdir(keep_failures):
+                        os.makedirs(keep_failures)
+                    shutil.copyfile(aba_filename,
+                        os.path.join(keep_failures, case_name))
+    finally:
+        baseline.close()
+    return results
+
+
+def throughput(engines, size, workdir, options):
+    """
+    Time the baseline and each engine on a synthetic file of size
+    transactions, split at the bank's limit. Returns the baseline's
+    records/sec and {engine: {'records_per_sec', 'speedup',
+    'matches_reference'}}.
+    """
+    aba_filename = os.path.join(workdir, 'synthetic.aba')
+    synthetic.generate(aba_filename, size)
+
+    timings = {}
+    expected = {}
+    baseline = Baseline()
+    try:
+        for reference in (STREAM, SPLIT):
+            start = time.time()
+            expected[reference] = expected_outcome(baseline, aba_filename,
+                reference, MAX_BULK_TRANSACTIONS)
+            timings[reference] = time.time() - start
+    finally:
+        baseline.close()
+    reference_rate = size / max(timings[SPLIT], 1e-9)
+
+    results = {}
+    for name in engines:
+        reference = REFERENCE_MODES[ENGINES[name][1]]
+        start = time.time()
+        got = run_engine(name, aba_filename, workdir, options,
+            MAX_BULK_TRANSACTIONS)
+        seconds = max(time.time() - start, 1e-9)
+        results[name] = {
+            'records_per_sec': round(size / seconds),
+            'speedup': round(timings[reference] / seconds, 2),
+            'matches_reference': got == expected[reference],
+        }
+    os.remove(aba_filename)
+    return round(reference_rate), results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Check the conversion engines give the same afi files' +
+        ' as the reference conversion, and time them')
+    parser.add_argument('--cases', type=int, default=300,
+        help='random cases, on top of the fixed edge cases' +
+        ' (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--size', type=int, default=100000,
+        help='transactions in the file engines are timed on, 0 to skip' +
+        ' timing (default: %(default)s)')
+    parser.add_argument('--engines', default=','.join(sorted(ENGINES)),
+        help='comma separated engines to check (default: all)')
+    parser.add_argument('--keep-failures', default=None,
+        help='copy the cases an engine failed on into this directory')
+    parser.add_argument('--output', default='-',
+        help='file to write the json report to (default: stdout)')
+    args = parser.parse_args(argv)
+
+    engines = args.engines.split(',')
+    for name in engines:
+        if name not in ENGINES:
+            parser.error('no engine {!r}, choose from {}'.format(name,
+                ', '.join(sorted(ENGINES))))
+
+    # the creation date is fixed so every conversion of a case is the same
+    options = ConversionOptions(creation_date=datetime.date.today().strftime(
+        '%y%m%d'))
+    rng = random.Random(args.seed)
+    cases = fixed_cases() + [random_case(rng) for n in range(args.cases)]
+
+    # the engines start their own process pools, as app.py runs them; a pool
+    # kept open here would have its threads forked into theirs
+    workdir = tempfile.mkdtemp(prefix='aba-equivalence-')
+    try:
+        results = check_cases(cases, engines, workdir, options,
+            args.keep_failures)
+        report = {
+            'python': sys.version.split()[0],
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'seed': args.seed,
+            'cases': len(cases),
+            'engines': results,
+        }
+        if args.size:
+            reference_rate, timings = throughput(engines, args.size, workdir,
+                options)
+            report['size'] = args.size
+            report['reference_records_per_sec'] = reference_rate
+            for name in engines:
+                results[name].update(timings[name])
+    finally:
+        shutil.rmtree(workdir)
+
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    lines = []
+    for name in engines:
+        result = results[name]
+        lines.append(('{:<14} {:>5} passed {:>5} differ as expected' +
+            ' {:>5} failed{}').format(name, result['passed'],
+            sum(result['differences'].values()), result['failed'],
+            '' if not args.size else
+            '  {:>9} rec/s  x{:.2f}{}'.format(result['records_per_sec'],
+            result['speedup'], '' if result['matches_reference']
+            else '  OUTPUT DIFFERS')))
+    sys.stderr.write('\n'.join(lines) + '\n')
+
+    failed = any(result['failed'] or not result.get('matches_reference',
+        True) for result in results.values())
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,248 @@
+# run.py
+#
+# Throughput benchmark. For each size a synthetic ABA file is generated and
+# every stage of a conversion is timed on its own: parse, field extraction,
+# record encoding (field objects and compiled encoders), field validation
+# and writing, plus a whole streaming conversion, packing the file and a
+# conversion of the packed batch. Each size runs in its own process so its
+# peak RSS is its own.
+#
+# python benchmarks/run.py [--sizes 1000,100000,1000000] [--output run.json]
+#     [--baseline old.json]
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from banktransactionfile.aba import record as aba_record
+from banktransactionfile.aba.file import AbaFile
+from banktransactionfile.afi import encoder as afi_encoder
+from banktransactionfile.afi import record as afi_record
+from banktransactionfile.converter import (ConversionOptions,
+    convert_to_valid_chars)
+from banktransactionfile.packed import PackedBatch, convert_packed, pack_file
+from banktransactionfile.split import convert_split
+
+import synthetic
+
+SIZES = (1000, 100000, 1000000)
+
+# Field objects validated at once, bounds memory in the validate stage
+VALIDATE_CHUNK = 10000
+
+
+def peak_rss_kb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+def extract(record, sender_account_name):
+    # the get_* calls and cleaning the converter does for a transaction
+    return (
+        aba_record.get_receiver_account(record),
+        '50',
+        aba_record.get_amount_to_send(record),
+        convert_to_valid_chars(aba_record.get_reciever_name(record)),
+        convert_to_valid_chars(aba_record.get_receiver_reference(record)),
+        sender_account_name,
+        convert_to_valid_chars(
+            aba_record.get_sender_business_reference(record)),
+    )
+
+
+def run_stages(filename):
+    """
+    Time every stage over filename. Returns {stage: seconds} and the peak
+    RSS after each stage.
+    """
+    seconds = {}
+    rss = {}
+
+    def timed(stage, start):
+        seconds[stage] = time.time() - start
+        rss[stage] = peak_rss_kb()
+
+    # a whole streaming conversion first, before anything is held in memory.
+    # convert_split keeps each file inside the bank's transaction limit.
+    output_dir = tempfile.mkdtemp(prefix='aba-bench-')
+    start = time.time()
+    parts = convert_split(filename, os.path.join(output_dir, 'bench'),
+        processes=1)
+    timed('convert', start)
+    for afi_filename, totals in parts:
+        os.remove(afi_filename)
+
+    # the same conversion from a packed batch, and the values read out of
+    # it as the extract stage takes them from the records
+    packed_filename = os.path.join(output_dir, 'bench.abp')
+    start = time.time()
+    pack_file(filename, packed_filename)
+    timed('pack', start)
+    start = time.time()
+    parts = convert_packed(packed_filename,
+        os.path.join(output_dir, 'bench'))
+    timed('convert_packed', start)
+    for afi_filename, totals in parts:
+        os.remove(afi_filename)
+    start = time.time()
+    with PackedBatch(packed_filename) as batch:
+        packed_values = list(batch.iter_transaction_values(
+            ConversionOptions(transaction_code='50')))
+    timed('extract_packed', start)
+    os.remove(packed_filename)
+    os.rmdir(output_dir)
+
+    start = time.time()
+    aba_file = AbaFile()
+    aba_file.parse(filename)
+    records = aba_file.records
+    timed('parse', start)
+
+    sender_account_name = convert_to_valid_chars(
+        aba_record.get_sender_account_name(records[0]))
+    start = time.time()
+    values = [extract(record, sender_account_name)
+        for record in records if record[0] == '1']
+    timed('extract', start)
+    assert packed_values == values
+    del packed_values
+
+    start = time.time()
+    lines = [afi_record.TransactionRecord(*args).parse_to_string()
+        for args in values]
+    timed('encode', start)
+
+    start = time.time()
+    compiled_lines = [afi_encoder.encode_transaction(*args)
+        for args in values]
+    timed('encode_compiled', start)
+    assert compiled_lines == lines
+    del compiled_lines
+
+    elapsed = 0
+    for n in range(0, len(values), VALIDATE_CHUNK):
+        fields = [field for args in values[n:n + VALIDATE_CHUNK]
+            for field in afi_record.TransactionRecord(*args).fields]
+        for field in fields:
+            field.value = str(field.value)
+        start = time.time()
+        for field in fields:
+            field.validate()
+        elapsed += time.time() - start
+    seconds['validate'] = elapsed
+    rss['validate'] = peak_rss_kb()
+
+    start = time.time()
+    with open(os.devnull, 'w') as afi:
+        for line in lines:
+            afi.write(line + '\n')
+    timed('write', start)
+
+    return seconds, rss
+
+
+def run_size(size, workdir):
+    filename = os.path.join(workdir, 'synthetic_{}.aba'.format(size))
+    if not os.path.exists(filename):
+        synthetic.generate(filename, size)
+
+    # run in a fresh interpreter so peak RSS belongs to this size only
+    output = subprocess.check_output([sys.executable, __file__,
+        '--stages', filename])
+    seconds, rss = json.loads(output.decode('ascii'))
+
+    stages = {}
+    for stage in seconds:
+        stages[stage] = {
+            'seconds': round(seconds[stage], 6),
+            'records_per_sec': (round(size / seconds[stage])
+                if seconds[stage] else None),
+            'peak_rss_kb': rss[stage],
+        }
+    return {
+        'transactions': size,
+        'file_bytes': os.path.getsize(filename),
+        'peak_rss_kb': max(rss.values()),
+        'stages': stages,
+    }
+
+
+def compare(report, baseline):
+    """
+    Return lines comparing records/sec of report with a baseline report, as
+    this run's rate over the baseline's.
+    """
+    lines = []
+    for size in sorted(report['sizes'], key=int):
+        result = report['sizes'][size]
+        old = baseline['sizes'].get(size)
+        if old is None:
+            continue
+        for stage, timing in sorted(result['stages'].items()):
+            old_timing = old['stages'].get(stage)
+            if not old_timing or not old_timing['records_per_sec']:
+                continue
+            lines.append('{:>8} {:<16} {:>12} rec/s  x{:.2f}'.format(size,
+                stage, timing['records_per_sec'],
+                float(timing['records_per_sec']) /
+                old_timing['records_per_sec']))
+    return lines
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the converter')
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)),
+        help='comma separated numbers of transactions')
+    parser.add_argument('--workdir', default=None,
+        help='where synthetic files are kept (default: a new temp directory)')
+    parser.add_argument('--output', default='-',
+        help='file to write the json report to (default: stdout)')
+    parser.add_argument('--baseline', default=None,
+        help='earlier json report to compare records/sec against')
+    parser.add_argument('--stages', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.stages:
+        json.dump(run_stages(args.stages), sys.stdout)
+        return 0
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='aba-bench-')
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'sizes': {},
+    }
+    for size in [int(size) for size in args.sizes.split(',')]:
+        report['sizes'][str(size)] = run_size(size, workdir)
+
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        sys.stderr.write('\n'.join(compare(report, baseline)) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
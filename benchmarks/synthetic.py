@@ -0,0 +1,90 @@
+# synthetic.py
+#
+# Writes valid synthetic ABA files for benchmarking: a header record, any
+# number of detail records with a realistic spread of payee names and
+# references, and a control record.
+#
+# python benchmarks/synthetic.py <filename> <transactions> [--seed n] [--crlf]
+
+import argparse
+import datetime
+import random
+
+FIRST_NAMES = ('JOHN', 'MARY', 'AROHA', 'WEI', 'PRIYA', 'TAMATI', 'SARAH',
+    'LIAM', 'OLIVIA', 'NOAH', 'HANA', 'MOANA', 'JAMES', 'ISLA', 'RAWIRI',
+    'CHLOE', 'ARJUN', 'MEI', 'LUCAS', 'ZOE')
+LAST_NAMES = ('SMITH', "O'BRIEN", 'NGATA', 'CHEN', 'PATEL', 'WILLIAMS',
+    'TE WHARE', 'BROWN', 'KUMAR', 'WILSON', 'TAYLOR', 'NGUYEN', 'PARATA',
+    'MACDONALD', 'SINGH', 'VAN DER BERG', 'LEE', 'JONES', 'HENARE', 'KING')
+COMPANIES = ('ACME PAYROLL LTD', 'KIWI FREIGHT & CO', 'HARBOUR DENTAL',
+    'TUI HOLDINGS (NZ)', 'SOUTHERN ORCHARDS')
+REFERENCES = ('SALARY', 'WAGES', 'BONUS', 'EXPENSES', 'INV', 'REIMB #',
+    'HOLIDAY PAY', 'SUPER/KS', 'ALLOWANCE')
+BANKS = ('010', '020', '030', '060', '120', '380')
+
+
+def header_record(user_name, process_date):
+    record = ('0' + ' ' * 17 + '01' + 'BNZ' + ' ' * 7 +
+        user_name[:26].ljust(26) + '123456' + 'PAYROLL'.ljust(12) +
+        process_date.strftime('%d%m%y') + ' ' * 40)
+    return record
+
+
+def account_number(rng):
+    # bsb style 'bbb-bbb' plus 9 characters gives a 15 digit account, a
+    # plain 16 digit account fills the whole field
+    if rng.random() < 0.8:
+        return (rng.choice(BANKS) + '-' + str(rng.randint(100, 999)) +
+            str(rng.randint(0, 10 ** 9 - 1)).rjust(9, '0'))
+    return str(rng.randint(10 ** 15, 10 ** 16 - 1))
+
+
+def detail_record(rng, amount, trace_account, remitter):
+    name = rng.choice(FIRST_NAMES) + ' ' + rng.choice(LAST_NAMES)
+    reference = rng.choice(REFERENCES) + ' ' + str(rng.randint(1, 99999))
+    record = ('1' + account_number(rng) + ' ' + '50' +
+        str(amount).rjust(10, '0') + name[:32].ljust(32) +
+        reference[:18].ljust(18) + trace_account + remitter[:16].ljust(16) +
+        '0' * 8)
+    return record
+
+
+def control_record(total, count):
+    total = str(total % 10 ** 10).rjust(10, '0')
+    record = ('7' + '999-999' + ' ' * 12 + total + total + '0' * 10 +
+        ' ' * 24 + str(count).rjust(6, '0') + ' ' * 40)
+    return record
+
+
+def generate(filename, transactions, seed=0, line_ending='\n'):
+    """
+    Write an ABA file with the given number of detail records to filename.
+    The process date is tomorrow so the file passes FileDate validation.
+    """
+    rng = random.Random(seed)
+    user_name = rng.choice(COMPANIES)
+    trace_account = '020-100' + str(rng.randint(0, 10 ** 9 - 1)).rjust(9, '0')
+    process_date = datetime.date.today() + datetime.timedelta(days=1)
+    total = 0
+
+    with open(filename, 'w', newline='') as f:
+        f.write(header_record(user_name, process_date) + line_ending)
+        for n in range(transactions):
+            amount = rng.randint(1, 5000000)
+            total += amount
+            f.write(detail_record(rng, amount, trace_account, user_name) +
+                line_ending)
+        f.write(control_record(total, transactions) + line_ending)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Write a synthetic ABA file for benchmarking')
+    parser.add_argument('filename')
+    parser.add_argument('transactions', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--crlf', action='store_true',
+        help='end lines with CRLF instead of LF')
+    args = parser.parse_args()
+    generate(args.filename, args.transactions, args.seed,
+        '\r\n' if args.crlf else '\n')
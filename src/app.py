@@ -1,178 +1,291 @@
 # app.py
 
+import argparse
+import json
+import signal
 import sys
-import datetime #for current date
-import os # for file path commands
-import re # regex used to validate names
-
-
-from banktransactionfile.afi import record as afi_record
-
-# Global
-ABA_FILE = ('ABA', 'aba')
-
-# Custom Error class used to prevent invalid ABA files from being converted
-class InvalidFormatError(Exception):
-    def __init__(self, value):
-        self.value = value
-
-    def __str__(self):
-        return str(self.value)
-
-class AbaFile:
-    RECORD_LENGTH = 120
-    records = []
-
-    def parse(self, filename):
-        f = open(filename, 'r')
-        lines = f.readlines()
-        valid_record_type = []
-
-        for line in lines:
-            record = line.rstrip('\r\n')
-            valid_record_type.append(line[0])
-            if len(record) == self.RECORD_LENGTH:
-                # build up 'validated' records
-                AbaFile.records.append(record)
-            else:
-                 raise InvalidFormatError('Input ABA file must contain ' + 
-                    str(self.RECORD_LENGTH) + ' characters per line to be '
-                    + 'converted correctly')
-
-        # Check ABA file has correct amount of records
-        if ('0' in valid_record_type and '1' in valid_record_type and 
-            '7' in valid_record_type):
-            pass
-        else:
-            raise InvalidFormatError('ABA file must contain header,' + 
-                'transaction and control record to be converted')
-
-        if valid_record_type.count('0') > 1 or valid_record_type.count('7') > 1:
-            raise InvalidFormatError('ABA file must contain only one' + 
-                ' header and control record')
-
-
-# Write data to afi file with same name as the input aba file
-def write_file(data, filename):
-
-    filename = r'./' + filename + '.afi' #Path to save file in
-    new_afi = open(filename, 'w')
-    new_afi.writelines(["%s\n" % item for item in data])
-
-
-def has_aba_file_extention(filename):
-    file_extension = filename.split('.')[-1]
-
-    return file_extension in ABA_FILE
-
-# strip path and extension away from filename
-def get_filename(filename):
-    base = os.path.basename(filename)
-    os.path.splitext(base)
-    return os.path.splitext(base)[0]
-
-# Check business name have valid names and replace disallowed
-# characters with spaces
-def convert_to_valid_chars(input_string):
-    output_string = re.sub('[^a-zA-Z0-9 /-?:()+\.]', '', input_string)
-    return output_string
 
+from banktransactionfile import compression
+from banktransactionfile.aba.file import get_filename, has_aba_file_extention
+from banktransactionfile.batch import (batch_report, convert_batch,
+    find_aba_files)
+from banktransactionfile.cache import DEFAULT_MAX_BYTES, ConversionCache
+from banktransactionfile.checkpoint import convert_resumable
+from banktransactionfile.consolidate import (consolidate_all,
+    consolidate_report)
+from banktransactionfile.duplicates import DuplicateCheck, PaymentIndex
+from banktransactionfile.metrics import Metrics
+from banktransactionfile.packed import (convert_packed, has_packed_extension,
+    pack_file)
+from banktransactionfile.preflight import check_file
+from banktransactionfile.reconvert import reconvert
+from banktransactionfile.service import serve
+from banktransactionfile.split import convert_split
+from banktransactionfile.watch import WatchFolder
+from banktransactionfile.worker import run_jobs, serve_socket
+
+
+# Convert an aba file and write the afi file with the same name as it.
+# Files with more transactions than the bank takes in one file are split
+# into <filename>_1.afi, <filename>_2.afi and so on.
+# Nothing is left behind if conversion fails part way through.
+# A gzip, bz2 or xz compressed aba file is read as it is and the afi files
+# are compressed the same way (<filename>.afi.gz and so on).
+# With duplicates (a duplicates.DuplicateCheck) every transaction is looked
+# up in a payment index.
+def write_file(aba_filename, filename, options=None, metrics=None,
+    cache=None, duplicates=None):
+
+    filename = r'./' + filename #Path to save file in, without extension
+    afi_compression = compression.detect(aba_filename)
+    if cache is not None:
+        return cache.convert_split(aba_filename, filename, options,
+            metrics=metrics, compression=afi_compression,
+            duplicates=duplicates)
+    return convert_split(aba_filename, filename, options, metrics=metrics,
+        compression=afi_compression, duplicates=duplicates)
+
+
+# Warn about each possible duplicate payment on stderr
+def report_duplicates(aba_filename, found):
+    for duplicate in found:
+        previous = duplicate['duplicate_of']
+        sys.stderr.write(('{} line {}: possible duplicate of {} line {}' +
+            ' ({} to {}, reference {!r}, process date {})\n').format(
+            aba_filename, duplicate['line'], previous['file'],
+            previous['line'], duplicate['amount'], duplicate['account'],
+            duplicate['reference'], duplicate['process_date']))
+
+
+# --cache-dir and --cache-size, shared by every command
+def add_cache_arguments(parser):
+    parser.add_argument('--cache-dir', default=None,
+        help='keep converted files here and reuse them when the same aba' +
+        ' file is converted again')
+    parser.add_argument('--cache-size', type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help='megabytes the cache is kept under (default: %(default)s)')
+
+
+def get_cache(args):
+    if args.cache_dir is None:
+        return None
+    return ConversionCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+
+def add_payment_index_argument(parser):
+    parser.add_argument('--payment-index', default=None,
+        help='flag payments already recorded in this SQLite file, and' +
+        ' record the payments of files that convert there')
 
 
 #######################################################
 #                                                     #
-#                 Header Functions                    #
+#                      Commands                       #
 #                                                     #
 #######################################################
 
-# Get todays date
-def get_current_date():
-    current_date = datetime.datetime.today().strftime('%y%m%d')
-    return current_date
-
-# Get process day from header file
-def get_process_date(record):
-    process_date = record[74:80]
-    return (process_date[-2:] + process_date[2: -2] + process_date[:2])
-
-# Get file type, 7 = Direct credit
-def get_file_type():
-    return 7
-
-# Get listing indicator, currently not used
-def get_listing_indicator(record):
-    return ''; # haven't found corresponding ABA field
-
-
-#######################################################
-#                                                     #
-#               Transaction Functions                 #
-#                                                     #
-#######################################################
-# Get correct afi transaction code
-# 50 = standard credit
-def get_transaction_code():
-    return 50
-
-# Get recievers account number
-def get_receiver_account(record):
-    # Remove hyphen from bsb and remove white space
-    receiver_account = record[1:17].replace('-', '').strip()
-    return receiver_account
-
-# Get amount to transfer
-def get_amount_to_send(record):
-    send = record[21:30]
-    return send
-
-# Get payment recievers name
-def get_reciever_name(record):
-    name = record[30:50]
-    return name.strip()
-
-# Get payment recievers reference 
-def get_receiver_reference(record):
-    reference = record[62:80].strip()
-    # return truncated version so it will pass length verification
-    # will be truncated by bank system if > 12 characters 
-    return reference[:12]
-
-# Get senders account name
-def get_sender_account_name(record):
-    return record[30:56].strip()
-
-# Get senders account number and format to afi specification
-def get_sender_account_number(record):
-    return record[80:96].replace('-', '').strip()
-
-
-# Text to appear in payment reference, max chars 16 as per afi specifications
-def get_sender_business_reference(record):
-    concatenated_reference = record[96:112].strip()
-    return concatenated_reference[:12]
-
-
-#######################################################
-#                                                     #
-#                  Control Functions                  #
-#                                                     #
-#######################################################
-
-# Adds all transaction hashes together and truncates as specified
-# by afi requirements
-
-def calculate_hashing(payments_hash):
-    hash_list = []
-    hash_total = 0
-
-    for account in payment_hash:
-        hash_list.append(int(account[1:13]))
-
-    for account_hash in hash_list:
-        hash_total += account_hash
-
-    hash_total = str(hash_total) #cast to string to use len methods    
-    return str(hash_total[-11:])
+# app.py batch <directory or glob> --output-dir <dir> --workers <n>
+def batch_command(args):
+    parser = argparse.ArgumentParser(prog='app.py batch',
+        description='Convert the aba files in a directory or matching a glob')
+    parser.add_argument('path', help='directory or glob of aba files')
+    parser.add_argument('--output-dir', default='.',
+        help='where afi files are written (default: current directory)')
+    parser.add_argument('--workers', type=int, default=None,
+        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--report', default='-',
+        help='file to write the json report to (default: stdout)')
+    add_cache_arguments(parser)
+    add_payment_index_argument(parser)
+    args = parser.parse_args(args)
+
+    results = convert_batch(find_aba_files(args.path), args.output_dir,
+        args.workers, cache=get_cache(args),
+        payment_index=args.payment_index)
+    report = batch_report(results)
+
+    if args.report == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    return 1 if report['failed'] else 0
+
+
+# app.py check <file, directory or glob> ...
+def check_command(args):
+    parser = argparse.ArgumentParser(prog='app.py check',
+        description='Check aba files would convert, without converting them,' +
+        ' and list every problem with its line number')
+    parser.add_argument('paths', nargs='+',
+        help='aba files, directories or globs of aba files')
+    parser.add_argument('--report', default='-',
+        help='file to write the json report to (default: stdout)')
+    args = parser.parse_args(args)
+
+    filenames = []
+    for path in args.paths:
+        # a path that matches nothing is checked, and reported missing
+        filenames.extend(find_aba_files(path) or [path])
+
+    files = []
+    for filename in filenames:
+        try:
+            errors = check_file(filename)
+        except (IOError, OSError, ValueError) as e:
+            errors = [(None, str(e))]
+        files.append({
+            'file': filename,
+            'valid': not errors,
+            'errors': [{'line': line_number, 'message': message}
+                for line_number, message in errors],
+        })
+    report = {
+        'files': files,
+        'invalid': len([f for f in files if not f['valid']]),
+    }
+
+    if args.report == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    return 1 if report['invalid'] else 0
+
+
+# app.py worker [--socket <path>] [--output-dir <dir>]
+def worker_command(args):
+    parser = argparse.ArgumentParser(prog='app.py worker',
+        description='Convert aba files named one per line on stdin, or sent' +
+        ' to a Unix socket, writing a json result line for each')
+    parser.add_argument('--socket', default=None,
+        help='listen on this Unix socket instead of reading stdin')
+    parser.add_argument('--output-dir', default='.',
+        help='where afi files are written unless a job says otherwise' +
+        ' (default: current directory)')
+    add_cache_arguments(parser)
+    args = parser.parse_args(args)
+
+    # docker stop sends SIGTERM, exit cleanly so the socket is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        if args.socket:
+            serve_socket(args.socket, args.output_dir, get_cache(args))
+        else:
+            run_jobs(sys.stdin, sys.stdout, args.output_dir, get_cache(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+# app.py consolidate <files, directories or globs> ... --output-dir <dir>
+def consolidate_command(args):
+    parser = argparse.ArgumentParser(prog='app.py consolidate',
+        description='Merge aba files with the same sender account and process' +
+        ' date into one afi upload each')
+    parser.add_argument('paths', nargs='+',
+        help='aba files, directories or globs of aba files')
+    parser.add_argument('--output-dir', default='.',
+        help='where afi files are written (default: current directory)')
+    parser.add_argument('--report', default='-',
+        help='file to write the json report to (default: stdout)')
+    args = parser.parse_args(args)
+
+    filenames = []
+    for path in args.paths:
+        filenames.extend(find_aba_files(path) or [path])
+    report = consolidate_report(consolidate_all(filenames, args.output_dir))
+
+    if args.report == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    return 1 if report['failed'] else 0
+
+
+# app.py serve [--host <host>] [--port <port>] [--socket <path>]
+#     [--workers <n>]
+def serve_command(args):
+    parser = argparse.ArgumentParser(prog='app.py serve',
+        description='Convert aba files POSTed to /convert over HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--socket', default=None,
+        help='listen on this Unix socket instead of host and port')
+    parser.add_argument('--workers', type=int, default=4,
+        help='threads converting uploads (default: %(default)s)')
+    args = parser.parse_args(args)
+
+    # docker stop sends SIGTERM, exit cleanly so the socket is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(args.host, args.port, args.socket, args.workers)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+# app.py watch <input dir> [--output-dir <dir>] [--processed-dir <dir>]
+#     [--failed-dir <dir>] [--workers <n>] [--poll-interval <s>] [--once]
+def watch_command(args):
+    parser = argparse.ArgumentParser(prog='app.py watch',
+        description='Convert aba files as they land in a directory')
+    parser.add_argument('input_dir')
+    parser.add_argument('--output-dir', default=None,
+        help='where afi files go (default: the processed directory)')
+    parser.add_argument('--processed-dir', default=None,
+        help='where converted aba files go (default: input_dir/processed)')
+    parser.add_argument('--failed-dir', default=None,
+        help='where aba files that failed go, with a json error report' +
+        ' (default: input_dir/failed)')
+    parser.add_argument('--work-dir', default=None,
+        help='where files being converted are kept, on the same filesystem' +
+        ' as input_dir (default: input_dir/.work)')
+    parser.add_argument('--workers', type=int, default=None,
+        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--poll-interval', type=float, default=5.0,
+        help='seconds between scans of input_dir (default: %(default)s)')
+    parser.add_argument('--settle', type=float, default=2.0,
+        help='seconds a scanned file must be unchanged for before it is' +
+        ' converted (default: %(default)s)')
+    parser.add_argument('--polling', action='store_true',
+        help='only scan, even where inotify is available')
+    parser.add_argument('--once', action='store_true',
+        help='convert the files there now and exit')
+    add_cache_arguments(parser)
+    args = parser.parse_args(args)
+
+    watch_folder = WatchFolder(args.input_dir, args.output_dir,
+        args.processed_dir, args.failed_dir, args.work_dir, args.workers,
+        cache=get_cache(args), poll_interval=args.poll_interval,
+        settle=args.settle, use_inotify=not args.polling, out=sys.stdout)
+
+    # docker stop sends SIGTERM; files being converted are picked up again
+    # when the daemon next starts
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        watch_folder.run(once=args.once)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+COMMANDS = {
+    'batch': batch_command,
+    'check': check_command,
+    'consolidate': consolidate_command,
+    'serve': serve_command,
+    'watch': watch_command,
+    'worker': worker_command,
+}
 
 
 #######################################################
@@ -181,89 +294,80 @@ def calculate_hashing(payments_hash):
 #                                                     #
 #######################################################
 
-# Where we store filename after it has been stipped of path and extension
-stripped_filename = ""
-
-if len(sys.argv) > 1:
-    filename = sys.argv[1]
-    stripped_filename = get_filename(filename)
-    if has_aba_file_extention(filename):
-        # Initalise AbaFile class and save to variable
-        aba_file = AbaFile()
-        # Read in file
-        aba_file.parse(filename)
-
-#print '\n'.join(aba_file.records)
-
-# These fields will be built up as we loop through records stored in aba file.
-# This section does the bulk of the work using functions to grab data from 
-# aba records and sending it to classes to form the data structures we want.
-
-# Total number of cents to send
-transaction_total = 0 
-# Total number of transactions.
-transaction_count = 0
-# Save hash in array to manipulate for control record.
-payment_hash = []
-# All records in afi format
-afi_file = []
-
-# Get senders account name from the header file
-sender_account_name = get_sender_account_name(aba_file.records[0])
-sender_account_name = convert_to_valid_chars(sender_account_name)
-# Get senders account number from first transaction file
-account_number = get_sender_account_number(aba_file.records[1])
-
-
-# Go though each record (aba format) and get it ready for afi format
-# afi_file will contain the records in afi format.
-
-for record in aba_file.records:
-
-         # Header Record
-        if record[0] == '0':
-            file_type = get_file_type()
-            process_date = get_process_date(record)
-            current_date = get_current_date()
-            #listing_indicator = getListingIndicator(record)
-            header_record = afi_record.HeaderRecord(account_number, 
-               file_type, process_date, current_date)
-            #parse header object to string and run validation checks
-            afi_file.append(header_record.parse_to_string())
-
-        # Transaction Record
-        elif record[0] == '1':
-                transaction_count += 1
-                receiver_account = get_receiver_account(record)
-                transaction_code = get_transaction_code()
-
-                #save in hash array
-                payment_hash.append(receiver_account)
-                #transaction_code = get_transaction_code(record)
-                amount_to_send = get_amount_to_send(record)
-                transaction_total += int(amount_to_send)
-
-                receiver_name = get_reciever_name(record)
-                receiver_name = convert_to_valid_chars(receiver_name)
-                receiver_reference = get_receiver_reference(record)
-                receiver_reference = convert_to_valid_chars(receiver_reference)
-
-                sender_business_reference = get_sender_business_reference(record)
-                sender_business_reference = convert_to_valid_chars(
-                    sender_business_reference)
-                transaction_record = afi_record.TransactionRecord(
-                    receiver_account, transaction_code, amount_to_send,
-                    receiver_name, receiver_reference, sender_account_name, 
-                    sender_business_reference)
-                afi_file.append(transaction_record.parse_to_string())
-          
-        # Control Record    
-        elif record[0] == '7':
-            hash_total = calculate_hashing(payment_hash)
-            control_record = afi_record.ControlRecord(transaction_total,
-             transaction_count, hash_total)
-            afi_file.append(control_record.parse_to_string())
-        else:
-            raise InvalidFormatError('First number of record must be 1, 2 or 7')
-
-write_file(afi_file, stripped_filename)
+def main(argv):
+    if len(argv) > 1 and argv[1] in COMMANDS:
+        return COMMANDS[argv[1]](argv[2:])
+
+    # app.py <filename> [--metrics <file>] [--trace-memory]
+    #     [--payment-index <file>] [--checkpoint-every <records>]
+    #     [--reuse-state <file>] [--save-packed <file>]
+    # A packed batch (<filename>.abp) is converted the same as its aba file
+    parser = argparse.ArgumentParser(prog='app.py',
+        description='Convert an aba file into an afi file')
+    parser.add_argument('filename', nargs='?')
+    parser.add_argument('--metrics', default=None,
+        help='write conversion metrics to this file, as Prometheus text' +
+        ' when it ends in .prom and as json otherwise')
+    parser.add_argument('--trace-memory', action='store_true',
+        help='include peak memory in the metrics (slower)')
+    parser.add_argument('--checkpoint-every', type=int, default=None,
+        metavar='RECORDS',
+        help='save a checkpoint every so many records, and carry on from' +
+        ' the last one if an earlier run was killed')
+    parser.add_argument('--reuse-state', default=None, metavar='FILE',
+        help='keep the afi line of every record in this file, and only' +
+        ' convert the records that changed when an amended version of the' +
+        ' aba file is converted')
+    parser.add_argument('--save-packed', default=None, metavar='FILE',
+        help='once the aba file has converted, save it parsed into this' +
+        ' file (.abp), to be converted or read again without parsing')
+    add_cache_arguments(parser)
+    add_payment_index_argument(parser)
+    args = parser.parse_args(argv[1:])
+    if args.checkpoint_every is not None and args.reuse_state:
+        parser.error('--checkpoint-every can\'t be used with --reuse-state')
+    if (args.checkpoint_every is not None or args.reuse_state) and (
+        args.cache_dir or args.payment_index or args.metrics):
+        parser.error('--checkpoint-every and --reuse-state can\'t be used' +
+            ' with --cache-dir, --payment-index or --metrics')
+
+    if args.filename:
+        filename = args.filename
+        # Where we store filename after it has been stipped of path and
+        # extension
+        stripped_filename = get_filename(filename)
+        if has_packed_extension(filename):
+            convert_packed(filename, r'./' + stripped_filename)
+        elif has_aba_file_extention(filename) and args.checkpoint_every:
+            convert_resumable(filename, r'./' + stripped_filename,
+                checkpoint_every=args.checkpoint_every,
+                compression=compression.detect(filename))
+        elif has_aba_file_extention(filename) and args.reuse_state:
+            reconvert(filename, r'./' + stripped_filename, args.reuse_state,
+                compression=compression.detect(filename))
+        elif has_aba_file_extention(filename):
+            metrics = None
+            if args.metrics:
+                metrics = Metrics(trace_memory=args.trace_memory)
+            index = None
+            duplicates = None
+            if args.payment_index:
+                index = PaymentIndex(args.payment_index)
+                duplicates = DuplicateCheck(index, filename)
+            try:
+                write_file(filename, stripped_filename, metrics=metrics,
+                    cache=get_cache(args), duplicates=duplicates)
+            finally:
+                if metrics is not None:
+                    metrics.write(args.metrics)
+                if index is not None:
+                    index.close()
+            if duplicates is not None:
+                report_duplicates(filename, duplicates.found)
+        if has_aba_file_extention(filename) and args.save_packed:
+            pack_file(filename, args.save_packed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
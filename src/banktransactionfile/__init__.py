@@ -0,0 +1,6 @@
+# banktransactionfile
+
+from banktransactionfile.converter import convert, ConversionOptions, Converter
+from banktransactionfile.parallel import convert_parallel
+from banktransactionfile.aba.file import InvalidFormatError
+from banktransactionfile.afi.field import ValidationError
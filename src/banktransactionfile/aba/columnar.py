@@ -0,0 +1,277 @@
+# columnar.py
+# banktransactionfile.aba.columnar
+#
+# Batch mode that loads the detail records of an ABA file into a NumPy
+# structured array and validates and totals them a column at a time, with no
+# python code run per record. Needs numpy.
+
+import os
+
+try:
+    import numpy as np
+except ImportError: # numpy is only needed for the batch mode
+    np = None
+
+from banktransactionfile.aba.file import AbaFile, InvalidFormatError
+
+# (name, start, stop) of detail record fields. These are the same slices the
+# aba.record get_* helpers take.
+DETAIL_COLUMNS = (
+    ('record_type', 0, 1),
+    ('account', 1, 17), # get_receiver_account
+    ('amount', 21, 30), # get_amount_to_send
+    ('name', 30, 50), # get_reciever_name
+    ('reference', 62, 80), # get_receiver_reference
+    ('sender_account', 80, 96), # get_sender_account_number
+    ('business_reference', 96, 112), # get_sender_business_reference
+)
+
+# Characters str.strip removes from ascii text
+WHITESPACE = b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f'
+
+# Rows worked on at once, bounds the size of temporary arrays
+CHUNK_SIZE = 65536
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('the columnar batch mode needs numpy installed')
+
+
+def detail_dtype():
+    _require_numpy()
+    return np.dtype({
+        'names': [name for name, start, stop in DETAIL_COLUMNS],
+        'formats': ['S{}'.format(stop - start)
+            for name, start, stop in DETAIL_COLUMNS],
+        'offsets': [start for name, start, stop in DETAIL_COLUMNS],
+        'itemsize': AbaFile.RECORD_LENGTH,
+    })
+
+
+def _map(src):
+    if hasattr(src, 'fileno'):
+        src.seek(0, 2)
+        size = src.tell()
+        src.seek(0)
+    else:
+        size = os.path.getsize(src)
+
+    if not size:
+        # an empty file can't be mapped
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(src, dtype=np.uint8, mode='r')
+
+
+def _index(data):
+    """
+    Return the start offset and record type of every record in data, raising
+    the same InvalidFormatErrors as AbaFile.iter_records, in the same order.
+    """
+    newlines = np.flatnonzero(data == ord('\n'))
+    ends = newlines
+    if len(data) and data[-1] != ord('\n'):
+        ends = np.append(ends, len(data))
+    starts = np.concatenate(([0], newlines + 1))[:len(ends)]
+
+    # drop the CR of CRLF line endings
+    has_cr = np.zeros(len(ends), dtype=bool)
+    not_empty = ends > starts
+    has_cr[not_empty] = data[ends[not_empty] - 1] == ord('\r')
+    lengths = ends - starts - has_cr
+
+    record_types = np.zeros(len(starts), dtype=np.uint8)
+    record_types[not_empty] = data[starts[not_empty]]
+
+    bad_length = np.flatnonzero(lengths != AbaFile.RECORD_LENGTH)
+    first_bad_length = bad_length[0] if len(bad_length) else len(starts)
+
+    repeated = []
+    for record_type in (b'0', b'7'):
+        found = np.flatnonzero(record_types == ord(record_type))
+        if len(found) > 1:
+            repeated.append(found[1])
+    first_repeated = min(repeated) if repeated else len(starts)
+
+    if first_bad_length < len(starts) and first_bad_length <= first_repeated:
+        raise InvalidFormatError('Input ABA file must contain ' +
+            str(AbaFile.RECORD_LENGTH) + ' characters per line to be '
+            + 'converted correctly')
+    if first_repeated < len(starts):
+        raise InvalidFormatError('ABA file must contain only one' +
+            ' header and control record')
+
+    # Check ABA file has correct amount of records
+    for record_type in (b'0', b'1', b'7'):
+        if not (record_types == ord(record_type)).any():
+            raise InvalidFormatError('ABA file must contain header,' +
+                'transaction and control record to be converted')
+
+    return starts, record_types
+
+
+def _digit_values(columns):
+    """
+    Return whether each row of a (rows, width) block of characters is all
+    digits, and its value as a number.
+    """
+    digits = columns.astype(np.int64) - ord('0')
+    valid = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    powers = 10 ** np.arange(columns.shape[1] - 1, -1, -1, dtype=np.int64)
+    values = np.where(valid, (np.clip(digits, 0, 9) * powers).sum(axis=1), 0)
+    return valid, values
+
+
+class BatchSummary(object):
+    """
+    Control totals of a batch and the problems found in it.
+
+    errors is a list of (line number, message) in line number order.
+    """
+
+    def __init__(self, transaction_count, transaction_total, hash_sum,
+        errors):
+        self.transaction_count = transaction_count
+        self.transaction_total = transaction_total
+        self.hash_sum = hash_sum
+        self.errors = errors
+
+    def hash_total(self):
+        return str(self.hash_sum)[-11:]
+
+
+class DetailBatch(object):
+    """
+    The detail records of an ABA file as a NumPy structured array.
+
+    records has one row per detail record with the DETAIL_COLUMNS fields;
+    line_numbers holds the line each one came from (counting from 1).
+    """
+
+    def __init__(self, records, line_numbers):
+        self.records = records
+        self.line_numbers = line_numbers
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def rows(self):
+        # the records as a (records, RECORD_LENGTH) block of characters
+        return self.records.view(np.uint8).reshape(len(self.records),
+            AbaFile.RECORD_LENGTH)
+
+    def amounts(self, rows):
+        # get_amount_to_send
+        return _digit_values(rows[:, 21:30])
+
+    def accounts(self, rows):
+        """
+        Return the length of each receiver account after get_receiver_account
+        removes hyphens and white space, whether the account[1:13] slice that
+        is hashed is all digits, and its value.
+        """
+        account = rows[:, 1:17]
+        width = account.shape[1]
+        keep = account != ord('-')
+
+        # move the kept characters to the left, in order, like replace('-')
+        order = np.argsort(~keep, axis=1, kind='stable')
+        account = np.take_along_axis(account, order, axis=1)
+        kept = np.arange(width) < keep.sum(axis=1)[:, None]
+
+        # strip white space from both ends
+        text = kept & ~np.isin(account, np.frombuffer(WHITESPACE, np.uint8))
+        has_text = text.any(axis=1)
+        first = np.argmax(text, axis=1)
+        last = width - 1 - np.argmax(text[:, ::-1], axis=1)
+        lengths = np.where(has_text, last - first + 1, 0)
+
+        # account[1:13] of the stripped account
+        positions = first[:, None] + 1 + np.arange(12)
+        in_slice = has_text[:, None] & (positions <= last[:, None])
+        chars = np.take_along_axis(account,
+            np.clip(positions, 0, width - 1), axis=1)
+        digits = chars.astype(np.int64) - ord('0')
+        is_digit = (digits >= 0) & (digits <= 9)
+        valid = (is_digit | ~in_slice).all(axis=1) & in_slice.any(axis=1)
+
+        exponents = in_slice.sum(axis=1)[:, None] - 1 - np.arange(12)
+        exponents = np.where(in_slice, exponents, 0)
+        terms = np.where(in_slice & is_digit, digits * 10 ** exponents, 0)
+        return lengths, valid, terms.sum(axis=1)
+
+    def summarise(self):
+        """
+        Total the amounts and account hashes and check amount digits and
+        account lengths, CHUNK_SIZE rows at a time.
+        """
+        rows = self.rows
+        transaction_total = 0
+        # hashes are up to 12 digits, so they are summed in two halves to
+        # stay inside int64 however many records there are
+        hash_high = 0
+        hash_low = 0
+        errors = []
+
+        for start in range(0, len(rows), CHUNK_SIZE):
+            chunk = rows[start:start + CHUNK_SIZE]
+            line_numbers = self.line_numbers[start:start + CHUNK_SIZE]
+
+            amount_valid, amounts = self.amounts(chunk)
+            transaction_total += int(amounts.sum())
+
+            lengths, hash_valid, hashes = self.accounts(chunk)
+            hash_high += int((hashes // 10 ** 6).sum())
+            hash_low += int((hashes % 10 ** 6).sum())
+
+            bad_length = (lengths != 15) & (lengths != 16)
+            for line in line_numbers[bad_length]:
+                errors.append((int(line), 'length mismatch in Account'))
+            for line in line_numbers[~hash_valid & ~bad_length]:
+                errors.append((int(line),
+                    'account number must only contain digits'))
+            for line in line_numbers[~amount_valid]:
+                errors.append((int(line), 'amount must only contain digits'))
+
+        errors.sort(key=lambda error: error[0])
+        return BatchSummary(len(rows), transaction_total,
+            hash_high * 10 ** 6 + hash_low, errors)
+
+
+def load(src):
+    """
+    Load the detail records of the ABA file src (a filename or open binary
+    file) into a DetailBatch. The record structure is checked first and the
+    same InvalidFormatErrors as AbaFile are raised.
+    """
+    _require_numpy()
+    data = _map(src)
+    starts, record_types = _index(data)
+    is_detail = record_types == ord('1')
+    detail_starts = starts[is_detail]
+
+    records = np.empty(len(detail_starts), dtype=detail_dtype())
+    batch = DetailBatch(records, np.flatnonzero(is_detail) + 1)
+    rows = batch.rows
+    steps = np.diff(detail_starts)
+
+    if len(steps) and (steps == steps[0]).all():
+        # evenly spaced records are copied straight out of the map
+        rows[:] = np.lib.stride_tricks.as_strided(data[detail_starts[0]:],
+            shape=rows.shape, strides=(int(steps[0]), 1))
+    else:
+        columns = np.arange(AbaFile.RECORD_LENGTH)
+        for start in range(0, len(rows), CHUNK_SIZE):
+            chunk = detail_starts[start:start + CHUNK_SIZE]
+            rows[start:start + CHUNK_SIZE] = data[chunk[:, None] + columns]
+
+    return batch
+
+
+def summarise(src):
+    """
+    Validate and total the detail records of the ABA file src, returning a
+    BatchSummary.
+    """
+    return load(src).summarise()
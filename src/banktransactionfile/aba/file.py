@@ -0,0 +1,78 @@
+# file.py
+# banktransactionfile.aba.file
+
+import os # for file path commands
+
+from banktransactionfile import compression
+
+ABA_FILE = ('ABA', 'aba')
+
+
+# Custom Error class used to prevent invalid ABA files from being converted
+class InvalidFormatError(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return str(self.value)
+
+class AbaFile(object):
+    RECORD_LENGTH = 120
+
+    def __init__(self):
+        # records of the last file parsed, each instance has its own
+        self.records = []
+
+    # filename can be gzip, bz2 or xz compressed. The records of the file
+    # replace those of any file parsed before, so an instance can be reused.
+    def parse(self, filename):
+        with compression.open_file(filename, 'r') as f:
+            # build up 'validated' records
+            records = list(self.iter_records(f))
+        self.records = records
+
+    # Read records one at a time from an open file (or any iterable of lines)
+    # so the whole file never has to be held in memory. Structure checks are
+    # done as each record passes; the check for missing record types can only
+    # happen once the end of file is reached.
+    # A conversion resuming part way through a file passes the counts of
+    # the records it read before as record_type_count, which is kept up to
+    # date as records pass.
+    def iter_records(self, lines, record_type_count=None):
+        if record_type_count is None:
+            record_type_count = {}
+
+        for line in lines:
+            record = line.rstrip('\r\n')
+            if len(record) != self.RECORD_LENGTH:
+                raise InvalidFormatError('Input ABA file must contain ' +
+                    str(self.RECORD_LENGTH) + ' characters per line to be '
+                    + 'converted correctly')
+
+            record_type = record[0]
+            record_type_count[record_type] = (
+                record_type_count.get(record_type, 0) + 1)
+            if record_type_count[record_type] > 1 and record_type in '07':
+                raise InvalidFormatError('ABA file must contain only one' +
+                    ' header and control record')
+
+            yield record
+
+        # Check ABA file has correct amount of records
+        if not ('0' in record_type_count and '1' in record_type_count and
+            '7' in record_type_count):
+            raise InvalidFormatError('ABA file must contain header,' +
+                'transaction and control record to be converted')
+
+
+# filename can end in a compression extension too, as in payroll.aba.gz
+def has_aba_file_extention(filename):
+    filename = compression.strip_extension(filename)
+    file_extension = filename.split('.')[-1]
+
+    return file_extension in ABA_FILE
+
+# strip path and extension away from filename
+def get_filename(filename):
+    base = os.path.basename(compression.strip_extension(filename))
+    return os.path.splitext(base)[0]
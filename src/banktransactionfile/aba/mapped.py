@@ -0,0 +1,198 @@
+# mapped.py
+# banktransactionfile.aba.mapped
+#
+# Memory-mapped ABA reader. The file is mapped rather than read, an index of
+# where each record starts is built once, and records are handed out as
+# views into the mapping so only the fields that are used get decoded.
+
+import locale
+import mmap
+import os
+import re
+from array import array
+
+from banktransactionfile.aba.file import AbaFile, InvalidFormatError
+
+# ABA files are plain ASCII. Files that aren't are decoded as the text
+# reader decodes them.
+ENCODING = locale.getpreferredencoding(False)
+
+# Bytes checked for ASCII at a time
+CHECK_SIZE = 1024 * 1024
+
+# Line endings the text reader's universal newlines end a line at, and a
+# CR that ends a line on its own. Files without one are split at LF alone.
+BYTES_LINE_END = re.compile(rb'\r\n?|\n')
+TEXT_LINE_END = re.compile(r'\r\n?|\n')
+BYTES_LONE_CR = re.compile(rb'\r(?!\n)')
+TEXT_LONE_CR = re.compile(r'\r(?!\n)')
+
+
+class MappedRecord(object):
+    """
+    One record of a MappedAbaFile.
+
+    Slicing or indexing returns a string decoded from just that part of the
+    record, so the aba.record get_* helpers work on it the same as on a
+    string record. field(start, stop) returns the raw memoryview slice.
+    Records of a file that had to be decoded whole are strings instead.
+    """
+    __slots__ = ('view',)
+
+    def __init__(self, view):
+        self.view = view
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            key = slice(key, key + 1 or None)
+        return self.view[key].tobytes().decode(ENCODING)
+
+    def __len__(self):
+        return len(self.view)
+
+    def __str__(self):
+        return self.view.tobytes().decode(ENCODING)
+
+    def field(self, start, stop):
+        return self.view[start:stop]
+
+
+class MappedAbaFile(object):
+    """
+    Random access to the records of an ABA file through a memory map.
+
+    src is a filename or an open file. Lines end at LF, CRLF or a lone CR,
+    as they do for the text reader, and a file with bytes outside ASCII is
+    decoded as the text reader decodes it. The index stops at the first
+    problem with the structure of the file, which is kept as error:
+    iter_records yields the records before it and then raises it, so a bad
+    file fails with the same InvalidFormatError, at the same record, as
+    AbaFile.iter_records gives.
+    """
+    RECORD_LENGTH = AbaFile.RECORD_LENGTH
+
+    def __init__(self, src):
+        if hasattr(src, 'fileno'):
+            self._file = None
+            fileno = src.fileno()
+        else:
+            self._file = open(src, 'rb')
+            fileno = self._file.fileno()
+
+        if os.fstat(fileno).st_size:
+            self._map = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        else:
+            # an empty file can't be mapped
+            self._map = b''
+        self._view = memoryview(self._map)
+        self._text = None
+        try:
+            if not self._is_ascii():
+                self._text = self._decode()
+            self.offsets, self.error = self._build_index()
+        except InvalidFormatError:
+            self.close()
+            raise
+
+    def _is_ascii(self):
+        for start in range(0, len(self._map), CHECK_SIZE):
+            if not self._map[start:start + CHECK_SIZE].isascii():
+                return False
+        return True
+
+    # Decode the whole file, for files the records can't be sliced out of
+    # byte by byte
+    def _decode(self):
+        try:
+            return self._map[:].decode(ENCODING)
+        except UnicodeDecodeError as e:
+            raise InvalidFormatError(('Input ABA file is not {} text, byte' +
+                ' {} can not be decoded').format(ENCODING, e.start))
+
+    def _build_index(self):
+        offsets = array('l')
+        record_type_count = {}
+        if self._text is None:
+            data, line_end, lf, cr = self._map, BYTES_LINE_END, b'\n', b'\r'
+            lone_cr = BYTES_LONE_CR.search(data)
+        else:
+            data, line_end, lf, cr = self._text, TEXT_LINE_END, '\n', '\r'
+            lone_cr = TEXT_LONE_CR.search(data)
+        size = len(data)
+        start = 0
+
+        while start < size:
+            if lone_cr:
+                match = line_end.search(data, start)
+                stop = match.start() if match else size
+                end = match.end() if match else size
+            else:
+                end = data.find(lf, start)
+                if end == -1:
+                    end = size
+                stop = end
+                if stop > start and data[stop - 1:stop] == cr:
+                    stop -= 1
+                end += 1
+
+            if stop - start != self.RECORD_LENGTH:
+                return offsets, InvalidFormatError('Input ABA file must' +
+                    ' contain ' + str(self.RECORD_LENGTH) + ' characters' +
+                    ' per line to be converted correctly')
+
+            record_type = data[start:start + 1]
+            if self._text is None:
+                record_type = record_type.decode('ascii')
+            record_type_count[record_type] = (
+                record_type_count.get(record_type, 0) + 1)
+            if record_type_count[record_type] > 1 and record_type in '07':
+                return offsets, InvalidFormatError('ABA file must contain' +
+                    ' only one header and control record')
+
+            offsets.append(start)
+            start = end
+
+        # Check ABA file has correct amount of records
+        if not ('0' in record_type_count and '1' in record_type_count and
+            '7' in record_type_count):
+            return offsets, InvalidFormatError('ABA file must contain' +
+                ' header,transaction and control record to be converted')
+        return offsets, None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    # size of the file in bytes
+    @property
+    def size(self):
+        return len(self._map)
+
+    def __getitem__(self, n):
+        start = self.offsets[n]
+        if self._text is not None:
+            return self._text[start:start + self.RECORD_LENGTH]
+        return MappedRecord(self._view[start:start + self.RECORD_LENGTH])
+
+    def iter_records(self):
+        for n in range(len(self.offsets)):
+            yield self[n]
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self._view.release()
+        if not isinstance(self._map, bytes):
+            try:
+                self._map.close()
+            except BufferError:
+                # records are still in use, the map is closed once they
+                # have all been freed
+                pass
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,64 @@
+# record.py
+# banktransactionfile.aba.record
+#
+# Functions that slice fields out of 120 character ABA records.
+
+
+#######################################################
+#                                                     #
+#                 Header Functions                    #
+#                                                     #
+#######################################################
+
+# Get process day from header file
+def get_process_date(record):
+    process_date = record[74:80]
+    return (process_date[-2:] + process_date[2: -2] + process_date[:2])
+
+# Get listing indicator, currently not used
+def get_listing_indicator(record):
+    return ''; # haven't found corresponding ABA field
+
+# Get senders account name
+def get_sender_account_name(record):
+    return record[30:56].strip()
+
+
+#######################################################
+#                                                     #
+#               Transaction Functions                 #
+#                                                     #
+#######################################################
+
+# Get recievers account number
+def get_receiver_account(record):
+    # Remove hyphen from bsb and remove white space
+    receiver_account = record[1:17].replace('-', '').strip()
+    return receiver_account
+
+# Get amount to transfer
+def get_amount_to_send(record):
+    send = record[21:30]
+    return send
+
+# Get payment recievers name
+def get_reciever_name(record):
+    name = record[30:50]
+    return name.strip()
+
+# Get payment recievers reference 
+def get_receiver_reference(record):
+    reference = record[62:80].strip()
+    # return truncated version so it will pass length verification
+    # will be truncated by bank system if > 12 characters 
+    return reference[:12]
+
+# Get senders account number and format to afi specification
+def get_sender_account_number(record):
+    return record[80:96].replace('-', '').strip()
+
+
+# Text to appear in payment reference, max chars 16 as per afi specifications
+def get_sender_business_reference(record):
+    concatenated_reference = record[96:112].strip()
+    return concatenated_reference[:12]
@@ -0,0 +1,289 @@
+# encoder.py
+# banktransactionfile.afi.encoder
+#
+# Record layouts compiled into one encoder function per record type.
+# The encoders give the same output as record.HeaderRecord, TransactionRecord
+# and ControlRecord and raise the same ValidationErrors, in the same field
+# order, but don't build a field object for every value on every line.
+# The same layouts are compiled into checkers that report every field that
+# fails instead of stopping at the first.
+#
+# The header has dates checked against today's, so its encoder and checker
+# are compiled for each day by a ValidationContext, with the day's dates
+# written in as constants.
+
+from datetime import date
+from functools import lru_cache
+
+from banktransactionfile.afi import field
+from banktransactionfile.afi.field import Field, ValidationError
+
+
+# A layout lists the fields of a record in order. Field instances are the same
+# on every line so they are validated once when the encoder is compiled;
+# (argument name, field class) pairs become arguments of the encoder, in the
+# order they first appear.
+
+HEADER_LAYOUT = (
+    field.RecordType(1), # 1 specifies header file
+    field.FileRecordSpare(),
+    field.FileRecordSpare(),
+    field.FileRecordSpare(),
+    ('account', field.Account),
+    ('file_type', field.FileType), # 7 = Direct Credit type
+    ('process_date', field.FileDate), #date to be processed (YY/MM/DD)
+    ('current_date', field.FileCreationDate), #current date (YY/MM/DD)
+)
+
+TRANSACTION_LAYOUT = (
+    field.RecordType(2),
+    ('receiver_account', field.Account),
+    ('transaction_code', field.TransactionCode),
+    ('amount_to_send', field.Amount),
+    ('receiver_name', field.Name),
+    ('receiver_reference', field.ReferenceOrCode),
+    field.FileRecordSpare(), #not used by ABA
+    field.FileRecordSpare(), #not used by ABA
+    ('sender_account_name', field.Name),
+    ('sender_business_reference', field.Name),
+    field.FileRecordSpare(), #not used by ABA
+    field.FileRecordSpare(), #not used by ABA
+)
+
+CONTROL_LAYOUT = (
+    field.RecordType(3),
+    ('transaction_total', field.Amount),
+    ('transaction_count', field.TransactionRecordCount),
+    ('hash_total', field.HashTotal),
+)
+
+
+# Expressions that give the value a field class would build in __init__.
+# Classes not listed keep the argument as is.
+PREPARE = {
+    field.Amount: "str({arg}).rjust({length}, '0')",
+    field.TransactionRecordCount: "str({arg}).rjust({length}, '0')",
+}
+
+# Failing conditions of the field classes that override validate, written
+# exactly as the validate methods test them. Classes that override validate
+# and are not listed here are encoded through a field object instead.
+CHECKS = {
+    field.Account: 'len({value}) not in {length}',
+    field.Name: 'len({value}) > {length} | len({value}) == 0',
+    field.ReferenceOrCode: 'len({value}) > {length}',
+}
+
+# The same for fields checked against today's date, filled in from a
+# ValidationContext. Both FileDate checks fail with FileDate.message.
+DATED_CHECKS = {
+    field.FileDate: (
+        'int({value}[:2]) > {max_year} | int({value}[2:4]) > 12 | ' +
+            'int({value}[4:6]) > 31',
+        'not ({min_date} <= int({value}) <= {max_date})',
+    ),
+}
+
+
+# What a failing field does in an encoder, and in a checker. message is an
+# expression giving the message.
+RAISE = 'raise ValidationError({message}, {name!r})'
+COLLECT = 'errors.append(({arg!r}, {message}))'
+
+
+# Get the source of a length or a set of lengths or values. Sets are written
+# as set literals, which compile to constants that are tested by hashing.
+def _literal(values):
+    if isinstance(values, (set, frozenset)):
+        return '{' + ', '.join(sorted(repr(value) for value in values)) + '}'
+    return repr(values)
+
+
+def _field_code(cls, arg, value, fail=RAISE, context=None):
+    """
+    Return the source lines that set value from arg and validate it the way
+    cls(arg).parse_to_string() would. A failure runs fail: RAISE raises the
+    ValidationError, COLLECT adds (arg, message) to errors and carries on.
+    Fields checked against today's date are only compiled in with a
+    context, they are validated through a field object otherwise.
+    """
+    name = cls.__name__
+    prepare = PREPARE.get(cls, '{arg}').format(arg=arg, length=cls.length)
+    lines = ['{} = str({})'.format(value, prepare)]
+    valid_values = cls.valid_values
+    if context is not None:
+        valid_values = context.valid_values(cls)
+
+    if cls.validate is Field.validate:
+        checks = ['len({}) != {!r}'.format(value, cls.length)]
+        messages = [repr('length mismatch in ' + name)]
+        if valid_values:
+            checks.append('{} not in {}'.format(value,
+                _literal(valid_values)))
+            messages.append(repr('invalid value in ' + name))
+    elif cls in CHECKS:
+        checks = [CHECKS[cls].format(value=value,
+            length=_literal(cls.length))]
+        messages = [repr('length mismatch in ' + name)]
+    elif cls in DATED_CHECKS and context is not None:
+        checks = [check.format(value=value, max_year=context.max_year,
+            min_date=int(context.min_process_date),
+            max_date=int(context.max_process_date))
+            for check in DATED_CHECKS[cls]]
+        messages = ['{!r}.format({})'.format(cls.message, value)] * 2
+    elif fail == RAISE:
+        return ['{} = _{}({}).parse_to_string()'.format(value, name, arg)]
+    else:
+        # validate can also fail with a ValueError on values that aren't
+        # numbers, which stops a conversion just the same
+        return [
+            'try:',
+            '    {} = _{}({}).parse_to_string()'.format(value, name, arg),
+            'except (ValidationError, ValueError) as e:',
+            '    errors.append(({!r}, str(e)))'.format(arg),
+        ]
+
+    # validate stops at the first check that fails
+    checked = []
+    for i, (check, message) in enumerate(zip(checks, messages)):
+        checked.append('{} {}:'.format('elif' if i else 'if', check))
+        checked.append('    ' + fail.format(message=message, name=name,
+            arg=arg))
+    if cls in DATED_CHECKS and fail != RAISE:
+        # the dates are read as numbers, a ValueError stops a conversion
+        # just the same
+        return lines + ['try:'] + ['    ' + line for line in checked] + [
+            'except ValueError as e:',
+            '    errors.append(({!r}, str(e)))'.format(arg),
+        ]
+    return lines + checked
+
+
+def compile_encoder(name, layout, context=None):
+    """
+    Build a function that encodes one record of the given layout as an afi
+    line, with the dates of context (a ValidationContext) when it has dated
+    fields. Returns the function; its source is kept on it as __source__.
+    """
+    arguments = []
+    body = []
+    values = []
+    namespace = {'ValidationError': ValidationError}
+
+    for i, item in enumerate(layout):
+        if isinstance(item, Field):
+            values.append(repr(item.parse_to_string()))
+            continue
+
+        arg, cls = item
+        if arg not in arguments:
+            arguments.append(arg)
+        value = 'v{}'.format(i)
+        namespace['_' + cls.__name__] = cls
+        body.extend(_field_code(cls, arg, value, RAISE, context))
+        values.append(value)
+
+    # Record.parse_to_string leaves a trailing comma on every record except
+    # the control record, whose first field is 3
+    output = "','.join(({},)) + ','".format(', '.join(values))
+    if values[0] == repr('3'):
+        output = '({}).rstrip(\',\')'.format(output)
+    body.append('return ' + output)
+
+    source = 'def {}({}):\n{}\n'.format(name, ', '.join(arguments),
+        '\n'.join('    ' + line for line in body))
+    exec(compile(source, '<afi encoder {}>'.format(name), 'exec'), namespace)
+    encoder = namespace[name]
+    encoder.__source__ = source
+    return encoder
+
+
+def compile_checker(name, layout, context=None):
+    """
+    Build a function that validates the values of one record of the given
+    layout like its encoder does, without building the line. It returns a
+    list of (argument name, message) for every field that fails rather
+    than raising at the first. Its source is kept on it as __source__.
+    """
+    arguments = []
+    body = ['errors = []']
+    namespace = {'ValidationError': ValidationError}
+
+    for i, item in enumerate(layout):
+        if isinstance(item, Field):
+            continue
+
+        arg, cls = item
+        if arg not in arguments:
+            arguments.append(arg)
+        namespace['_' + cls.__name__] = cls
+        body.extend(_field_code(cls, arg, 'v{}'.format(i), COLLECT,
+            context))
+    body.append('return errors')
+
+    source = 'def {}({}):\n{}\n'.format(name, ', '.join(arguments),
+        '\n'.join('    ' + line for line in body))
+    exec(compile(source, '<afi checker {}>'.format(name), 'exec'), namespace)
+    checker = namespace[name]
+    checker.__source__ = source
+    return checker
+
+
+encode_transaction = compile_encoder('encode_transaction', TRANSACTION_LAYOUT)
+encode_control = compile_encoder('encode_control', CONTROL_LAYOUT)
+
+check_transaction = compile_checker('check_transaction', TRANSACTION_LAYOUT)
+check_control = compile_checker('check_control', CONTROL_LAYOUT)
+
+
+class ValidationContext(object):
+    """
+    Validation for conversions run on one day. The window of process dates
+    FileDate accepts and the creation date FileCreationDate takes are
+    worked out once, from today or the given date, and compiled into
+    encode_header and check_header, so a header is validated without
+    asking for the date or building field objects. Records without dates
+    are the same every day and share the module's encoders and checkers.
+    """
+
+    def __init__(self, today=None):
+        if today is None:
+            today = date.today()
+        self.today = today
+        self.min_process_date, self.max_process_date = (
+            field.process_date_window(today))
+        self.max_year = int(self.max_process_date[:2])
+        self.creation_date = today.strftime('%y%m%d')
+
+        self.encode_header = compile_encoder('encode_header', HEADER_LAYOUT,
+            self)
+        self.encode_transaction = encode_transaction
+        self.encode_control = encode_control
+        self.check_header = compile_checker('check_header', HEADER_LAYOUT,
+            self)
+        self.check_transaction = check_transaction
+        self.check_control = check_control
+
+    # Get the valid values of a field class on this day
+    def valid_values(self, cls):
+        if cls is field.FileCreationDate:
+            return frozenset((self.creation_date,))
+        return cls.valid_values
+
+
+# Contexts of the last few days a long running process has converted on
+@lru_cache(maxsize=4)
+def _get_context(today):
+    return ValidationContext(today)
+
+
+def get_context(today=None):
+    """
+    Return the ValidationContext of today, or of the given date. It is
+    compiled the first time a day asks for it. A conversion takes one when
+    it starts and uses it throughout, so a run that goes past midnight
+    validates against the day it started on.
+    """
+    if today is None:
+        today = date.today()
+    return _get_context(today)
@@ -2,14 +2,36 @@
 # field.py
 # banktransactionfile.afi.field
 import datetime
+import string
 from datetime import date
 
 class ValidationError(Exception):
-    pass
+    def __init__(self, message, field=None):
+        Exception.__init__(self, message)
+        # name of the Field class that failed
+        self.field = field
 
 #field valid characters
 # A - [a-z],[A-Z],[0-9],[-,&/#?:_.space]
 # N - [0-9]
+
+# Characters kept when free text from an ABA file (names and references) is
+# cleaned for an A field. Commas would split the field in a comma delimited
+# file, so this is the set the converter has always kept rather than A itself.
+TEXT_CHARS = string.ascii_letters + string.digits + ' ()+./:;<=>?'
+
+
+# Get the first and last process dates (YYMMDD) a file can have: today, and
+# a year from today
+def process_date_window(today=None):
+    if today is None:
+        today = date.today()
+    max_date = date(today.year+1, today.month, today.day)
+    return today.strftime('%y%m%d'), max_date.strftime('%y%m%d')
+
+
+# valid_values are sets of the strings a field can hold, and a length that
+# can be more than one is a set of lengths
 class Field(object):
     length = None
     valid_values = ()
@@ -21,7 +43,7 @@ class Field(object):
                 'length mismatch in {}'.format(self.__class__.__name__)       
             )
 
-        if not all(self.valid_values): 
+        if self.valid_values:
             if self.value not in self.valid_values:
                 raise ValidationError(
                     'invalid value in {}'.format(self.__class__.__name__)
@@ -29,7 +51,12 @@ class Field(object):
     
     def parse_to_string(self):
         self.value = str(self.value)
-        self.validate()
+        try:
+            self.validate()
+        except ValidationError as e:
+            if e.field is None:
+                e.field = self.__class__.__name__
+            raise
         return self.value
 
 class RecordType(Field):
@@ -42,7 +69,7 @@ class RecordType(Field):
     Field Format N(1)
     """
     length = 1
-    valid_values = ('1', '2', '3')
+    valid_values = frozenset(('1', '2', '3'))
 
     def __init__(self, type_id):
         #try:
@@ -88,7 +115,7 @@ class FileType(Field):
     Field Format N(1)
     """
     length = 1
-    valid_values = ('7')
+    valid_values = frozenset(('7',))
 
     def __init__(self, file_id='7'):
         self.value = file_id
@@ -99,7 +126,7 @@ class FileRecordSpare(Field):
     Currently an unused field, leave blank.
     """
     length = 0
-    valid_values = ('')
+    valid_values = frozenset(('',))
 
     def __init__(self, file_id=''):
         self.value = file_id
@@ -112,16 +139,16 @@ class FileDate(Field):
     The date cannot be less than today's date.
     """
     length = 6
+    # what both checks fail with, given the value
+    message = ('Date to process cannot be less than todays date,' +
+        ' or more than a year away. \nCurrently set at {} (YY/MM/DD')
 
     def __init__(self, date):
         self.value = date
 
     def validate(self):
     
-        min_date = date.today()
-        max_date = date(min_date.year+1, min_date.month, min_date.day)
-        min_date = min_date.strftime('%y%m%d')
-        max_date = max_date.strftime('%y%m%d')
+        min_date, max_date = process_date_window()
 
         month = 12
         day = 31
@@ -129,20 +156,12 @@ class FileDate(Field):
 
         if ( int(self.value[:2]) > year | int(self.value[2:4]) > month | 
             int(self.value[4:6]) > day):
-            raise ValidationError(
-                'Date to process cannot be less than todays date,' +
-                ' or more than a year away. \nCurrently set at {} (YY/MM/DD'
-                .format(self.value )
-            )
+            raise ValidationError(self.message.format(self.value))
 
         if (int(min_date) <= int(self.value) <= int(max_date)):
             pass
         else:
-            raise ValidationError(
-                'Date to process cannot be less than todays date,' +
-                ' or more than a year away. \nCurrently set at {} (YY/MM/DD'
-                .format(self.value )
-            )
+            raise ValidationError(self.message.format(self.value))
 
 
 class FileCreationDate(Field):
@@ -153,10 +172,14 @@ class FileCreationDate(Field):
     today's date.
     """
     length = 6
-    valid_values = datetime.datetime.today().strftime('%y%m%d')
+    # today's date, set as each field is made rather than when the module is
+    # imported, so a process that runs past midnight has the right day
+    valid_values = frozenset()
 
     def __init__(self, date):
         self.value = date
+        self.valid_values = frozenset((
+            datetime.date.today().strftime('%y%m%d'),))
 
 class ListingIndicator(Field):
     """
@@ -179,7 +202,7 @@ class ListingIndicator(Field):
     for all trancsction items.
     """
     length = 1
-    valid_values = ('', 'C', 'I', 'O')
+    valid_values = frozenset(('', 'C', 'I', 'O'))
 
     def __init__(self, char):
         self.value = char
@@ -207,7 +230,7 @@ class Account(Field):
 
     Field Format N(15 or 16)
     """
-    length = [15, 16]
+    length = frozenset((15, 16))
 
     def __init__(self, account):
         self.value = account
@@ -226,7 +249,8 @@ class TransactionCode(Field):
     The same transaction code must be used for all transactions in the file.
     """
     length = 2
-    valid_values = (50, 52, 60)
+    # strings, as the value is by the time it is validated
+    valid_values = frozenset(('50', '52', '61'))
 
     def __init__(self, code='50'):
         self.value = code
@@ -3,6 +3,10 @@
 
 from banktransactionfile.afi import field
 
+# Most transaction records one file may hold, see Record
+MAX_BULK_TRANSACTIONS = 99998
+MAX_INDIVIDUAL_TRANSACTIONS = 49999
+
 class Record(object):
     """
     - Comma delimited
@@ -20,7 +24,8 @@ class Record(object):
     - 0 < transaction record
     - 1 control record
     """
-    fields = []
+    # set by each subclass for each record, never shared between records
+    fields = ()
 
     def parse_to_string(self):
         output = ''
@@ -0,0 +1,193 @@
+# batch.py
+# banktransactionfile.batch
+#
+# Converts many ABA files at once on a pool of worker processes. Each file
+# gets a result dict, so one bad file is reported without stopping the rest.
+
+import glob
+import multiprocessing
+import os # for file path commands
+import time
+
+from banktransactionfile import compression
+from banktransactionfile.aba.file import get_filename, has_aba_file_extention
+from banktransactionfile.converter import ControlTotals
+from banktransactionfile.duplicates import DuplicateCheck, PaymentIndex
+from banktransactionfile.split import convert_split
+
+
+# Get the aba files in a directory, or matching a glob pattern
+def find_aba_files(path):
+    if os.path.isdir(path):
+        filenames = [os.path.join(path, name) for name in os.listdir(path)]
+    else:
+        filenames = glob.glob(path)
+
+    return sorted(filename for filename in filenames
+        if os.path.isfile(filename) and has_aba_file_extention(filename))
+
+
+def convert_one(aba_filename, output_dir, options=None, cache=None,
+    payment_index=None):
+    """
+    Convert one aba file into output_dir, through a cache.ConversionCache
+    when cache is given, and return a result dict. A compressed aba file
+    gives afi files compressed the same way. The dict has:
+    file, outputs (more than one when the file is split to stay within the
+    bank's transaction limit), status ('converted' or 'failed'),
+    transaction_count, transaction_total, hash_total, elapsed (seconds), and
+    error and error_type when the file failed.
+    With payment_index, the filename of a duplicates.PaymentIndex, the
+    transactions are looked up there and the dict also has
+    possible_duplicates (see duplicates.DuplicateCheck).
+    """
+    result = {
+        'file': aba_filename,
+    }
+    start = time.time()
+
+    index = None
+    duplicates = None
+    try:
+        afi_name = os.path.join(output_dir, get_filename(aba_filename))
+        if payment_index is not None:
+            index = PaymentIndex(payment_index)
+            duplicates = DuplicateCheck(index, aba_filename)
+        afi_compression = compression.detect(aba_filename)
+        # already in a worker process, so parts are written one at a time
+        if cache is None:
+            parts = convert_split(aba_filename, afi_name, options,
+                processes=1, compression=afi_compression,
+                duplicates=duplicates)
+        else:
+            parts = cache.convert_split(aba_filename, afi_name, options,
+                processes=1, compression=afi_compression,
+                duplicates=duplicates)
+    except Exception as e:
+        _failed(result, e)
+    else:
+        totals = ControlTotals()
+        for afi_filename, part_totals in parts:
+            totals.merge(part_totals)
+        result.update({
+            'status': 'converted',
+            'outputs': [afi_filename for afi_filename, part_totals in parts],
+            'transaction_count': totals.transaction_count,
+            'transaction_total': totals.transaction_total,
+            'hash_total': totals.hash_total(),
+        })
+    finally:
+        if index is not None:
+            index.close()
+
+    if duplicates is not None:
+        result['possible_duplicates'] = duplicates.found
+    result['elapsed'] = round(time.time() - start, 6)
+    return result
+
+
+# Mark a result dict failed with error e
+def _failed(result, e):
+    result.update({
+        'status': 'failed',
+        'outputs': [],
+        'error_type': e.__class__.__name__,
+        'error': str(e),
+    })
+    return result
+
+
+# Runs in a worker process, pool.imap only passes one argument
+def _convert_one(args):
+    return convert_one(*args)
+
+
+# Get the name of the afi file convert_one writes for aba_filename, before
+# any part number: <name>.afi, with the extension of its compression
+def _afi_filename(aba_filename):
+    try:
+        afi_compression = compression.detect(aba_filename)
+    except (IOError, OSError):
+        # fails when it is converted
+        afi_compression = None
+    return compression.add_extension(get_filename(aba_filename) + '.afi',
+        afi_compression)
+
+
+# Get aba_filenames without the files named more than once, keeping the
+# first name of each
+def _unique_files(aba_filenames):
+    seen = set()
+    filenames = []
+    for filename in aba_filenames:
+        path = os.path.realpath(filename)
+        if path not in seen:
+            seen.add(path)
+            filenames.append(filename)
+    return filenames
+
+
+def find_collisions(aba_filenames):
+    """
+    Return {filename: error} for the aba files that would write afi files
+    of the same name as another file in the batch, such as x.aba and
+    x.ABA, or a/x.aba and b/x.aba. x.aba and x.aba.gz don't collide, they
+    are converted to x.afi and x.afi.gz. Each file is only counted once
+    however many times it is named.
+    """
+    groups = {}
+    for filename in _unique_files(aba_filenames):
+        groups.setdefault(_afi_filename(filename), []).append(filename)
+
+    collisions = {}
+    for name, filenames in groups.items():
+        if len(filenames) > 1:
+            for filename in filenames:
+                others = [other for other in filenames if other != filename]
+                collisions[filename] = ValueError(('{} would be converted' +
+                    ' to the same afi name ({}) as {}, none of them were' +
+                    ' converted').format(filename, name, ', '.join(others)))
+    return collisions
+
+
+def convert_batch(aba_filenames, output_dir, workers=None, options=None,
+    cache=None, payment_index=None):
+    """
+    Convert aba_filenames into output_dir on a pool of workers processes
+    (one per CPU by default). Returns the result dicts of convert_one in the
+    same order as aba_filenames, a file named more than once being
+    converted and reported once. Files that would be written under the same
+    afi name as another fail before anything is converted.
+    """
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    aba_filenames = _unique_files(aba_filenames)
+    collisions = find_collisions(aba_filenames)
+    jobs = [(filename, output_dir, options, cache, payment_index)
+        for filename in aba_filenames if filename not in collisions]
+    pool = multiprocessing.Pool(workers)
+    try:
+        converted = iter(pool.map(_convert_one, jobs, chunksize=1))
+    finally:
+        pool.terminate()
+        pool.join()
+
+    results = []
+    for filename in aba_filenames:
+        if filename in collisions:
+            results.append(_failed({'file': filename, 'elapsed': 0.0},
+                collisions[filename]))
+        else:
+            results.append(next(converted))
+    return results
+
+
+# Summary of a batch to be written out as json
+def batch_report(results):
+    failed = [result for result in results if result['status'] == 'failed']
+    return {
+        'files': results,
+        'converted': len(results) - len(failed),
+        'failed': len(failed),
+    }
@@ -0,0 +1,205 @@
+# cache.py
+# banktransactionfile.cache
+#
+# On-disk cache of converted files. Upstream systems resubmit the same ABA
+# file, so the afi files of a conversion are kept under a digest of the aba
+# file's bytes and the conversion options, and a resubmission is answered by
+# copying them back out. The least recently used entries are removed once
+# the cache grows past its size limit.
+
+import hashlib
+import json
+import os # for file path commands
+import shutil
+import tempfile
+
+from banktransactionfile.afi.record import MAX_BULK_TRANSACTIONS
+from banktransactionfile.compression import add_extension, open_file
+from banktransactionfile.converter import ConversionOptions, ControlTotals
+from banktransactionfile.split import (convert_split, remove_parts,
+    rename_parts, temp_part_filename)
+
+# Bump when the afi output or the layout of entries changes, so old entries
+# are never used
+CACHE_VERSION = 1
+
+# Default limit on the size of the cache, in bytes
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Bytes read at once when computing the digest of an aba file
+READ_SIZE = 1024 * 1024
+
+# Totals of every part of an entry, the afi files sit beside it as 1.afi,
+# 2.afi and so on
+PARTS_FILENAME = 'parts.json'
+
+
+def file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ConversionCache(object):
+    """
+    Cache of conversions in directory, kept under max_bytes.
+
+    Entries are keyed on the digest of the aba file and everything that
+    changes the afi output: transaction code, file type, creation date (the
+    header embeds it), the transaction limit files are split at and how
+    the afi files are compressed. Using an
+    entry marks it as recently used. Several processes can share a
+    directory, entries are written to a temporary directory and renamed into
+    place whole.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, aba_filename, options, max_transactions, compression=None):
+        key = '\n'.join(str(value) for value in (CACHE_VERSION,
+            file_digest(aba_filename), options.transaction_code,
+            options.file_type, options.get_creation_date(),
+            max_transactions, compression))
+        return hashlib.sha256(key.encode('ascii')).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """
+        Return the list of (cached afi filename, ControlTotals) of an entry,
+        or None when it isn't in the cache.
+        """
+        path = self.entry_path(key)
+        try:
+            with open(os.path.join(path, PARTS_FILENAME)) as f:
+                parts = json.load(f)
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+
+        entry = []
+        for number, values in enumerate(parts, 1):
+            totals = ControlTotals()
+            totals.transaction_count = values['transaction_count']
+            totals.transaction_total = values['transaction_total']
+            totals.hash_sum = values['hash_sum']
+            entry.append((os.path.join(path, '{}.afi'.format(number)), totals))
+        return entry
+
+    def put(self, key, parts):
+        """
+        Store copies of the afi files of a conversion, parts being the list
+        of (afi filename, ControlTotals) convert_split returns, then evict
+        entries down to max_bytes.
+        """
+        path = self.entry_path(key)
+        temp_path = tempfile.mkdtemp(prefix=key + '.tmp-',
+            dir=self.directory)
+        try:
+            for number, (afi_filename, totals) in enumerate(parts, 1):
+                shutil.copyfile(afi_filename,
+                    os.path.join(temp_path, '{}.afi'.format(number)))
+            with open(os.path.join(temp_path, PARTS_FILENAME), 'w') as f:
+                json.dump([{
+                    'transaction_count': totals.transaction_count,
+                    'transaction_total': totals.transaction_total,
+                    'hash_sum': totals.hash_sum,
+                } for afi_filename, totals in parts], f)
+            os.rename(temp_path, path)
+        except OSError:
+            # another process stored the same entry first
+            shutil.rmtree(temp_path, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+        self.evict()
+
+    def entries(self):
+        """
+        Return (last used time, size in bytes, path) of every entry.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if '.tmp-' in name or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(path, filename))
+                    for filename in os.listdir(path))
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:
+                # removed by another process
+                continue
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in
+        max_bytes.
+        """
+        entries = sorted(self.entries())
+        size = sum(entry[1] for entry in entries)
+        for last_used, entry_size, path in entries:
+            if size <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            size -= entry_size
+
+    def convert_split(self, aba_filename, afi_name, options=None,
+        max_transactions=MAX_BULK_TRANSACTIONS, processes=None, metrics=None,
+        compression=None, duplicates=None):
+        """
+        Same as split.convert_split, but the afi files are copied out of the
+        cache when the same aba file was converted with the same options
+        before. Only conversions that miss the cache add to metrics; a
+        duplicates.DuplicateCheck reads the aba file either way.
+        """
+        if options is None:
+            options = ConversionOptions()
+        if options.creation_date is None:
+            # the date the key is made with is the date the file gets
+            options = ConversionOptions(options.transaction_code,
+                options.file_type, options.get_creation_date(),
+                options.reader)
+        key = self.key(aba_filename, options, max_transactions, compression)
+
+        entry = self.get(key)
+        if entry is not None:
+            parts = self.copy_entry(entry, afi_name,
+                add_extension('.afi', compression))
+            if parts is not None:
+                if duplicates is not None:
+                    with open_file(aba_filename, 'r') as aba:
+                        duplicates.check_lines(aba)
+                    duplicates.commit()
+                return parts
+
+        parts = convert_split(aba_filename, afi_name, options,
+            max_transactions, processes, metrics, compression, duplicates)
+        self.put(key, parts)
+        return parts
+
+    # Copy the afi files of an entry out to the names convert_split gives,
+    # through temporary names as convert_split writes them.
+    # Returns None, leaving nothing behind, if the entry was evicted by
+    # another process meanwhile.
+    def copy_entry(self, entry, afi_name, extension):
+        parts = []
+        try:
+            for cached_filename, totals in entry:
+                filename = temp_part_filename(afi_name, extension)
+                parts.append((filename, totals))
+                shutil.copyfile(cached_filename, filename)
+        except (IOError, OSError):
+            remove_parts(parts)
+            return None
+        except Exception:
+            remove_parts(parts)
+            raise
+        return rename_parts(parts, afi_name, extension)
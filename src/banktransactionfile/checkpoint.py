@@ -0,0 +1,356 @@
+# checkpoint.py
+# banktransactionfile.checkpoint
+#
+# Conversion of very large ABA files that survives being killed part way
+# through. The afi files are written under temporary names and, every so
+# many records, a checkpoint is saved beside them with the position in the
+# aba file, how much of the part being written is on disk and the totals
+# and hash of that part so far. Run again after a crash, the conversion
+# carries on from the last checkpoint instead of line one, and the afi files
+# are the same as a run that was never stopped would give. They only get
+# their real names once every record is converted.
+
+import json
+import os # for file path commands
+import shutil
+
+from banktransactionfile.aba.file import AbaFile, InvalidFormatError
+from banktransactionfile.afi import encoder as afi_encoder
+from banktransactionfile.afi.record import MAX_BULK_TRANSACTIONS
+from banktransactionfile.compression import add_extension, open_file
+from banktransactionfile.converter import (ConversionOptions, ControlTotals,
+    convert_record, with_sender_details)
+from banktransactionfile.split import (part_filenames, remove_parts,
+    stale_part_filenames)
+
+# Bump when what a checkpoint holds changes, so older ones are ignored
+CHECKPOINT_VERSION = 2
+
+# Records converted between checkpoints
+DEFAULT_CHECKPOINT_EVERY = 100000
+
+# Added to the name of an afi file while it is being written
+PARTIAL_EXTENSION = '.partial'
+
+
+def totals_to_list(totals):
+    return [totals.transaction_count, totals.transaction_total,
+        totals.hash_sum]
+
+
+def totals_from_list(values):
+    totals = ControlTotals()
+    (totals.transaction_count, totals.transaction_total,
+        totals.hash_sum) = values
+    return totals
+
+
+# Write a file and flush it to disk under a temporary name, then rename it
+# over filename so a crash leaves the old file or the new one, never half
+def write_atomic(filename, data):
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'w') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, filename)
+
+
+class ResumableConversion(object):
+    """
+    Converts aba_filename into afi files of at most max_transactions
+    transactions each, named as split.convert_split names them, saving a
+    checkpoint to <afi_name>.checkpoint every checkpoint_every records.
+
+    A checkpoint is only used for the same aba file (same path, size and
+    modification time), transaction code, file type, transaction limit,
+    compression and creation date, today's unless options give one. The
+    header was checked against the day its checkpoint was started, so one
+    from an earlier day is thrown away and the conversion starts again, as
+    is any other checkpoint there, along with its files.
+
+    The parts are written uncompressed, so they can be resumed part way
+    through, and compressed with compression ('gz', 'bz2' or 'xz') as they
+    get their final names.
+    """
+
+    def __init__(self, aba_filename, afi_name, options=None,
+        max_transactions=MAX_BULK_TRANSACTIONS,
+        checkpoint_every=DEFAULT_CHECKPOINT_EVERY, compression=None):
+        if options is None:
+            options = ConversionOptions()
+        self.aba_filename = aba_filename
+        self.afi_name = afi_name
+        self.options = options
+        self.max_transactions = max_transactions
+        self.compression = compression
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_filename = afi_name + '.checkpoint'
+        self.source = self.get_source()
+        self.start()
+
+    # Identify the aba file, so a checkpoint isn't used for another file
+    def get_source(self):
+        stat = os.stat(self.aba_filename)
+        return [os.path.abspath(self.aba_filename), stat.st_size,
+            stat.st_mtime_ns]
+
+    # State of a conversion from line one
+    def start(self):
+        self.creation_date = self.options.get_creation_date()
+        self.input_offset = 0
+        self.record_count = 0
+        self.record_type_count = {}
+        self.account_number = None
+        self.sender_account_name = None
+        self.header_line = None
+        # (temporary filename, ControlTotals) of every finished part
+        self.parts = []
+        # bytes of the part being written that are on disk, and its totals
+        self.part_offset = None
+        self.part_totals = None
+        self.done = False
+
+    #######################################################
+    #                                                     #
+    #                    Checkpoints                      #
+    #                                                     #
+    #######################################################
+
+    def load(self):
+        """
+        Pick up the state saved in the checkpoint, if there is one for this
+        conversion. Returns True when there was.
+        """
+        try:
+            with open(self.checkpoint_filename) as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+
+        options = self.options
+        if (state.get('version') != CHECKPOINT_VERSION or
+            state['source'] != self.source or
+            state['transaction_code'] != str(options.transaction_code) or
+            state['file_type'] != str(options.file_type) or
+            state['max_transactions'] != self.max_transactions or
+            state['compression'] != self.compression or
+            state['creation_date'] != self.creation_date):
+            # left by a conversion of something else, or on an earlier day
+            self.parts = [(filename, None)
+                for filename in state.get('parts', [])]
+            self.remove()
+            self.start()
+            return False
+
+        self.creation_date = state['creation_date']
+        self.input_offset = state['input_offset']
+        self.record_count = state['record_count']
+        self.record_type_count = state['record_type_count']
+        self.account_number = state['account_number']
+        self.sender_account_name = state['sender_account_name']
+        self.header_line = state['header_line']
+        self.parts = [(filename, totals_from_list(totals))
+            for filename, totals in zip(state['parts'], state['totals'])]
+        self.part_offset = state['part_offset']
+        self.part_totals = None
+        if state['part_totals'] is not None:
+            self.part_totals = totals_from_list(state['part_totals'])
+        self.done = state['done']
+        return True
+
+    def save(self):
+        write_atomic(self.checkpoint_filename, json.dumps({
+            'version': CHECKPOINT_VERSION,
+            'source': self.source,
+            'transaction_code': str(self.options.transaction_code),
+            'file_type': str(self.options.file_type),
+            'max_transactions': self.max_transactions,
+            'compression': self.compression,
+            'creation_date': self.creation_date,
+            'input_offset': self.input_offset,
+            'record_count': self.record_count,
+            'record_type_count': self.record_type_count,
+            'account_number': self.account_number,
+            'sender_account_name': self.sender_account_name,
+            'header_line': self.header_line,
+            'parts': [filename for filename, totals in self.parts],
+            'totals': [totals_to_list(totals)
+                for filename, totals in self.parts],
+            'part_offset': self.part_offset,
+            'part_totals': None if self.part_totals is None else (
+                totals_to_list(self.part_totals)),
+            'done': self.done,
+        }, sort_keys=True))
+
+    # Save a checkpoint once what it records is on disk
+    def checkpoint(self, aba, afi):
+        if afi is not None:
+            afi.flush()
+            os.fsync(afi.fileno())
+            self.part_offset = afi.tell()
+        self.input_offset = aba.tell()
+        self.save()
+
+    #######################################################
+    #                                                     #
+    #                     Conversion                      #
+    #                                                     #
+    #######################################################
+
+    def part_filename(self, number):
+        return '{}_{}.afi{}'.format(self.afi_name, number, PARTIAL_EXTENSION)
+
+    # Open the part being written, where the last checkpoint left it, or
+    # start a new one
+    def open_part(self):
+        filename = self.part_filename(len(self.parts) + 1)
+        if self.part_offset is not None:
+            afi = open(filename, 'r+')
+            # anything written after the checkpoint is written again
+            afi.seek(self.part_offset)
+            afi.truncate()
+            return afi
+        afi = open(filename, 'w')
+        afi.write(self.header_line + '\n')
+        self.part_totals = ControlTotals()
+        self.part_offset = 0
+        return afi
+
+    def end_part(self, afi):
+        totals = self.part_totals
+        afi.write(afi_encoder.encode_control(totals.transaction_total,
+            totals.transaction_count, totals.hash_total()) + '\n')
+        afi.flush()
+        os.fsync(afi.fileno())
+        afi.close()
+        self.parts.append((self.part_filename(len(self.parts) + 1), totals))
+        self.part_offset = None
+        self.part_totals = None
+
+    def convert(self):
+        options = ConversionOptions(self.options.transaction_code,
+            self.options.file_type, self.creation_date)
+        creation_date = self.creation_date
+        context = afi_encoder.get_context()
+        afi = None
+        if self.part_offset is not None:
+            afi = self.open_part()
+
+        try:
+            with open_file(self.aba_filename, 'r') as aba:
+                aba.seek(self.input_offset)
+                # readline rather than iterating, so aba.tell() works
+                records = AbaFile().iter_records(iter(aba.readline, ''),
+                    self.record_type_count)
+                if self.account_number is None:
+                    records = with_sender_details(records)
+                else:
+                    records = ((record, self.account_number,
+                        self.sender_account_name) for record in records)
+
+                for record, account_number, sender_account_name in records:
+                    self.account_number = account_number
+                    self.sender_account_name = sender_account_name
+                    self.record_count += 1
+
+                    if record[0] == '1':
+                        if self.header_line is None:
+                            raise InvalidFormatError('ABA file must start' +
+                                ' with a header record to be split')
+                        if afi is None:
+                            afi = self.open_part()
+                        afi.write(convert_record(record, account_number,
+                            sender_account_name, self.part_totals, options,
+                            creation_date) + '\n')
+                        if (self.part_totals.transaction_count ==
+                            self.max_transactions):
+                            self.end_part(afi)
+                            afi = None
+                    elif record[0] == '0':
+                        self.header_line = convert_record(record,
+                            account_number, sender_account_name, None,
+                            options, creation_date, context)
+                    elif record[0] != '7':
+                        convert_record(record, account_number,
+                            sender_account_name, None, options,
+                            creation_date)
+
+                    # the first record is only passed on once the second is
+                    # read, so aba is in step with the records from then on
+                    if (self.record_count >= 2 and
+                        self.record_count % self.checkpoint_every == 0):
+                        self.checkpoint(aba, afi)
+
+            if afi is not None:
+                self.end_part(afi)
+                afi = None
+        finally:
+            if afi is not None:
+                afi.close()
+
+        self.done = True
+        self.save()
+
+    # Give a finished part its final name, compressing it on the way when
+    # the afi files are compressed
+    def rename_part(self, filename, final_filename):
+        if self.compression is None:
+            os.replace(filename, final_filename)
+            return
+        temp_filename = final_filename + '.tmp'
+        with open(filename) as src, open_file(temp_filename, 'w',
+            self.compression) as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(temp_filename, final_filename)
+        os.remove(filename)
+
+    def rename(self):
+        extension = add_extension('.afi', self.compression)
+        parts = []
+        for (filename, totals), final_filename in zip(self.parts,
+            part_filenames(self.afi_name, len(self.parts), extension)):
+            # already renamed when a run stopped part way through renaming
+            if os.path.exists(filename):
+                self.rename_part(filename, final_filename)
+            parts.append((final_filename, totals))
+        remove_parts([(filename, None) for filename in
+            stale_part_filenames(self.afi_name, len(self.parts), extension)])
+        os.remove(self.checkpoint_filename)
+        return parts
+
+    # Remove the temporary files and checkpoint of a conversion
+    def remove(self):
+        for number in range(1, len(self.parts) + 2):
+            filename = self.part_filename(number)
+            if os.path.exists(filename):
+                os.remove(filename)
+        if os.path.exists(self.checkpoint_filename):
+            os.remove(self.checkpoint_filename)
+
+    def run(self):
+        """
+        Convert the file, from the last checkpoint when there is one. If
+        conversion fails the temporary files and checkpoint are removed and
+        the error is raised; if the process is killed they stay behind to
+        resume from. Returns a list of (afi filename, ControlTotals).
+        """
+        if not (self.load() and self.done):
+            try:
+                self.convert()
+            except Exception:
+                self.remove()
+                raise
+        return self.rename()
+
+
+def convert_resumable(aba_filename, afi_name, options=None,
+    max_transactions=MAX_BULK_TRANSACTIONS,
+    checkpoint_every=DEFAULT_CHECKPOINT_EVERY, compression=None):
+    """
+    Convert aba_filename like split.convert_split does, in this process and
+    resuming from a checkpoint left by an earlier run that was killed.
+    Returns a list of (afi filename, ControlTotals).
+    """
+    return ResumableConversion(aba_filename, afi_name, options,
+        max_transactions, checkpoint_every, compression).run()
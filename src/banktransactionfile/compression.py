@@ -0,0 +1,84 @@
+# compression.py
+# banktransactionfile.compression
+#
+# Opens ABA and AFI files that are gzip, bz2 or xz compressed as if they
+# were plain text files, so archived files are converted as they stream
+# through without being unpacked to disk first. Files being read are
+# recognised by their first bytes, files being written by their extension.
+
+import bz2
+import gzip
+import lzma
+
+# Extension and module of each compression format
+FORMATS = {
+    'gz': gzip,
+    'bz2': bz2,
+    'xz': lzma,
+}
+
+# First bytes of a file in each format
+MAGIC = (
+    (b'\x1f\x8b', 'gz'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+)
+
+# gzip's default of 9 is much slower for little gain on text like this
+GZIP_LEVEL = 6
+
+
+def detect(filename):
+    """
+    Return the compression format of filename ('gz', 'bz2' or 'xz') from
+    its first bytes, or None when it isn't compressed.
+    """
+    with open(filename, 'rb') as f:
+        start = f.read(6)
+    for magic, compression in MAGIC:
+        if start.startswith(magic):
+            return compression
+    return None
+
+
+# Get the compression format an extension asks for, or None
+def from_extension(filename):
+    extension = filename.split('.')[-1]
+    if extension in FORMATS:
+        return extension
+    return None
+
+
+# Remove a compression extension from filename, if it has one
+def strip_extension(filename):
+    compression = from_extension(filename)
+    if compression is None:
+        return filename
+    return filename[:-len(compression) - 1]
+
+
+def add_extension(filename, compression):
+    if compression is None:
+        return filename
+    return filename + '.' + compression
+
+
+def open_file(filename, mode='r', compression=None):
+    """
+    Open filename as a text stream like open(filename, mode) does.
+
+    Reading, a compressed file is decompressed as it is read whatever it is
+    called. Writing, the file is compressed with compression, which
+    defaults to the format its extension names.
+    """
+    if 'r' in mode:
+        compression = detect(filename)
+    elif compression is None:
+        compression = from_extension(filename)
+
+    mode = mode.replace('t', '') + 't'
+    if compression is None:
+        return open(filename, mode)
+    if compression == 'gz' and 'r' not in mode:
+        return gzip.open(filename, mode, compresslevel=GZIP_LEVEL)
+    return FORMATS[compression].open(filename, mode)
@@ -0,0 +1,265 @@
+# consolidate.py
+# banktransactionfile.consolidate
+#
+# Merges several ABA files from the same sender account, for the same
+# process date, into one AFI upload: one header record, the transactions of
+# every file in turn and one control record with the totals and hash of all
+# of them. The bank's limit on transactions per file still applies, so a
+# large enough set is written as several parts like split.convert_split
+# does.
+
+import hashlib
+import os # for file path commands
+
+from banktransactionfile.aba import record as aba_record
+from banktransactionfile.aba.file import AbaFile, InvalidFormatError
+from banktransactionfile.afi import encoder as afi_encoder
+from banktransactionfile.afi.record import MAX_BULK_TRANSACTIONS
+from banktransactionfile.compression import open_file
+from banktransactionfile.converter import (ConversionOptions, ControlTotals,
+    convert_record, with_sender_details)
+from banktransactionfile.split import (remove_parts, rename_parts,
+    temp_part_filename)
+
+
+def sender_details(aba_filename):
+    """
+    Return the (sender account number, process date) of an aba file, read
+    from its first two records the way a conversion reads them.
+    """
+    with open_file(aba_filename, 'r') as aba:
+        header = aba.readline().rstrip('\r\n')
+        second = aba.readline().rstrip('\r\n')
+
+    if (len(header) != AbaFile.RECORD_LENGTH or
+        len(second) != AbaFile.RECORD_LENGTH or header[0] != '0'):
+        raise InvalidFormatError('ABA file must start with a header record' +
+            ' and a transaction record to be consolidated')
+    return (aba_record.get_sender_account_number(second),
+        aba_record.get_process_date(header))
+
+
+# Get a digest of the records of an aba file, the same whatever its line
+# endings or compression
+def content_digest(aba_filename):
+    digest = hashlib.sha256()
+    with open_file(aba_filename, 'r') as aba:
+        for line in aba:
+            digest.update(line.rstrip('\r\n').encode('utf-8') + b'\n')
+    return digest.hexdigest()
+
+
+def group_files(aba_filenames):
+    """
+    Group aba files that can be consolidated. Returns a list of
+    ((sender account number, process date), filenames) in the order each
+    group was first met, and a list of (filename, error) for files whose
+    details couldn't be read. Filenames are made real paths and a file
+    named more than once, say through a directory and a glob, is grouped
+    once.
+    """
+    groups = {}
+    order = []
+    errors = []
+    seen = set()
+    for filename in aba_filenames:
+        filename = os.path.realpath(filename)
+        if filename in seen:
+            continue
+        seen.add(filename)
+        try:
+            key = sender_details(filename)
+        except (IOError, OSError, ValueError, InvalidFormatError) as e:
+            errors.append((filename, e))
+            continue
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append(filename)
+    return [(key, groups[key]) for key in order], errors
+
+
+class PartWriter(object):
+    """
+    Writes afi files of at most max_transactions transactions, each
+    starting with header_line and ending with its own control record, under
+    temporary names until finish gives them their own.
+    """
+
+    def __init__(self, afi_name, header_line, max_transactions):
+        self.afi_name = afi_name
+        self.header_line = header_line
+        self.max_transactions = max_transactions
+        # (filename, ControlTotals) of every part started
+        self.parts = []
+        self.afi = None
+
+    # Get the ControlTotals of the part being written, starting a new part
+    # if the last one is finished
+    def part_totals(self):
+        if self.afi is None:
+            filename = temp_part_filename(self.afi_name, '.afi')
+            self.parts.append((filename, ControlTotals()))
+            self.afi = open(filename, 'w')
+            self.afi.write(self.header_line + '\n')
+        return self.parts[-1][1]
+
+    def write(self, line):
+        self.afi.write(line + '\n')
+        if self.parts[-1][1].transaction_count == self.max_transactions:
+            self.end_part()
+
+    # Finish the part being written, if it has any transactions
+    def end_part(self):
+        if self.afi is None:
+            return
+        totals = self.parts[-1][1]
+        self.afi.write(afi_encoder.encode_control(totals.transaction_total,
+            totals.transaction_count, totals.hash_total()) + '\n')
+        self.afi.close()
+        self.afi = None
+
+    # Rename the parts, once the last has ended, to their final names.
+    # Returns a list of (afi filename, ControlTotals).
+    def finish(self):
+        return rename_parts(self.parts, self.afi_name, '.afi')
+
+    def remove(self):
+        if self.afi is not None:
+            self.afi.close()
+            self.afi = None
+        remove_parts(self.parts)
+
+
+def consolidate(aba_filenames, afi_name, options=None,
+    max_transactions=MAX_BULK_TRANSACTIONS):
+    """
+    Convert aba_filenames, which must share a sender account number and
+    process date, into one afi upload: <afi_name>.afi, or <afi_name>_1.afi,
+    <afi_name>_2.afi and so on when there are more than max_transactions
+    transactions between them. The files are read one after another and
+    every record is checked as it would be converting the file on its own;
+    the header comes from the first file. Two files with the same records
+    fail the group, as their payments would be made twice. If anything
+    fails every part is removed. Returns a list of (afi filename,
+    ControlTotals).
+    """
+    if options is None:
+        options = ConversionOptions()
+    creation_date = options.get_creation_date()
+    context = afi_encoder.get_context()
+    expected = None
+    writer = None
+
+    digests = {}
+    for aba_filename in aba_filenames:
+        digest = content_digest(aba_filename)
+        if digest in digests:
+            raise ValueError(('{} has the same records as {}, their' +
+                ' payments would be made twice').format(aba_filename,
+                digests[digest]))
+        digests[digest] = aba_filename
+
+    try:
+        for aba_filename in aba_filenames:
+            details = sender_details(aba_filename)
+            if expected is None:
+                expected = details
+            elif details != expected:
+                raise InvalidFormatError(('{} has sender account {} and' +
+                    ' process date {}, not {} and {}').format(aba_filename,
+                    details[0], details[1], expected[0], expected[1]))
+
+            with open_file(aba_filename, 'r') as aba:
+                for record, account_number, sender_account_name in (
+                    with_sender_details(AbaFile().iter_records(aba))):
+
+                    if record[0] == '1':
+                        # every file starts with a header, checked above
+                        writer.write(convert_record(record, account_number,
+                            sender_account_name, writer.part_totals(),
+                            options, creation_date))
+                    elif record[0] == '0':
+                        header_line = convert_record(record, account_number,
+                            sender_account_name, None, options, creation_date,
+                            context)
+                        if writer is None:
+                            writer = PartWriter(afi_name, header_line,
+                                max_transactions)
+                    elif record[0] != '7':
+                        convert_record(record, account_number,
+                            sender_account_name, None, options, creation_date)
+        if writer is not None:
+            writer.end_part()
+    except Exception:
+        if writer is not None:
+            writer.remove()
+        raise
+
+    if writer is None:
+        return []
+    return writer.finish()
+
+
+# Result dict of a group of files, like batch.convert_one gives for a file
+def _failed(result, e):
+    result.update({
+        'status': 'failed',
+        'outputs': [],
+        'error_type': e.__class__.__name__,
+        'error': str(e),
+    })
+    return result
+
+
+def consolidate_all(aba_filenames, output_dir, options=None):
+    """
+    Group aba_filenames by sender account number and process date and
+    consolidate each group into output_dir as
+    <sender account>_<process date>.afi. Returns a result dict for every
+    group: files, sender_account, process_date, status ('converted' or
+    'failed'), outputs, transaction_count, transaction_total, hash_total,
+    and error and error_type when the group failed. Files whose details
+    can't be read fail in a group of their own.
+    """
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    groups, errors = group_files(aba_filenames)
+
+    results = [_failed({'files': [filename]}, e) for filename, e in errors]
+    for (account_number, process_date), filenames in groups:
+        result = {
+            'files': filenames,
+            'sender_account': account_number,
+            'process_date': process_date,
+        }
+        afi_name = os.path.join(output_dir,
+            '{}_{}'.format(account_number, process_date))
+        try:
+            parts = consolidate(filenames, afi_name, options)
+        except Exception as e:
+            results.append(_failed(result, e))
+            continue
+
+        totals = ControlTotals()
+        for afi_filename, part_totals in parts:
+            totals.merge(part_totals)
+        result.update({
+            'status': 'converted',
+            'outputs': [afi_filename for afi_filename, part_totals in parts],
+            'transaction_count': totals.transaction_count,
+            'transaction_total': totals.transaction_total,
+            'hash_total': totals.hash_total(),
+        })
+        results.append(result)
+    return results
+
+
+# Summary of consolidate_all to be written out as json
+def consolidate_report(results):
+    failed = [result for result in results if result['status'] == 'failed']
+    return {
+        'groups': results,
+        'converted': len(results) - len(failed),
+        'failed': len(failed),
+    }
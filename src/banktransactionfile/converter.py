@@ -0,0 +1,390 @@
+# converter.py
+# banktransactionfile.converter
+#
+# Converts ABA records into AFI records. Nothing in here keeps state between
+# calls, so one process can convert any number of files one after another,
+# or at the same time from several threads.
+
+import datetime #for current date
+import functools
+import os # for file path commands
+import re # regex used to validate names
+from collections import deque
+
+from banktransactionfile import compression
+from banktransactionfile.aba.file import AbaFile, InvalidFormatError
+from banktransactionfile.aba.mapped import MappedAbaFile
+from banktransactionfile.aba import record as aba_record
+from banktransactionfile.afi import encoder as afi_encoder
+from banktransactionfile.afi import field
+from banktransactionfile.afi.field import ValidationError
+
+
+class ConversionOptions(object):
+    """
+    Values AFI files need that ABA files don't carry.
+
+    transaction_code - 50 = standard credit
+    file_type - 7 = Direct credit
+    creation_date - YYMMDD, todays date is used when not given
+    reader - 'stream' reads the source line by line, 'mmap' memory-maps it
+        (the source must then be a real file)
+    """
+    READERS = ('stream', 'mmap')
+
+    def __init__(self, transaction_code=50, file_type=7, creation_date=None,
+        reader='stream'):
+        if reader not in self.READERS:
+            raise ValueError('reader must be one of {}'.format(self.READERS))
+        self.transaction_code = transaction_code
+        self.file_type = file_type
+        self.creation_date = creation_date
+        self.reader = reader
+
+    def get_creation_date(self):
+        if self.creation_date is None:
+            return get_current_date()
+        return self.creation_date
+
+
+# Get todays date
+def get_current_date():
+    current_date = datetime.datetime.today().strftime('%y%m%d')
+    return current_date
+
+# Matches the characters convert_to_valid_chars removes
+INVALID_CHARS = re.compile('[^{}]'.format(re.escape(field.TEXT_CHARS)))
+
+# Cleaned values kept by convert_to_valid_chars
+VALID_CHARS_CACHE_SIZE = 16384
+
+# Check business name have valid names and remove disallowed characters.
+# Payroll files repeat the same payees and references every run, so the
+# most recently cleaned values are cached.
+@functools.lru_cache(maxsize=VALID_CHARS_CACHE_SIZE)
+def convert_to_valid_chars(input_string):
+    output_string = INVALID_CHARS.sub('', input_string)
+    return output_string
+
+
+#######################################################
+#                                                     #
+#                  Control Functions                  #
+#                                                     #
+#######################################################
+
+# Adds all transaction hashes together and truncates as specified
+# by afi requirements
+def calculate_hashing(payment_hash):
+    hash_total = 0
+
+    for account in payment_hash:
+        hash_total += int(account[1:13])
+
+    hash_total = str(hash_total) #cast to string to use len methods
+    return str(hash_total[-11:])
+
+
+# Running control totals, updated as each transaction record passes so the
+# control record can be built without keeping the transactions around.
+class ControlTotals(object):
+
+    def __init__(self):
+        # Total number of cents to send
+        self.transaction_total = 0
+        # Total number of transactions.
+        self.transaction_count = 0
+        # Sum of account hashes, truncated when the control record is built
+        self.hash_sum = 0
+
+    def add(self, receiver_account, amount_to_send):
+        self.transaction_count += 1
+        self.transaction_total += int(amount_to_send)
+        self.hash_sum += int(receiver_account[1:13])
+
+    # Add the totals of another part of the same file
+    def merge(self, other):
+        self.transaction_count += other.transaction_count
+        self.transaction_total += other.transaction_total
+        self.hash_sum += other.hash_sum
+
+    def hash_total(self):
+        return str(self.hash_sum)[-11:]
+
+
+#######################################################
+#                                                     #
+#                     Conversion                      #
+#                                                     #
+#######################################################
+
+# Pair each aba record with the senders account number and name.
+# The senders account name comes from the first record (header) and the
+# senders account number from the second record (first transaction), so only
+# the first record is held back until the second one arrives.
+def with_sender_details(records):
+    first_record = None
+    account_number = None
+
+    for record in records:
+        if first_record is None:
+            first_record = record
+            sender_account_name = aba_record.get_sender_account_name(record)
+            sender_account_name = convert_to_valid_chars(sender_account_name)
+        elif account_number is None:
+            account_number = aba_record.get_sender_account_number(record)
+            yield first_record, account_number, sender_account_name
+            yield record, account_number, sender_account_name
+        else:
+            yield record, account_number, sender_account_name
+
+
+# Convert a stream of aba records into a stream of afi lines.
+# record_converter is convert_record, or one made by timed_record_converter
+# when the conversion is instrumented.
+def convert_records(records, options=None, totals=None,
+    record_converter=None):
+    if options is None:
+        options = ConversionOptions()
+    if totals is None:
+        totals = ControlTotals()
+    if record_converter is None:
+        record_converter = convert_record
+    creation_date = options.get_creation_date()
+    context = afi_encoder.get_context()
+
+    for record, account_number, sender_account_name in (
+        with_sender_details(records)):
+        yield record_converter(record, account_number, sender_account_name,
+            totals, options, creation_date, context)
+
+
+# Get the values of an afi transaction record from an aba detail record, in
+# the order afi_encoder.encode_transaction takes them
+def get_transaction_values(record, sender_account_name, options):
+    receiver_account = aba_record.get_receiver_account(record)
+    amount_to_send = aba_record.get_amount_to_send(record)
+
+    receiver_name = aba_record.get_reciever_name(record)
+    receiver_name = convert_to_valid_chars(receiver_name)
+    receiver_reference = aba_record.get_receiver_reference(record)
+    receiver_reference = convert_to_valid_chars(receiver_reference)
+
+    sender_business_reference = (
+        aba_record.get_sender_business_reference(record))
+    sender_business_reference = convert_to_valid_chars(
+        sender_business_reference)
+    return (receiver_account, options.transaction_code, amount_to_send,
+        receiver_name, receiver_reference, sender_account_name,
+        sender_business_reference)
+
+
+# Convert a single aba record into an afi line. A header is validated with
+# context, the afi_encoder.ValidationContext of the day the conversion
+# started; records that are only transactions can leave it out.
+def convert_record(record, account_number, sender_account_name, totals,
+    options, creation_date, context=None):
+
+    # Header Record
+    if record[0] == '0':
+        process_date = aba_record.get_process_date(record)
+        #listing_indicator = getListingIndicator(record)
+        #encode header to string and run validation checks
+        return context.encode_header(account_number,
+           options.file_type, process_date, creation_date)
+
+    # Transaction Record
+    elif record[0] == '1':
+        values = get_transaction_values(record, sender_account_name, options)
+        #update running totals and hash for control record
+        totals.add(values[0], values[2])
+        return afi_encoder.encode_transaction(*values)
+
+    # Control Record
+    elif record[0] == '7':
+        return afi_encoder.encode_control(totals.transaction_total,
+         totals.transaction_count, totals.hash_total())
+    else:
+        raise InvalidFormatError('First number of record must be 1, 2 or 7')
+
+
+
+def timed_record_converter(metrics):
+    """
+    Return a function that converts records like convert_record but adds
+    the time spent getting values out of the aba record ('extract') and
+    encoding and validating the afi line ('encode') to metrics, and counts
+    records by type and validation failures by field. Only instrumented
+    conversions use it, so others pay nothing for the timing.
+    """
+    timer = metrics.timer
+
+    def convert_record_timed(record, account_number, sender_account_name,
+        totals, options, creation_date, context=None):
+        record_type = record[0]
+        metrics.count_record(record_type)
+        start = timer()
+        try:
+            if record_type != '1':
+                return convert_record(record, account_number,
+                    sender_account_name, totals, options, creation_date,
+                    context)
+
+            values = get_transaction_values(record, sender_account_name,
+                options)
+            totals.add(values[0], values[2])
+            encode_start = timer()
+            metrics.add_time('extract', encode_start - start)
+            start = encode_start
+            return afi_encoder.encode_transaction(*values)
+        except ValidationError as e:
+            metrics.count_validation_failure(e.field)
+            raise
+        finally:
+            metrics.add_time('encode', timer() - start)
+
+    return convert_record_timed
+
+def convert(src_stream, dst_stream, options=None, metrics=None):
+    """
+    Read an ABA file from src_stream and write the AFI file to dst_stream.
+
+    Both are open text streams. Records are read, converted and written one
+    at a time so memory stays flat regardless of the size of the file.
+    With the 'mmap' reader src_stream is mapped from its start instead.
+    Pass a metrics.Metrics to time each stage and count what was converted.
+    Returns the ControlTotals of the converted file.
+    """
+    if options is None:
+        options = ConversionOptions()
+    totals = ControlTotals()
+    mapped_file = None
+    record_converter = convert_record
+
+    if metrics is not None:
+        metrics.start_run()
+        dst_stream = metrics.timed_writer(dst_stream)
+        record_converter = timed_record_converter(metrics)
+
+    try:
+        if options.reader == 'mmap':
+            mapped_file = MappedAbaFile(src_stream)
+            # every field of every record is converted, so whole records are
+            # decoded rather than field by field
+            records = (str(record) for record in mapped_file.iter_records())
+            if metrics is not None:
+                metrics.bytes_read += mapped_file.size
+        else:
+            if metrics is not None:
+                src_stream = metrics.timed_reader(src_stream)
+            records = AbaFile().iter_records(src_stream)
+
+        lines = convert_records(records, options, totals, record_converter)
+        try:
+            for line in lines:
+                dst_stream.write(line + '\n')
+        finally:
+            lines.close()
+            if mapped_file is not None:
+                mapped_file.close()
+    except Exception:
+        if metrics is not None:
+            metrics.end_run(failed=True)
+        raise
+
+    if metrics is not None:
+        metrics.end_run()
+    return totals
+
+
+def convert_file(aba_filename, afi_filename, options=None, metrics=None):
+    """
+    Convert the aba file at aba_filename and write the afi file to
+    afi_filename. A partially written file is removed if conversion fails
+    part way through. Returns the ControlTotals of the converted file.
+
+    A gzip, bz2 or xz compressed aba file is decompressed as it is read
+    (and can't be memory-mapped, so it is always read as a stream), and the
+    afi file is compressed when afi_filename ends in .gz, .bz2 or .xz.
+    """
+    if (options is not None and options.reader == 'mmap' and
+        compression.detect(aba_filename)):
+        options = ConversionOptions(options.transaction_code,
+            options.file_type, options.creation_date)
+
+    with compression.open_file(aba_filename, 'r') as aba, \
+        compression.open_file(afi_filename, 'w') as new_afi:
+        try:
+            return convert(aba, new_afi, options, metrics)
+        except Exception:
+            new_afi.close()
+            os.remove(afi_filename)
+            raise
+
+
+class Converter(object):
+    """
+    Converts ABA files with one set of ConversionOptions.
+
+    Everything a conversion changes lives in the call that makes it (the
+    encoders and the cache of cleaned text are shared and never change
+    what they give), so a single Converter can be shared by every thread of
+    a ThreadPoolExecutor and used for any number of conversions at once.
+    Give each conversion its own metrics.Metrics, they can be merged after.
+    """
+
+    def __init__(self, options=None):
+        if options is None:
+            options = ConversionOptions()
+        self.options = options
+
+    def convert(self, src_stream, dst_stream, metrics=None):
+        return convert(src_stream, dst_stream, self.options, metrics)
+
+    def convert_file(self, aba_filename, afi_filename, metrics=None):
+        return convert_file(aba_filename, afi_filename, self.options,
+            metrics)
+
+    def incremental(self):
+        """
+        Return an IncrementalConverter for one file fed in pieces.
+        """
+        return IncrementalConverter(self.options)
+
+
+class IncrementalConverter(object):
+    """
+    Converts an ABA file handed over a few lines at a time, for when the
+    file arrives in pieces (an upload) rather than as a stream that can be
+    read from.
+
+    feed() takes the next lines and returns the afi lines they complete;
+    finish() is called once every line has been fed and returns the rest,
+    ending with the control record. Structure and validation errors are
+    raised from whichever call meets them. totals holds the ControlTotals
+    so far.
+    """
+
+    def __init__(self, options=None):
+        self.totals = ControlTotals()
+        self.pending = deque()
+        self.lines = convert_records(AbaFile().iter_records(self.read()),
+            options, self.totals)
+
+    # The lines fed in, for iter_records. feed() never lets this run dry
+    # before finish() is called.
+    def read(self):
+        while self.pending:
+            yield self.pending.popleft()
+
+    def feed(self, lines):
+        self.pending.extend(lines)
+        output = []
+        # a record takes at most two lines to convert (the header waits for
+        # the first transaction), so one line is always kept back
+        while len(self.pending) > 1:
+            output.append(next(self.lines))
+        return output
+
+    def finish(self):
+        return list(self.lines)
@@ -0,0 +1,160 @@
+# duplicates.py
+# banktransactionfile.duplicates
+#
+# Flags payments that look like they were paid before. Every payment
+# converted is recorded in a SQLite index under its receiver account,
+# amount, reference and process date, and each transaction of a later
+# conversion is looked up there (and against the file's own earlier
+# transactions) as it is read. The index is keyed on those four values
+# without a separate rowid, so a lookup is one walk down a b-tree and stays
+# a handful of page reads with millions of payments recorded.
+#
+# A possible duplicate is only reported, the conversion still goes ahead.
+
+import sqlite3
+import time
+
+from banktransactionfile.aba import record as aba_record
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS payments (
+    account TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    reference TEXT NOT NULL,
+    process_date TEXT NOT NULL,
+    source TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    recorded TEXT NOT NULL,
+    PRIMARY KEY (account, amount, reference, process_date)
+) WITHOUT ROWID
+'''
+
+# Kilobytes of the index SQLite keeps in memory
+CACHE_KB = 64 * 1024
+
+# Seconds to wait for another process writing to the index
+DEFAULT_TIMEOUT = 30.0
+
+
+# Get the (receiver account, amount, reference, process date) a payment is
+# indexed under
+def payment_key(record, process_date):
+    return (aba_record.get_receiver_account(record),
+        aba_record.get_amount_to_send(record),
+        aba_record.get_receiver_reference(record), process_date)
+
+
+class PaymentIndex(object):
+    """
+    Payments recorded from earlier conversions, in the SQLite database at
+    filename, which is created when it doesn't exist. Several processes can
+    use the same index; a payment keeps the file and line it was first
+    recorded from.
+    """
+
+    def __init__(self, filename, timeout=DEFAULT_TIMEOUT):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename, timeout=timeout)
+        # readers carry on while a conversion records its payments
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        # keeps the upper levels of a large index in memory
+        self.connection.execute('PRAGMA cache_size=-{}'.format(CACHE_KB))
+        self.connection.execute(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def find(self, key):
+        """
+        Return (source, line, recorded) of the payment recorded under key,
+        or None.
+        """
+        return self.connection.execute('SELECT source, line, recorded' +
+            ' FROM payments WHERE account = ? AND amount = ?' +
+            ' AND reference = ? AND process_date = ?', key).fetchone()
+
+    def add(self, payments, source):
+        """
+        Record payments, a list of (key, line number), as coming from
+        source. Payments already recorded are left as they were.
+        """
+        recorded = time.strftime('%Y-%m-%d %H:%M:%S')
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO payments' +
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key + (source, line_number, recorded)
+                    for key, line_number in payments))
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM payments').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+class DuplicateCheck(object):
+    """
+    Looks up the transactions of one aba file, source, in index as they are
+    read. found is the list of possible duplicates so far, each a dict of
+    line, account, amount, reference, process_date and duplicate_of (the
+    file, line and, for payments from earlier conversions, the time it was
+    recorded). The file's payments are only added to the index by commit,
+    once it has converted.
+    """
+
+    def __init__(self, index, source):
+        self.index = index
+        self.source = source
+        self.process_date = None
+        self.found = []
+        # key: line number of the payments of this file
+        self.seen = {}
+        self.payments = []
+
+    def check_record(self, line_number, record):
+        if record[0] == '0':
+            self.process_date = aba_record.get_process_date(record)
+        elif record[0] == '1':
+            key = payment_key(record, self.process_date)
+            if key in self.seen:
+                self.flag(line_number, key, (self.source, self.seen[key],
+                    None))
+                return
+            previous = self.index.find(key)
+            if previous is not None:
+                self.flag(line_number, key, previous)
+            self.seen[key] = line_number
+            self.payments.append((key, line_number))
+
+    def check_lines(self, lines):
+        """
+        Check an aba file given as an iterable of lines without converting
+        it, for a file whose afi files come from somewhere else.
+        """
+        for line_number, line in enumerate(lines, 1):
+            self.check_record(line_number, line.rstrip('\r\n'))
+
+    def flag(self, line_number, key, previous):
+        account, amount, reference, process_date = key
+        source, previous_line, recorded = previous
+        self.found.append({
+            'line': line_number,
+            'account': account,
+            'amount': amount,
+            'reference': reference,
+            'process_date': process_date,
+            'duplicate_of': {
+                'file': source,
+                'line': previous_line,
+                'recorded': recorded,
+            },
+        })
+
+    def commit(self):
+        self.index.add(self.payments, self.source)
+        self.payments = []
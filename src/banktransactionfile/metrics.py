@@ -0,0 +1,215 @@
+# metrics.py
+# banktransactionfile.metrics
+#
+# Optional instrumentation of conversions. A Metrics object passed to
+# convert() collects time per stage, record and byte counts and validation
+# failures, and can be written out as json or as a Prometheus text file.
+# Nothing here runs unless a Metrics object is passed in.
+
+import json
+import os # for file path commands
+import time
+import tracemalloc
+
+# Stages conversions are timed in:
+# read - reading the aba file (I/O)
+# extract - the aba.record get_* helpers and cleaning their values
+# encode - building and validating afi lines (the compiled encoders validate
+#     as they go, so this includes Field validation)
+# write - writing the afi file (I/O)
+STAGES = ('read', 'extract', 'encode', 'write')
+
+
+class TimedReader(object):
+    """
+    Iterates over the lines of a stream, adding the time spent reading to
+    the 'read' stage and the size of each line to bytes_read.
+    """
+
+    def __init__(self, stream, metrics):
+        self.lines = iter(stream)
+        self.metrics = metrics
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = self.metrics.timer()
+        try:
+            line = next(self.lines)
+        finally:
+            self.metrics.add_time('read', self.metrics.timer() - start)
+        self.metrics.bytes_read += len(line)
+        return line
+
+
+class TimedWriter(object):
+    """
+    Writes to a stream, adding the time spent to the 'write' stage and the
+    size of what was written to bytes_written.
+    """
+
+    def __init__(self, stream, metrics):
+        self.stream = stream
+        self.metrics = metrics
+
+    def write(self, data):
+        start = self.metrics.timer()
+        self.stream.write(data)
+        self.metrics.add_time('write', self.metrics.timer() - start)
+        self.metrics.bytes_written += len(data)
+
+
+class Metrics(object):
+    """
+    Counters and timers for one or more conversions.
+
+    Values add up over every run the object is passed to, like Prometheus
+    counters. With trace_memory the peak memory allocated by python during
+    each run is measured with tracemalloc, which slows conversion down.
+    """
+    timer = staticmethod(time.perf_counter)
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stage_seconds = dict((stage, 0.0) for stage in STAGES)
+        # records seen, by record type
+        self.records = {}
+        # validation failures, by Field class name
+        self.validation_failures = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.runs = 0
+        self.failed_runs = 0
+        self.run_seconds = 0.0
+        # highest peak of any run, in bytes, when trace_memory is on
+        self.peak_memory = None
+        self._run_start = None
+        self._tracing = False
+
+    def add_time(self, stage, seconds):
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0) + seconds
+
+    def count_record(self, record_type):
+        self.records[record_type] = self.records.get(record_type, 0) + 1
+
+    def count_validation_failure(self, field):
+        field = field or 'unknown'
+        self.validation_failures[field] = (
+            self.validation_failures.get(field, 0) + 1)
+
+    def timed_reader(self, stream):
+        return TimedReader(stream, self)
+
+    def timed_writer(self, stream):
+        return TimedWriter(stream, self)
+
+    def start_run(self):
+        if self.trace_memory:
+            self._tracing = not tracemalloc.is_tracing()
+            if self._tracing:
+                tracemalloc.start()
+            else:
+                tracemalloc.reset_peak()
+        self._run_start = self.timer()
+
+    def end_run(self, failed=False):
+        self.run_seconds += self.timer() - self._run_start
+        self.runs += 1
+        if failed:
+            self.failed_runs += 1
+
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            self.peak_memory = max(peak, self.peak_memory or 0)
+            if self._tracing:
+                tracemalloc.stop()
+                self._tracing = False
+
+    def merge(self, other):
+        """
+        Add the values of another Metrics, for example one filled in by a
+        worker process.
+        """
+        for stage, seconds in other.stage_seconds.items():
+            self.add_time(stage, seconds)
+        for record_type, count in other.records.items():
+            self.records[record_type] = (
+                self.records.get(record_type, 0) + count)
+        for field, count in other.validation_failures.items():
+            self.validation_failures[field] = (
+                self.validation_failures.get(field, 0) + count)
+        self.bytes_read += other.bytes_read
+        self.bytes_written += other.bytes_written
+        self.runs += other.runs
+        self.failed_runs += other.failed_runs
+        self.run_seconds += other.run_seconds
+        if other.peak_memory is not None:
+            self.peak_memory = max(other.peak_memory, self.peak_memory or 0)
+
+    def as_dict(self):
+        return {
+            'runs': self.runs,
+            'failed_runs': self.failed_runs,
+            'run_seconds': self.run_seconds,
+            'stage_seconds': dict(self.stage_seconds),
+            'records': dict(self.records),
+            'validation_failures': dict(self.validation_failures),
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'peak_memory_bytes': self.peak_memory,
+        }
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix='aba2afi'):
+        """
+        Return the metrics in the Prometheus text format, for the node
+        exporter textfile collector.
+        """
+        lines = []
+
+        def label(name, value):
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+            return '{{{}="{}"}}'.format(name, value)
+
+        def add(name, kind, samples):
+            lines.append('# TYPE {}_{} {}'.format(prefix, name, kind))
+            for labels, value in samples:
+                lines.append('{}_{}{} {}'.format(prefix, name, labels,
+                    value))
+
+        add('runs_total', 'counter', [('', self.runs)])
+        add('failed_runs_total', 'counter', [('', self.failed_runs)])
+        add('run_seconds_total', 'counter', [('', self.run_seconds)])
+        add('stage_seconds_total', 'counter',
+            [(label('stage', stage), seconds)
+            for stage, seconds in sorted(self.stage_seconds.items())])
+        add('records_total', 'counter',
+            [(label('record_type', record_type), count)
+            for record_type, count in sorted(self.records.items())])
+        add('validation_failures_total', 'counter',
+            [(label('field', field), count)
+            for field, count in sorted(self.validation_failures.items())])
+        add('read_bytes_total', 'counter', [('', self.bytes_read)])
+        add('written_bytes_total', 'counter', [('', self.bytes_written)])
+        if self.peak_memory is not None:
+            add('peak_memory_bytes', 'gauge', [('', self.peak_memory)])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename):
+        """
+        Write the metrics to filename, in the Prometheus text format if it
+        ends in .prom and as json otherwise. The file is replaced in one
+        step so a collector never reads half of it.
+        """
+        if filename.endswith('.prom'):
+            text = self.to_prometheus()
+        else:
+            text = self.to_json() + '\n'
+
+        temp_filename = filename + '.tmp'
+        with open(temp_filename, 'w') as f:
+            f.write(text)
+        os.rename(temp_filename, filename)
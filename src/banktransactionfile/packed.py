@@ -0,0 +1,445 @@
+# packed.py
+# banktransactionfile.packed
+#
+# Parsed ABA batches saved as a compact binary file, so a file that is read
+# again and again (to convert it, audit it or reconcile it) is only sliced
+# up once. Every value the afi transaction record is built from is taken
+# out of the detail records the way a conversion takes it and saved in
+# typed columns: accounts and amounts as numbers, names and references as
+# indexes into a pool that holds each distinct string once. The file is
+# memory-mapped to be read, so opening one costs nothing however large it is
+# and the columns are used where they lie. Converting a packed batch gives
+# the same afi files as split.convert_split gives for its aba file.
+#
+# Layout, little endian, each section starting on an 8 byte boundary:
+#   header      HEADER
+#   columns     COLUMNS in order, one value per transaction record
+#   pool        offset of the end of each string (uint64), then the strings
+#               one after another as utf-8
+
+import mmap
+import os # for file path commands
+import struct
+import sys
+from array import array
+
+from banktransactionfile.aba import record as aba_record
+from banktransactionfile.aba.file import AbaFile, InvalidFormatError
+from banktransactionfile.afi import encoder as afi_encoder
+from banktransactionfile.afi.record import MAX_BULK_TRANSACTIONS
+from banktransactionfile.compression import add_extension, open_file
+from banktransactionfile.converter import (ConversionOptions, ControlTotals,
+    get_transaction_values, with_sender_details)
+from banktransactionfile.split import (remove_parts, rename_parts,
+    temp_part_filename)
+
+MAGIC = b'ABAPACK\x00'
+
+# Bump when the layout changes, files of other versions are refused
+VERSION = 1
+
+# Extension of packed batch files
+PACKED_EXTENSION = 'abp'
+
+# magic, version, transaction count, transactions with an odd value, string
+# count, size of the string data, and the process date, sender account
+# number and sender account name as pool indexes
+HEADER = struct.Struct('<8sIQQQQIII')
+
+# Flags of a transaction. An account that isn't 15 or 16 digits, or an
+# amount that isn't 9 digits, is odd: its column holds the pool index of the text
+# instead, so a packed batch converts exactly as the aba file does.
+ODD_ACCOUNT = 1
+ODD_AMOUNT = 2
+LONG_ACCOUNT = 4 # 16 digit account
+
+# (name, array typecode) of the columns. 8 byte columns come first so every
+# column stays aligned.
+COLUMNS = (
+    ('account', 'Q'), # digits of the account, or pool index
+    ('hash', 'Q'), # account[1:13] that is hashed, 0 for odd accounts
+    ('line', 'I'), # line of the aba file the record is on
+    ('amount', 'I'), # cents, or pool index
+    ('name', 'I'), # get_reciever_name, valid characters only
+    ('reference', 'I'), # get_receiver_reference, valid characters only
+    ('business_reference', 'I'), # get_sender_business_reference, the same
+    ('flags', 'B'),
+)
+
+ENCODING = 'utf-8'
+
+
+# Bytes of padding that bring size up to a multiple of 8
+def _padding(size):
+    return -size % 8
+
+
+def has_packed_extension(filename):
+    return filename.split('.')[-1] == PACKED_EXTENSION
+
+
+# Columns are saved little endian, and byte swapped where that isn't native
+def _to_file(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class StringPool(object):
+    """
+    Distinct strings, numbered in the order they were added.
+    """
+
+    def __init__(self):
+        self.indexes = {}
+        self.ends = array('Q')
+        self.data = bytearray()
+
+    def add(self, text):
+        index = self.indexes.get(text)
+        if index is None:
+            index = self.indexes[text] = len(self.ends)
+            self.data += text.encode(ENCODING)
+            self.ends.append(len(self.data))
+        return index
+
+    def __len__(self):
+        return len(self.ends)
+
+
+#######################################################
+#                                                     #
+#                      Packing                        #
+#                                                     #
+#######################################################
+
+class Packer(object):
+    """
+    Builds a packed batch from aba records, added in file order along with
+    the sender account number and name with_sender_details pairs them with.
+    """
+
+    def __init__(self):
+        self.options = ConversionOptions()
+        self.pool = StringPool()
+        self.columns = dict((name, array(typecode))
+            for name, typecode in COLUMNS)
+        self.odd_count = 0
+        self.process_date = None
+        self.account_number = None
+        self.sender_account_name = None
+
+    def add(self, line_number, record, account_number, sender_account_name):
+        self.account_number = account_number
+        self.sender_account_name = sender_account_name
+
+        if record[0] == '1':
+            if self.process_date is None:
+                raise InvalidFormatError('ABA file must start with a header' +
+                    ' record to be split')
+            self.add_transaction(line_number, record)
+        elif record[0] == '0':
+            self.process_date = aba_record.get_process_date(record)
+        elif record[0] != '7':
+            raise InvalidFormatError('First number of record must be 1, 2 or 7')
+
+    def add_transaction(self, line_number, record):
+        columns = self.columns
+        pool = self.pool
+        (account, transaction_code, amount, name, reference,
+            sender_account_name, business_reference) = (
+            get_transaction_values(record, None, self.options))
+        flags = 0
+
+        if len(account) in (15, 16) and account.isascii() and (
+            account.isdigit()):
+            if len(account) == 16:
+                flags |= LONG_ACCOUNT
+            columns['account'].append(int(account))
+            columns['hash'].append(int(account[1:13]))
+        else:
+            flags |= ODD_ACCOUNT
+            columns['account'].append(pool.add(account))
+            columns['hash'].append(0)
+
+        if len(amount) == 9 and amount.isascii() and amount.isdigit():
+            columns['amount'].append(int(amount))
+        else:
+            flags |= ODD_AMOUNT
+            columns['amount'].append(pool.add(amount))
+
+        if flags & (ODD_ACCOUNT | ODD_AMOUNT):
+            self.odd_count += 1
+        columns['line'].append(line_number)
+        columns['name'].append(pool.add(name))
+        columns['reference'].append(pool.add(reference))
+        columns['business_reference'].append(pool.add(business_reference))
+        columns['flags'].append(flags)
+
+    def write(self, f):
+        pool = self.pool
+        header_strings = (pool.add(self.process_date),
+            pool.add(self.account_number), pool.add(self.sender_account_name))
+        header = HEADER.pack(MAGIC, VERSION, len(self.columns['line']),
+            self.odd_count, len(pool), len(pool.data), *header_strings)
+        f.write(header + b'\0' * _padding(len(header)))
+        for name, typecode in COLUMNS:
+            data = _to_file(self.columns[name])
+            f.write(data + b'\0' * _padding(len(data)))
+        data = _to_file(pool.ends)
+        f.write(data)
+        f.write(bytes(pool.data))
+
+
+def pack_file(aba_filename, packed_filename):
+    """
+    Parse the aba file at aba_filename (which can be gzip, bz2 or xz
+    compressed) and save it as a packed batch at packed_filename. The record
+    structure is checked as a split conversion checks it and the same
+    InvalidFormatErrors are raised; field values are only validated when
+    the batch is converted. The file is written under a temporary name and
+    renamed into place, so a failure leaves nothing behind. Returns the
+    number of transactions packed.
+    """
+    packer = Packer()
+    with open_file(aba_filename, 'r') as aba:
+        for line_number, (record, account_number, sender_account_name) in (
+            enumerate(with_sender_details(AbaFile().iter_records(aba)), 1)):
+            packer.add(line_number, record, account_number,
+                sender_account_name)
+
+    temp_filename = packed_filename + '.tmp'
+    try:
+        with open(temp_filename, 'wb') as f:
+            packer.write(f)
+        os.replace(temp_filename, packed_filename)
+    except Exception:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+    return len(packer.columns['line'])
+
+
+#######################################################
+#                                                     #
+#                      Reading                        #
+#                                                     #
+#######################################################
+
+class PackedBatch(object):
+    """
+    A packed batch, memory-mapped from the file at filename.
+
+    Each of the COLUMNS is an attribute holding one value per transaction,
+    a memoryview into the map (a copy where the machine isn't little
+    endian). process_date, account_number and sender_account_name are
+    those of the header and first transaction as a conversion takes them.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise InvalidFormatError('{} is not a packed ABA batch'.format(
+                    filename))
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        try:
+            (magic, version, self.transaction_count, self.odd_count,
+                string_count, data_size, process_date, account_number,
+                sender_account_name) = HEADER.unpack_from(self._map)
+            if magic != MAGIC:
+                raise InvalidFormatError('{} is not a packed ABA batch'.format(
+                    filename))
+            if version != VERSION:
+                raise InvalidFormatError(('{} is a version {} packed batch,' +
+                    ' not {}').format(filename, version, VERSION))
+
+            offset = HEADER.size + _padding(HEADER.size)
+            for name, typecode in COLUMNS:
+                offset = self._column(name, typecode, offset,
+                    self.transaction_count)
+            offset = self._column('_ends', 'Q', offset, string_count)
+            self._check_size(offset + data_size)
+            self._data = self._view[offset:offset + data_size]
+        except Exception:
+            self.close()
+            raise
+
+        self._strings = None
+        self.process_date = self.string(process_date)
+        self.account_number = self.string(account_number)
+        self.sender_account_name = self.string(sender_account_name)
+
+    # Set attribute name to a column of count values starting at offset and
+    # return where the next section starts
+    def _column(self, name, typecode, offset, count):
+        size = array(typecode).itemsize * count
+        self._check_size(offset + size)
+        column = self._view[offset:offset + size].cast(typecode)
+        if sys.byteorder == 'big':
+            column = array(typecode, column)
+            column.byteswap()
+        setattr(self, name, column)
+        return offset + size + _padding(size)
+
+    def _check_size(self, size):
+        if len(self._map) < size:
+            raise InvalidFormatError('{} is cut short'.format(self.filename))
+
+    @property
+    def strings(self):
+        # every string of the pool, decoded the first time one is asked for
+        if self._strings is None:
+            data = self._data.tobytes()
+            # the ends are offsets of bytes, so a pool that is all ascii
+            # (the usual) is decoded in one go and cut up, any other string
+            # by string
+            is_ascii = data.isascii()
+            if is_ascii:
+                data = data.decode(ENCODING)
+            start = 0
+            strings = []
+            for end in self._ends:
+                text = data[start:end]
+                strings.append(text if is_ascii else text.decode(ENCODING))
+                start = end
+            self._strings = strings
+        return self._strings
+
+    def string(self, index):
+        return self.strings[index]
+
+    def __len__(self):
+        return self.transaction_count
+
+    def iter_transaction_values(self, options, start=0, stop=None):
+        """
+        Yield the values of transactions start to stop in the order
+        afi_encoder.encode_transaction takes them, the same as
+        converter.get_transaction_values gives for their aba records.
+        """
+        strings = self.strings
+        transaction_code = options.transaction_code
+        sender_account_name = self.sender_account_name
+
+        for account, amount, name, reference, business_reference, flags in (
+            zip(self.account[start:stop], self.amount[start:stop],
+            self.name[start:stop], self.reference[start:stop],
+            self.business_reference[start:stop], self.flags[start:stop])):
+            if flags & ODD_ACCOUNT:
+                account = strings[account]
+            elif flags & LONG_ACCOUNT:
+                account = '{:016d}'.format(account)
+            else:
+                account = '{:015d}'.format(account)
+            if flags & ODD_AMOUNT:
+                amount = strings[amount]
+            else:
+                amount = '{:09d}'.format(amount)
+            yield (account, transaction_code, amount, strings[name],
+                strings[reference], sender_account_name,
+                strings[business_reference])
+
+    def transaction_values(self, n, options):
+        return next(self.iter_transaction_values(options, n, n + 1))
+
+    def totals(self, start=0, stop=None):
+        """
+        Return the ControlTotals of transactions start to stop, raising what
+        ControlTotals.add raises for a value a conversion can't total.
+        """
+        if stop is None:
+            stop = self.transaction_count
+        totals = ControlTotals()
+        if self.odd_count:
+            for values in self.iter_transaction_values(ConversionOptions(),
+                start, stop):
+                totals.add(values[0], values[2])
+            return totals
+        # every value is a number, so the columns are summed as they are
+        amounts = self.amount[start:stop]
+        totals.transaction_count = len(amounts)
+        totals.transaction_total = sum(amounts)
+        totals.hash_sum = sum(self.hash[start:stop])
+        return totals
+
+    def close(self):
+        for name, typecode in COLUMNS + (('_ends', 'Q'),):
+            column = getattr(self, name, None)
+            if isinstance(column, memoryview):
+                column.release()
+        if getattr(self, '_data', None) is not None:
+            self._data.release()
+        self._view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+#######################################################
+#                                                     #
+#                     Conversion                      #
+#                                                     #
+#######################################################
+
+def convert_packed(packed_filename, afi_name, options=None,
+    max_transactions=MAX_BULK_TRANSACTIONS, compression=None):
+    """
+    Convert the packed batch at packed_filename into afi files of at most
+    max_transactions transactions each, named as split.convert_split names
+    them and compressed the same way when compression is given. Values are
+    validated as they are encoded, and if anything fails every part is
+    removed. Returns a list of (afi filename, ControlTotals).
+    """
+    if options is None:
+        options = ConversionOptions()
+    extension = add_extension('.afi', compression)
+    context = afi_encoder.get_context()
+    encode_transaction = afi_encoder.encode_transaction
+    # (filename, ControlTotals) of every part started
+    parts = []
+    afi = None
+
+    with PackedBatch(packed_filename) as batch:
+        try:
+            header_line = context.encode_header(batch.account_number,
+                options.file_type, batch.process_date,
+                options.get_creation_date())
+
+            for start in range(0, len(batch), max_transactions):
+                stop = min(start + max_transactions, len(batch))
+                filename = temp_part_filename(afi_name, extension)
+                if batch.odd_count:
+                    # totalled as each line is encoded, so a value that
+                    # can't be totalled fails where the aba file would
+                    totals = ControlTotals()
+                else:
+                    totals = batch.totals(start, stop)
+                parts.append((filename, totals))
+                afi = open_file(filename, 'w', compression)
+                afi.write(header_line + '\n')
+
+                for values in batch.iter_transaction_values(options, start,
+                    stop):
+                    if batch.odd_count:
+                        totals.add(values[0], values[2])
+                    afi.write(encode_transaction(*values) + '\n')
+
+                afi.write(afi_encoder.encode_control(totals.transaction_total,
+                    totals.transaction_count, totals.hash_total()) + '\n')
+                afi.close()
+                afi = None
+        except Exception:
+            if afi is not None:
+                afi.close()
+            remove_parts(parts)
+            raise
+
+    return rename_parts(parts, afi_name, extension)
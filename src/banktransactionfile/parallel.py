@@ -0,0 +1,99 @@
+# parallel.py
+# banktransactionfile.parallel
+#
+# Converts one large ABA file on several processes. Transaction records are
+# sent to a process pool in chunks, each chunk comes back as finished afi
+# lines plus its control totals, and the chunks are written in the order they
+# were read so the output is the same as convert() gives.
+
+import multiprocessing
+from collections import deque
+
+from banktransactionfile.aba.file import AbaFile, InvalidFormatError
+from banktransactionfile.afi import encoder as afi_encoder
+from banktransactionfile.converter import (ConversionOptions, ControlTotals,
+    convert_record, with_sender_details)
+
+# Transaction records sent to a worker at a time
+CHUNK_SIZE = 10000
+
+
+# Runs in a worker process: convert a chunk of transaction records
+def convert_chunk(records, account_number, sender_account_name, options,
+    creation_date):
+    totals = ControlTotals()
+    lines = [convert_record(record, account_number, sender_account_name,
+        totals, options, creation_date) for record in records]
+    lines.append('')
+    return '\n'.join(lines), totals
+
+
+def convert_parallel(src_stream, dst_stream, options=None, processes=None,
+    chunk_size=CHUNK_SIZE, pool=None):
+    """
+    Convert like convert() but encode transaction records on a process pool.
+
+    processes defaults to the number of CPUs. An existing multiprocessing
+    pool can be passed in to be reused, it is left open. At most two chunks
+    per process are in flight, so memory stays bounded. Errors are raised in
+    the same order a serial run would meet them.
+    Returns the ControlTotals of the converted file.
+    """
+    if options is None:
+        options = ConversionOptions()
+    creation_date = options.get_creation_date()
+    context = afi_encoder.get_context()
+    totals = ControlTotals()
+    own_pool = pool is None
+    if own_pool:
+        pool = multiprocessing.Pool(processes)
+    max_pending = 2 * (processes or multiprocessing.cpu_count())
+    # chunks sent to the pool, in file order
+    pending = deque()
+    chunk = []
+
+    def send_chunk():
+        if chunk:
+            pending.append(pool.apply_async(convert_chunk, (list(chunk),
+                account_number, sender_account_name, options, creation_date)))
+            del chunk[:]
+
+    def write_pending(limit):
+        while len(pending) > limit:
+            text, chunk_totals = pending.popleft().get()
+            totals.merge(chunk_totals)
+            dst_stream.write(text)
+
+    try:
+        try:
+            for record, account_number, sender_account_name in (
+                with_sender_details(AbaFile().iter_records(src_stream))):
+
+                if record[0] == '1':
+                    chunk.append(record)
+                    if len(chunk) >= chunk_size:
+                        send_chunk()
+                        write_pending(max_pending)
+                else:
+                    # header, control and unknown records are converted here
+                    # once every record before them has been written, the
+                    # control record needs the totals of all of them
+                    send_chunk()
+                    write_pending(0)
+                    dst_stream.write(convert_record(record, account_number,
+                        sender_account_name, totals, options, creation_date,
+                        context) + '\n')
+        except InvalidFormatError:
+            # lines before a bad record are still converted first, so their
+            # errors are raised ahead of it as in a serial run
+            write_pending(0)
+            raise
+
+        send_chunk()
+        write_pending(0)
+    finally:
+        if own_pool:
+            pool.terminate()
+            pool.join()
+
+    return totals
@@ -0,0 +1,175 @@
+# preflight.py
+# banktransactionfile.preflight
+#
+# Checks an ABA file for everything that would stop it converting, in one
+# pass and without building or writing any AFI records. Conversion stops at
+# the first problem; this carries on and reports every one with its line
+# number, so a file can be fixed in one go and checked cheaply before it is
+# accepted.
+
+from banktransactionfile import compression
+from banktransactionfile.aba import record as aba_record
+from banktransactionfile.aba.file import AbaFile
+from banktransactionfile.afi import encoder as afi_encoder
+from banktransactionfile.afi.record import MAX_BULK_TRANSACTIONS
+from banktransactionfile.converter import (ConversionOptions, ControlTotals,
+    convert_to_valid_chars, get_transaction_values)
+
+RECORD_NAMES = {
+    '0': 'header',
+    '1': 'transaction',
+    '7': 'control',
+}
+
+
+class Preflight(object):
+    """
+    Checks the records of one ABA file as they are fed in, the same way a
+    conversion into afi files of at most max_transactions transactions
+    would. errors is the list of (line number, message) found so far; the
+    line number is None for problems with the file as a whole.
+    """
+
+    def __init__(self, options=None, max_transactions=MAX_BULK_TRANSACTIONS):
+        if options is None:
+            options = ConversionOptions()
+        self.options = options
+        self.creation_date = options.get_creation_date()
+        # dates are checked against the day the check started on
+        self.context = afi_encoder.get_context()
+        self.max_transactions = max_transactions
+        self.errors = []
+        self.record_type_count = {}
+        # the first record waits for the second, which has the senders
+        # account number
+        self.first_record = None
+        self.account_number = None
+        self.sender_account_name = None
+        self.header_seen = False
+        # totals of the afi file being filled, for its control record
+        self.part_totals = ControlTotals()
+        self.last_transaction = None
+
+    def error(self, line_number, message):
+        self.errors.append((line_number, message))
+
+    def field_errors(self, line_number, errors, prefix=''):
+        for arg, message in errors:
+            self.error(line_number, '{}{}: {}'.format(prefix, arg, message))
+
+    def check_line(self, line_number, line):
+        record = line.rstrip('\r\n')
+        if len(record) != AbaFile.RECORD_LENGTH:
+            self.error(line_number, 'record is {} characters long, not {}'
+                .format(len(record), AbaFile.RECORD_LENGTH))
+            return
+
+        record_type = record[0]
+        count = self.record_type_count.get(record_type, 0) + 1
+        self.record_type_count[record_type] = count
+        if count > 1 and record_type in '07':
+            self.error(line_number, 'more than one {} record'.format(
+                RECORD_NAMES[record_type]))
+            return
+
+        if self.first_record is None:
+            self.first_record = (line_number, record)
+            self.sender_account_name = convert_to_valid_chars(
+                aba_record.get_sender_account_name(record))
+            return
+        if self.account_number is None:
+            self.account_number = aba_record.get_sender_account_number(
+                record)
+            self.check_record(*self.first_record)
+        self.check_record(line_number, record)
+
+    def check_record(self, line_number, record):
+        record_type = record[0]
+
+        if record_type == '1':
+            if not self.header_seen:
+                self.error(line_number,
+                    'transaction record before the header record')
+            values = get_transaction_values(record, self.sender_account_name,
+                self.options)
+            self.field_errors(line_number,
+                afi_encoder.check_transaction(*values))
+            self.add_to_part(line_number, values[0], values[2])
+
+        elif record_type == '0':
+            self.header_seen = True
+            process_date = aba_record.get_process_date(record)
+            errors = self.context.check_header(self.account_number or '',
+                self.options.file_type, process_date, self.creation_date)
+            if self.account_number is None:
+                # no second record came to take the account number from
+                errors = [error for error in errors if error[0] != 'account']
+            self.field_errors(line_number, errors)
+
+        elif record_type != '7':
+            self.error(line_number,
+                'record type must be 0, 1 or 7, not {!r}'.format(record_type))
+
+    # Add a transaction to the totals of its afi file, checking the control
+    # record of the file once it is full. Values that ControlTotals.add
+    # can't parse stop a conversion, so they are errors here.
+    def add_to_part(self, line_number, receiver_account, amount_to_send):
+        try:
+            amount = int(amount_to_send)
+        except ValueError:
+            self.error(line_number,
+                'amount is not a number: {!r}'.format(amount_to_send))
+            return
+        try:
+            account_hash = int(receiver_account[1:13])
+        except ValueError:
+            self.error(line_number, 'account is not a number: {!r}'.format(
+                receiver_account))
+            return
+
+        totals = self.part_totals
+        totals.transaction_count += 1
+        totals.transaction_total += amount
+        totals.hash_sum += account_hash
+        self.last_transaction = line_number
+        if totals.transaction_count == self.max_transactions:
+            self.check_part()
+
+    def check_part(self):
+        totals = self.part_totals
+        self.field_errors(self.last_transaction, afi_encoder.check_control(
+            totals.transaction_total, totals.transaction_count,
+            totals.hash_total()), 'control record ending here, ')
+        self.part_totals = ControlTotals()
+
+    def finish(self):
+        """
+        Run the checks that need the whole file and return errors.
+        """
+        if self.first_record is not None and self.account_number is None:
+            # the first record is still waiting for a second
+            self.check_record(*self.first_record)
+        if self.part_totals.transaction_count:
+            self.check_part()
+        for record_type in '017':
+            if record_type not in self.record_type_count:
+                self.error(None, 'no {} record'.format(
+                    RECORD_NAMES[record_type]))
+        return self.errors
+
+
+def check_lines(lines, options=None, max_transactions=MAX_BULK_TRANSACTIONS):
+    """
+    Check an ABA file given as an iterable of lines. Returns a list of
+    (line number, message), empty when the file would convert.
+    """
+    preflight = Preflight(options, max_transactions)
+    for line_number, line in enumerate(lines, 1):
+        preflight.check_line(line_number, line)
+    return preflight.finish()
+
+
+def check_file(aba_filename, options=None,
+    max_transactions=MAX_BULK_TRANSACTIONS):
+    with compression.open_file(aba_filename, 'r') as aba:
+        return check_lines(aba, options, max_transactions)
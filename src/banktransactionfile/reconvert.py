@@ -0,0 +1,203 @@
+# reconvert.py
+# banktransactionfile.reconvert
+#
+# Re-conversion of amended ABA files. Finance resend a corrected file that
+# only changes a few detail lines, so the afi line of every transaction
+# converted is kept in a state file under a digest of its aba record, with
+# the amount and account hash it adds to the control record. Converting the
+# amended file only extracts, encodes and validates the records that are
+# new or changed; every other line and its share of the totals comes from
+# the state file. The afi files are the same as a full conversion gives.
+
+import hashlib
+import json
+import os # for file path commands
+
+from banktransactionfile.aba.file import AbaFile, InvalidFormatError
+from banktransactionfile.afi import encoder as afi_encoder
+from banktransactionfile.afi.record import MAX_BULK_TRANSACTIONS
+from banktransactionfile.compression import add_extension, open_file
+from banktransactionfile.converter import (ConversionOptions, ControlTotals,
+    convert_record, with_sender_details)
+from banktransactionfile.split import (remove_parts, rename_parts,
+    temp_part_filename)
+
+# Bump when the afi output or the layout of the state file changes, so old
+# state is never used
+STATE_VERSION = 1
+
+
+def record_digest(record):
+    return hashlib.blake2b(record.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class Reconversion(object):
+    """
+    Converts aba files like split.convert_split does (in this process),
+    reusing the afi lines kept in state_filename by the last run. State
+    kept for another transaction code or sender account name is not used.
+
+    The state file is a line of json with the version, transaction code and
+    sender account name, then a line for each transaction record:
+    digest, amount, account hash and afi line, separated by tabs. Entries
+    are only split up when they are used.
+
+    After each run reused, encoded and removed hold the number of
+    transaction records taken from the state, converted afresh, and in the
+    last run but gone from this one.
+    """
+
+    def __init__(self, state_filename, options=None,
+        max_transactions=MAX_BULK_TRANSACTIONS):
+        if options is None:
+            options = ConversionOptions()
+        self.state_filename = state_filename
+        self.options = options
+        self.max_transactions = max_transactions
+        self.reused = 0
+        self.encoded = 0
+        self.removed = 0
+
+    def load(self):
+        """
+        Return the sender account name and entries (digest: the rest of its
+        line) of the last run, or (None, {}) when there is no state for this
+        transaction code.
+        """
+        try:
+            with open(self.state_filename) as f:
+                state = json.loads(f.readline())
+                if (state.get('version') != STATE_VERSION or
+                    state['transaction_code'] !=
+                    str(self.options.transaction_code)):
+                    return None, {}
+                entries = dict(line.split('\t', 1) for line in f)
+        except (IOError, OSError, ValueError):
+            return None, {}
+        return state['sender_account_name'], entries
+
+    def save(self, sender_account_name, entries):
+        temp_filename = self.state_filename + '.tmp'
+        with open(temp_filename, 'w') as f:
+            f.write(json.dumps({
+                'version': STATE_VERSION,
+                'transaction_code': str(self.options.transaction_code),
+                'sender_account_name': sender_account_name,
+            }) + '\n')
+            f.writelines(digest + '\t' + entry
+                for digest, entry in entries.items())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, self.state_filename)
+
+    def run(self, aba_filename, afi_name, compression=None):
+        """
+        Convert aba_filename into afi files named as split.convert_split
+        names them, then replace the state with this file's. If anything
+        fails every part is removed and the state is left as it was.
+        Returns a list of (afi filename, ControlTotals).
+        """
+        options = self.options
+        creation_date = options.get_creation_date()
+        context = afi_encoder.get_context()
+        extension = add_extension('.afi', compression)
+        state_sender_account_name, state_entries = self.load()
+        previous = {}
+        # digest: amount, account hash and afi line of the records of this
+        # file, as in the state file
+        current = {}
+        sender_account_name = None
+        header_line = None
+        # (filename, ControlTotals) of every part started
+        parts = []
+        afi = None
+        totals = None
+        self.reused = 0
+        self.encoded = 0
+
+        try:
+            with open_file(aba_filename, 'r') as aba:
+                for record, account_number, sender_account_name in (
+                    with_sender_details(AbaFile().iter_records(aba))):
+
+                    if record[0] == '1':
+                        if header_line is None:
+                            raise InvalidFormatError('ABA file must start' +
+                                ' with a header record to be split')
+                        if afi is None:
+                            filename = temp_part_filename(afi_name,
+                                extension)
+                            totals = ControlTotals()
+                            parts.append((filename, totals))
+                            afi = open_file(filename, 'w', compression)
+                            afi.write(header_line + '\n')
+
+                        digest = record_digest(record)
+                        entry = previous.get(digest) or current.get(digest)
+                        if entry is None:
+                            record_totals = ControlTotals()
+                            line = convert_record(record, account_number,
+                                sender_account_name, record_totals, options,
+                                creation_date)
+                            entry = '{}\t{}\t{}\n'.format(
+                                record_totals.transaction_total,
+                                record_totals.hash_sum, line)
+                            self.encoded += 1
+                        else:
+                            self.reused += 1
+                        current[digest] = entry
+
+                        amount, account_hash, line = entry.split('\t', 2)
+                        afi.write(line)
+                        totals.transaction_count += 1
+                        totals.transaction_total += int(amount)
+                        totals.hash_sum += int(account_hash)
+                        if totals.transaction_count == self.max_transactions:
+                            self.end_part(afi, totals)
+                            afi = None
+                    elif record[0] == '0':
+                        header_line = convert_record(record, account_number,
+                            sender_account_name, None, options, creation_date,
+                            context)
+                        # the sender account name is only known now, and
+                        # is part of every afi transaction line
+                        if state_sender_account_name == sender_account_name:
+                            previous = state_entries
+                    elif record[0] != '7':
+                        convert_record(record, account_number,
+                            sender_account_name, None, options, creation_date)
+
+            if afi is not None:
+                self.end_part(afi, totals)
+                afi = None
+        except Exception:
+            if afi is not None:
+                afi.close()
+            remove_parts(parts)
+            raise
+
+        self.removed = len(previous) - (len(current) - self.encoded)
+        # a resubmission of the same file leaves the state as it was
+        if self.encoded or self.removed or previous is not state_entries:
+            try:
+                self.save(sender_account_name, current)
+            except Exception:
+                remove_parts(parts)
+                raise
+        return rename_parts(parts, afi_name, extension)
+
+    def end_part(self, afi, totals):
+        afi.write(afi_encoder.encode_control(totals.transaction_total,
+            totals.transaction_count, totals.hash_total()) + '\n')
+        afi.close()
+
+
+def reconvert(aba_filename, afi_name, state_filename, options=None,
+    max_transactions=MAX_BULK_TRANSACTIONS, compression=None):
+    """
+    Convert aba_filename reusing the afi lines kept in state_filename by
+    the conversion of an earlier version of it, and keep this version's
+    there for next time. Returns a list of (afi filename, ControlTotals).
+    """
+    return Reconversion(state_filename, options, max_transactions).run(
+        aba_filename, afi_name, compression)
@@ -0,0 +1,296 @@
+# service.py
+# banktransactionfile.service
+#
+# HTTP conversion service on asyncio. An ABA file is POSTed to /convert and
+# the AFI file streams back as the upload arrives: the body is read in
+# batches of lines, each batch is converted on a bounded thread pool while
+# the event loop carries on with other uploads, and the next batch is only
+# read once the last one is converted and sent, so a fast client can't make
+# the service hold more than a batch of its file.
+#
+# POST /convert?transaction_code=52&file_type=7
+#
+# The query parameters are optional. Errors found before any of the AFI file
+# is sent (always the case for files of up to BATCH_LINES lines) are
+# answered with 400 and a json body; an error found later closes the
+# connection before the end of the chunked response, so a client never
+# mistakes a part of a file for all of it.
+
+import asyncio
+import json
+import os # for file path commands
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+from banktransactionfile.aba.file import AbaFile, InvalidFormatError
+from banktransactionfile.afi import field
+from banktransactionfile.afi.field import ValidationError
+from banktransactionfile.converter import (ConversionOptions,
+    IncrementalConverter)
+
+# Lines converted at a time
+BATCH_LINES = 1000
+
+# Bytes read from the socket at a time
+READ_SIZE = 64 * 1024
+
+# Headers a request can have
+MAX_HEADERS = 100
+
+# Bytes a line of the body can take: a record of RECORD_LENGTH characters,
+# each up to four bytes in utf-8, and its line ending
+MAX_LINE_BYTES = (AbaFile.RECORD_LENGTH + 2) * 4
+
+# Query parameters passed on to ConversionOptions, and the fields they are
+# checked against
+OPTION_FIELDS = {
+    'transaction_code': field.TransactionCode,
+    'file_type': field.FileType,
+    'creation_date': field.FileCreationDate,
+}
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+}
+
+
+class BadRequest(Exception):
+    def __init__(self, message, status=400):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+async def read_request(reader):
+    """
+    Read the request line and headers. Returns (method, target, headers)
+    with header names in lower case, or None when the client sent nothing.
+    """
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, version = request_line.decode('latin-1').split()
+    except ValueError:
+        raise BadRequest('malformed request line')
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) == MAX_HEADERS:
+            raise BadRequest('too many headers')
+        name, separator, value = line.decode('latin-1').partition(':')
+        if not separator:
+            raise BadRequest('malformed header')
+        headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+async def read_body(reader, headers):
+    """
+    Yield the request body in blocks as it arrives, for a body sent with
+    Content-Length or chunked.
+    """
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size_line = await reader.readline()
+            try:
+                size = int(size_line.split(b';')[0], 16)
+            except ValueError:
+                raise BadRequest('malformed chunk size')
+            if size == 0:
+                # trailers
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            while size:
+                block = await reader.read(min(size, READ_SIZE))
+                if not block:
+                    raise BadRequest('body ended early')
+                size -= len(block)
+                yield block
+            await reader.readline()
+    elif 'content-length' in headers:
+        try:
+            remaining = int(headers['content-length'])
+        except ValueError:
+            raise BadRequest('malformed Content-Length')
+        while remaining > 0:
+            block = await reader.read(min(remaining, READ_SIZE))
+            if not block:
+                raise BadRequest('body ended early')
+            remaining -= len(block)
+            yield block
+    else:
+        raise BadRequest('Content-Length or chunked body required', 411)
+
+
+async def read_batches(blocks, batch_lines=BATCH_LINES):
+    """
+    Turn blocks of the body into lists of at most batch_lines text lines.
+    A line too long to be a record fails with InvalidFormatError as soon as
+    it is, rather than being held until its end arrives; the lines before it
+    are passed on first, so an error in them is still the one reported.
+    """
+    partial = b''
+    batch = []
+    async for block in blocks:
+        lines = (partial + block).split(b'\n')
+        partial = lines.pop()
+        for line in lines:
+            batch.append(line.decode('utf-8') + '\n')
+            if len(batch) == batch_lines:
+                yield batch
+                batch = []
+        if len(partial) > MAX_LINE_BYTES:
+            if batch:
+                yield batch
+            raise InvalidFormatError('Input ABA file must contain ' +
+                str(AbaFile.RECORD_LENGTH) + ' characters per line to be '
+                + 'converted correctly')
+    if partial:
+        batch.append(partial.decode('utf-8'))
+    if batch:
+        yield batch
+
+
+def get_options(query):
+    """
+    Get the ConversionOptions given in a query string. Each value is checked
+    against its field, so a bad one is answered with 400 before any of the
+    body is read.
+    """
+    options = {}
+    for key, value in parse_qsl(query):
+        if key in OPTION_FIELDS:
+            OPTION_FIELDS[key](value).parse_to_string()
+            options[key] = value
+    return ConversionOptions(**options)
+
+
+class ConversionService(object):
+    """
+    Converts uploads on a pool of workers threads. Each upload has at most
+    one batch on the pool at a time; once every thread is busy further
+    batches wait their turn, and their uploads wait with them.
+    """
+
+    def __init__(self, workers=4, batch_lines=BATCH_LINES):
+        self.executor = ThreadPoolExecutor(workers)
+        self.batch_lines = batch_lines
+
+    async def run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    async def handle(self, reader, writer):
+        try:
+            await self.handle_request(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, reader, writer):
+        try:
+            request = await read_request(reader)
+        except BadRequest as e:
+            await self.send_error(writer, 400, e)
+            return
+        if request is None:
+            return
+
+        method, target, headers = request
+        url = urlsplit(target)
+        if url.path != '/convert':
+            await self.send_error(writer, 404, 'no such path ' + url.path)
+            return
+        if method != 'POST':
+            await self.send_error(writer, 405, 'use POST')
+            return
+        if headers.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+
+        started = False
+        try:
+            converter = IncrementalConverter(get_options(url.query))
+            # each batch is sent once the next one has converted, so a file
+            # of one batch is answered with an error rather than cut off
+            held = []
+            async for batch in read_batches(read_body(reader, headers),
+                self.batch_lines):
+                lines = await self.run(converter.feed, batch)
+                started = await self.send_lines(writer, held, started)
+                held = lines
+            lines = await self.run(converter.finish)
+            started = await self.send_lines(writer, held + lines, started)
+        except (BadRequest, InvalidFormatError, ValidationError,
+            ValueError) as e:
+            if not started:
+                await self.send_error(writer,
+                    e.status if isinstance(e, BadRequest) else 400, e)
+            # otherwise the response is cut off by closing the connection
+            return
+
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def send_lines(self, writer, lines, started):
+        """
+        Send afi lines as one chunk, starting the response first if it
+        hasn't been. Returns True once the response is started.
+        """
+        if not lines:
+            return started
+        if not started:
+            writer.write(b'HTTP/1.1 200 OK\r\n' +
+                b'Content-Type: text/plain; charset=utf-8\r\n' +
+                b'Transfer-Encoding: chunked\r\n' +
+                b'Connection: close\r\n\r\n')
+        data = ''.join(line + '\n' for line in lines).encode('utf-8')
+        writer.write('{:x}\r\n'.format(len(data)).encode('ascii') + data +
+            b'\r\n')
+        await writer.drain()
+        return True
+
+    async def send_error(self, writer, status, error):
+        if isinstance(error, Exception):
+            body = {'error_type': error.__class__.__name__,
+                'error': str(error)}
+        else:
+            body = {'error': error}
+        data = json.dumps(body, sort_keys=True).encode('utf-8') + b'\n'
+        writer.write('HTTP/1.1 {} {}\r\n'.format(status,
+            REASONS[status]).encode('ascii') +
+            b'Content-Type: application/json\r\n' +
+            'Content-Length: {}\r\n'.format(len(data)).encode('ascii') +
+            b'Connection: close\r\n\r\n' + data)
+        await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=8080, socket_path=None):
+        """
+        Serve on host and port, or on a Unix socket at socket_path, until
+        cancelled. A socket left behind by an earlier service is replaced.
+        """
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = await asyncio.start_unix_server(self.handle, socket_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        try:
+            await server.serve_forever()
+        finally:
+            server.close()
+            self.executor.shutdown()
+            if socket_path is not None and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+def serve(host='127.0.0.1', port=8080, socket_path=None, workers=4):
+    asyncio.run(ConversionService(workers).serve(host, port, socket_path))
@@ -0,0 +1,277 @@
+# split.py
+# banktransactionfile.split
+#
+# Converts an ABA file into as many AFI files as it takes to stay inside the
+# bank's limit on transactions per file. Every part gets the header record
+# and its own control record with the totals and hash of just that part.
+# Full parts are written on a process pool while the rest is being read.
+
+import multiprocessing
+import os # for file path commands
+import shutil
+import uuid
+from collections import deque
+
+from banktransactionfile.compression import add_extension, open_file
+from banktransactionfile.aba.file import AbaFile, InvalidFormatError
+from banktransactionfile.afi import encoder as afi_encoder
+from banktransactionfile.afi.record import MAX_BULK_TRANSACTIONS
+from banktransactionfile.converter import (ConversionOptions, ControlTotals,
+    convert_record, timed_record_converter, with_sender_details)
+from banktransactionfile.metrics import Metrics
+
+# Added to the name of an afi part while it is being written
+PARTIAL_EXTENSION = '.partial'
+
+
+# Get a name, unique to this conversion, to write a part under until every
+# part has been written. Nothing else writing parts of afi_name can touch it.
+def temp_part_filename(afi_name, extension):
+    return '{}{}.{}{}'.format(afi_name, extension, uuid.uuid4().hex,
+        PARTIAL_EXTENSION)
+
+
+# Get the names of the parts of a file split into count parts: <afi_name>.afi
+# for one part, otherwise <afi_name>_1.afi, <afi_name>_2.afi and so on
+def part_filenames(afi_name, count, extension):
+    if count == 1:
+        return [afi_name + extension]
+    return ['{}_{}{}'.format(afi_name, number, extension)
+        for number in range(1, count + 1)]
+
+
+# Get the names of parts an earlier conversion to afi_name may have left
+# that a conversion into count parts doesn't write: <afi_name>.afi when
+# there are several parts, and numbered parts past count
+def stale_part_filenames(afi_name, count, extension):
+    filenames = []
+    if count > 1 and os.path.exists(afi_name + extension):
+        filenames.append(afi_name + extension)
+    number = count + 1 if count > 1 else 1
+    while os.path.exists('{}_{}{}'.format(afi_name, number, extension)):
+        filenames.append('{}_{}{}'.format(afi_name, number, extension))
+        number += 1
+    return filenames
+
+
+# Keep a file that is about to be replaced under a temporary name, so it
+# can be put back. Returns (temporary filename, filename).
+def keep_replaced(filename, afi_name, extension):
+    kept_filename = temp_part_filename(afi_name, extension)
+    try:
+        os.link(filename, kept_filename)
+    except (AttributeError, OSError):
+        # no hard links here
+        shutil.copy2(filename, kept_filename)
+    return kept_filename, filename
+
+
+def rename_parts(parts, afi_name, extension):
+    """
+    Give the parts of a finished conversion, a list of (temporary filename,
+    ControlTotals), their final names, and remove the parts of an earlier
+    conversion to afi_name that they don't replace. If a part can't be
+    renamed, the parts already renamed are put back as they were and the
+    error is raised. Returns a list of (afi filename, ControlTotals).
+    """
+    filenames = part_filenames(afi_name, len(parts), extension)
+    kept = []
+    renamed = []
+    try:
+        for filename in filenames:
+            if os.path.isfile(filename):
+                kept.append(keep_replaced(filename, afi_name, extension))
+        for (temp_filename, totals), filename in zip(parts, filenames):
+            os.replace(temp_filename, filename)
+            renamed.append((filename, totals))
+    except Exception:
+        remove_parts(renamed)
+        for kept_filename, filename in kept:
+            os.replace(kept_filename, filename)
+        remove_parts(parts)
+        raise
+    remove_parts(kept)
+    remove_parts([(filename, None) for filename in
+        stale_part_filenames(afi_name, len(parts), extension)])
+    return [(filename, totals)
+        for (temp_filename, totals), filename in zip(parts, filenames)]
+
+
+# Remove the files of parts, a list of (filename, anything), that exist
+def remove_parts(parts):
+    for filename, result in parts:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+# Write one afi file from a header line and a list of transaction records,
+# compressed with compression ('gz', 'bz2', 'xz' or None).
+# Runs in a worker process for every part but the last. When metrics (a
+# new, empty Metrics) is given the part is instrumented into it.
+# Returns the ControlTotals of the part and metrics.
+def write_part(afi_filename, header_line, records, account_number,
+    sender_account_name, options, creation_date, metrics=None,
+    compression=None):
+    totals = ControlTotals()
+    record_converter = convert_record
+
+    with open_file(afi_filename, 'w', compression) as new_afi:
+        dst_stream = new_afi
+        if metrics is not None:
+            dst_stream = metrics.timed_writer(new_afi)
+            record_converter = timed_record_converter(metrics)
+
+        try:
+            dst_stream.write(header_line + '\n')
+            for record in records:
+                dst_stream.write(record_converter(record, account_number,
+                    sender_account_name, totals, options, creation_date)
+                    + '\n')
+            dst_stream.write(afi_encoder.encode_control(
+                totals.transaction_total, totals.transaction_count,
+                totals.hash_total()) + '\n')
+        except Exception:
+            new_afi.close()
+            os.remove(afi_filename)
+            raise
+
+    return totals, metrics
+
+
+def convert_split(aba_filename, afi_name, options=None,
+    max_transactions=MAX_BULK_TRANSACTIONS, processes=None, metrics=None,
+    compression=None, duplicates=None):
+    """
+    Convert aba_filename into afi files of at most max_transactions
+    transactions each.
+
+    afi_name is the path of the afi file without its extension. A file that
+    fits in one part is written as <afi_name>.afi, otherwise the parts are
+    <afi_name>_1.afi, <afi_name>_2.afi and so on. Parts are written under
+    temporary names and only get these once every part has been written,
+    so nothing is left under them if anything fails. The last part is written
+    in this process; a pool of processes (one per CPU by default) is only
+    started when there is more than one part, and processes=1 writes every
+    part here. If anything fails every part is removed and the first error
+    in file order is raised. Pass a metrics.Metrics to instrument the
+    conversion, parts written by the pool report back into it.
+
+    aba_filename can be gzip, bz2 or xz compressed. The afi files are
+    compressed too when compression ('gz', 'bz2' or 'xz') is given, and get
+    its extension after .afi.
+
+    Pass a duplicates.DuplicateCheck to look every transaction up in a
+    payment index as it is read; its payments are recorded once the
+    conversion has succeeded.
+    Returns a list of (afi filename, ControlTotals).
+    """
+    if options is None:
+        options = ConversionOptions()
+    creation_date = options.get_creation_date()
+    context = afi_encoder.get_context()
+    extension = add_extension('.afi', compression)
+    record_converter = convert_record
+    if metrics is not None:
+        metrics.start_run()
+        record_converter = timed_record_converter(metrics)
+    pool = None
+    max_pending = processes or multiprocessing.cpu_count()
+    # (filename, result) of every part, results of pool parts are pending
+    parts = []
+    pending = deque()
+    header_line = None
+    records = []
+
+    def send_part(in_process):
+        filename = temp_part_filename(afi_name, extension)
+        args = (filename, header_line, records[:], account_number,
+            sender_account_name, options, creation_date,
+            None if metrics is None else Metrics(), compression)
+        if in_process:
+            parts.append((filename, write_part(*args)))
+        else:
+            result = pool.apply_async(write_part, args)
+            parts.append((filename, result))
+            pending.append(result)
+        del records[:]
+
+    def wait_pending(limit):
+        while len(pending) > limit:
+            pending.popleft().get()
+
+    try:
+        try:
+            with open_file(aba_filename, 'r') as aba:
+                lines = aba
+                if metrics is not None:
+                    lines = metrics.timed_reader(aba)
+                # every line is a record, or iter_records raises
+                for line_number, (record, account_number,
+                    sender_account_name) in enumerate(with_sender_details(
+                    AbaFile().iter_records(lines)), 1):
+
+                    if duplicates is not None:
+                        duplicates.check_record(line_number, record)
+                    if record[0] == '1':
+                        if header_line is None:
+                            raise InvalidFormatError('ABA file must start' +
+                                ' with a header record to be split')
+                        records.append(record)
+                        if len(records) == max_transactions:
+                            if pool is None and processes != 1:
+                                pool = multiprocessing.Pool(processes)
+                            send_part(pool is None)
+                            wait_pending(max_pending)
+                    elif record[0] == '0':
+                        header_line = record_converter(record,
+                            account_number, sender_account_name, None,
+                            options, creation_date, context)
+                    elif record[0] == '7':
+                        if metrics is not None:
+                            metrics.count_record('7')
+                    else:
+                        record_converter(record, account_number,
+                            sender_account_name, None, options, creation_date)
+        except InvalidFormatError:
+            # parts before a bad record are still written first, so their
+            # errors are raised ahead of it as in a serial run
+            wait_pending(0)
+            raise
+
+        # the last part is written while the pool finishes the others, but an
+        # error in it is only raised once the earlier parts are known to be
+        # good
+        last_part_error = None
+        if records:
+            try:
+                send_part(True)
+            except Exception as e:
+                last_part_error = e
+        wait_pending(0)
+        if last_part_error is not None:
+            raise last_part_error
+    except Exception:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+            pool = None
+        remove_parts(parts)
+        if metrics is not None:
+            metrics.end_run(failed=True)
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    parts = [(filename, result if isinstance(result, tuple)
+        else result.get()) for filename, result in parts]
+    if metrics is not None:
+        for filename, (totals, part_metrics) in parts:
+            metrics.merge(part_metrics)
+        metrics.end_run()
+    parts = rename_parts([(filename, totals)
+        for filename, (totals, part_metrics) in parts], afi_name, extension)
+    if duplicates is not None:
+        duplicates.commit()
+    return parts
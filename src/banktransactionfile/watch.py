@@ -0,0 +1,341 @@
+# watch.py
+# banktransactionfile.watch
+#
+# Watch-folder daemon. ABA files dropped into an input directory are
+# converted on a pool of worker processes as soon as they are complete, then
+# the aba file is moved to a processed or failed directory and the afi files
+# to an output directory.
+#
+# A file is claimed by renaming it into a job directory of its own under the
+# work directory, and only leaves it once its conversion is finished, so a
+# daemon that is stopped or dies part way through picks up where it left off
+# when it starts again.
+#
+# New files are noticed with inotify on Linux, and by scanning the input
+# directory every poll interval anywhere else (and as a backstop for events
+# inotify can miss).
+
+import ctypes
+import ctypes.util
+import json
+import multiprocessing
+import os # for file path commands
+import select
+import shutil
+import struct
+import time
+
+from banktransactionfile.aba.file import has_aba_file_extention
+from banktransactionfile.batch import convert_one
+
+# inotify event flags: a file written and closed, or moved in
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+
+# struct inotify_event, before the name
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify(object):
+    """
+    Reports the names of files closed after writing or moved into a
+    directory, through the Linux inotify API. Raises OSError where inotify
+    isn't available.
+    """
+
+    def __init__(self, path):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            inotify_init1 = libc.inotify_init1
+            inotify_add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError):
+            raise OSError('inotify is not available')
+
+        self.fd = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if inotify_add_watch(self.fd, os.fsencode(path),
+            IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watch failed on ' + path)
+
+    def read(self, timeout):
+        """
+        Wait up to timeout seconds for events and return the names of the
+        files they were for.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        names = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+# Get a path in directory for name that doesn't exist yet. payroll.aba
+# becomes payroll-1.aba, payroll-2.aba and so on when it is taken.
+def unique_path(directory, name):
+    path = os.path.join(directory, name)
+    stem, dot, extensions = name.partition('.')
+    n = 0
+    while os.path.exists(path):
+        n += 1
+        path = os.path.join(directory, '{}-{}{}{}'.format(stem, n, dot,
+            extensions))
+    return path
+
+
+class WatchFolder(object):
+    """
+    Converts aba files that land in input_dir.
+
+    afi files go to output_dir, and aba files to processed_dir or, with a
+    json error report beside them, failed_dir. By default these are
+    processed and failed directories inside input_dir, with the work
+    directory (which must be on the same filesystem as input_dir) hidden
+    there as .work. A file found by scanning is taken to be complete once
+    its size and modification time stay the same between two scans at
+    least settle seconds apart; inotify reports files as they are closed.
+    The result dict of every file (see batch.convert_one) is written to out
+    as a json line when out is given.
+    """
+
+    def __init__(self, input_dir, output_dir=None, processed_dir=None,
+        failed_dir=None, work_dir=None, workers=None, options=None,
+        cache=None, poll_interval=5.0, settle=2.0, use_inotify=True,
+        out=None):
+        self.input_dir = input_dir
+        self.processed_dir = processed_dir or os.path.join(input_dir,
+            'processed')
+        self.output_dir = output_dir or self.processed_dir
+        self.failed_dir = failed_dir or os.path.join(input_dir, 'failed')
+        self.work_dir = work_dir or os.path.join(input_dir, '.work')
+        self.workers = workers or multiprocessing.cpu_count()
+        self.options = options
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.use_inotify = use_inotify
+        self.out = out
+        # (size, mtime) of files seen by the last scan
+        self.seen = {}
+        # names inotify reported complete
+        self.closed = set()
+        # job directory: AsyncResult of its conversion
+        self.pending = {}
+
+        for directory in (self.output_dir, self.processed_dir,
+            self.failed_dir, self.work_dir):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+    #######################################################
+    #                                                     #
+    #                    Finding files                    #
+    #                                                     #
+    #######################################################
+
+    def ready_files(self, everything=False):
+        """
+        Return the names of the aba files in input_dir that are complete.
+        With everything, every aba file there is taken to be complete.
+        """
+        now = time.time()
+        seen = {}
+        ready = []
+        for name in sorted(os.listdir(self.input_dir)):
+            path = os.path.join(self.input_dir, name)
+            if not has_aba_file_extention(name):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # moved away since it was listed
+                continue
+            if not os.path.isfile(path):
+                continue
+
+            seen[name] = (stat.st_size, stat.st_mtime)
+            if (everything or name in self.closed or
+                (self.seen.get(name) == seen[name] and
+                now - stat.st_mtime >= self.settle)):
+                ready.append(name)
+        self.seen = seen
+        self.closed &= set(seen)
+        return ready
+
+    #######################################################
+    #                                                     #
+    #                        Jobs                         #
+    #                                                     #
+    #######################################################
+
+    def claim(self, name):
+        """
+        Move an aba file from input_dir into a new job directory and return
+        the job directory, or None if a file of the same name is still being
+        converted or it has gone.
+        """
+        job_dir = os.path.join(self.work_dir, name)
+        if os.path.exists(job_dir):
+            return None
+        os.mkdir(job_dir)
+        try:
+            os.rename(os.path.join(self.input_dir, name),
+                os.path.join(job_dir, name))
+        except OSError:
+            os.rmdir(job_dir)
+            return None
+        self.seen.pop(name, None)
+        self.closed.discard(name)
+        return job_dir
+
+    def job_source(self, job_dir):
+        for name in os.listdir(job_dir):
+            if has_aba_file_extention(name):
+                return os.path.join(job_dir, name)
+        return None
+
+    def start(self, pool, job_dir):
+        self.pending[job_dir] = pool.apply_async(convert_one,
+            (self.job_source(job_dir), job_dir, self.options, self.cache))
+
+    def finish(self, job_dir, result):
+        """
+        Move the files of a finished job out of the work directory. The aba
+        file goes first, so a job directory without one only has afi files
+        left to move.
+        """
+        source = self.job_source(job_dir)
+        name = os.path.basename(source)
+        result['file'] = os.path.join(self.input_dir, name)
+
+        if result['status'] == 'converted':
+            shutil.move(source, unique_path(self.processed_dir, name))
+            outputs = []
+            for afi_filename in result['outputs']:
+                path = unique_path(self.output_dir,
+                    os.path.basename(afi_filename))
+                shutil.move(afi_filename, path)
+                outputs.append(path)
+            result['outputs'] = outputs
+        else:
+            path = unique_path(self.failed_dir, name)
+            with open(path + '.error.json', 'w') as f:
+                json.dump(result, f, indent=2, sort_keys=True)
+            shutil.move(source, path)
+        shutil.rmtree(job_dir)
+
+        if self.out is not None:
+            self.out.write(json.dumps(result, sort_keys=True) + '\n')
+            self.out.flush()
+
+    def collect(self):
+        for job_dir, pending in list(self.pending.items()):
+            if pending.ready():
+                del self.pending[job_dir]
+                self.finish(job_dir, pending.get())
+
+    def recover(self):
+        """
+        Return the job directories a previous run left behind, ready to be
+        converted again. Jobs whose aba file had already been moved only
+        have their afi files moved out.
+        """
+        job_dirs = []
+        for name in sorted(os.listdir(self.work_dir)):
+            job_dir = os.path.join(self.work_dir, name)
+            if not os.path.isdir(job_dir):
+                continue
+            source = self.job_source(job_dir)
+            for filename in os.listdir(job_dir):
+                path = os.path.join(job_dir, filename)
+                if path == source:
+                    continue
+                if source is None:
+                    shutil.move(path, unique_path(self.output_dir, filename))
+                else:
+                    # output of a conversion that didn't finish
+                    os.remove(path)
+            if source is None:
+                os.rmdir(job_dir)
+            else:
+                job_dirs.append(job_dir)
+        return job_dirs
+
+    #######################################################
+    #                                                     #
+    #                     Main loop                       #
+    #                                                     #
+    #######################################################
+
+    def run(self, once=False):
+        """
+        Convert files as they land until interrupted. With once, convert
+        what is in input_dir now and return when it is done.
+        """
+        pool = multiprocessing.Pool(self.workers)
+        inotify = None
+        if self.use_inotify and not once:
+            try:
+                inotify = Inotify(self.input_dir)
+            except OSError:
+                inotify = None
+
+        # two jobs per worker at most, the rest wait in input_dir
+        max_pending = 2 * self.workers
+        try:
+            for job_dir in self.recover():
+                self.start(pool, job_dir)
+
+            while True:
+                names = self.ready_files(everything=once)
+                for name in names:
+                    if len(self.pending) >= max_pending:
+                        break
+                    job_dir = self.claim(name)
+                    if job_dir is not None:
+                        self.start(pool, job_dir)
+
+                if once and not self.pending and not names:
+                    return
+                self.wait(inotify)
+                self.collect()
+        finally:
+            pool.terminate()
+            pool.join()
+            if inotify is not None:
+                inotify.close()
+
+    # Wait for a new file or a job to finish, whichever is sooner, but no
+    # longer than the poll interval
+    def wait(self, inotify):
+        deadline = time.time() + self.poll_interval
+        while time.time() < deadline:
+            timeout = min(0.1, deadline - time.time()) if self.pending else (
+                deadline - time.time())
+            if inotify is not None:
+                names = [name for name in inotify.read(max(timeout, 0))
+                    if has_aba_file_extention(name)]
+                if names:
+                    self.closed.update(names)
+                    return
+            else:
+                time.sleep(max(timeout, 0))
+            if any(pending.ready() for pending in self.pending.values()):
+                return
@@ -0,0 +1,126 @@
+# worker.py
+# banktransactionfile.worker
+#
+# A long running converter. Jobs are read one per line from a stream (stdin)
+# or from connections on a Unix socket, converted in this process and
+# answered with one json result line each, so a caller doesn't pay for
+# starting python for every file.
+#
+# A job is either the path of an aba file, or a json object:
+# {"file": "payroll.aba", "output_dir": "out", "transaction_code": 52,
+#  "file_type": 7}
+# Everything but file is optional. The result is the dict batch.convert_one
+# gives, one line per job in the order the jobs arrived.
+
+import json
+import os # for file path commands
+import socketserver
+
+from banktransactionfile.batch import convert_one
+from banktransactionfile.converter import ConversionOptions
+
+# Job keys passed on to ConversionOptions
+OPTION_KEYS = ('transaction_code', 'file_type', 'creation_date')
+
+
+# Turn a job line into (aba filename, output dir, ConversionOptions)
+def parse_job(line, output_dir):
+    if not line.startswith('{'):
+        return line, output_dir, None
+
+    job = json.loads(line)
+    if not isinstance(job, dict) or 'file' not in job:
+        raise ValueError('job must be a json object with a file')
+    for key in ('file', 'output_dir'):
+        if key in job and not isinstance(job[key], str):
+            raise ValueError('{} must be a string'.format(key))
+    options = dict((key, job[key]) for key in OPTION_KEYS if key in job)
+    return (job['file'], job.get('output_dir', output_dir),
+        ConversionOptions(**options) if options else None)
+
+
+def run_job(line, output_dir='.', cache=None):
+    """
+    Convert the aba file a job line names and return the result dict.
+    A job that can't be read is returned as failed like a bad file is.
+    """
+    try:
+        aba_filename, job_output_dir, options = parse_job(line, output_dir)
+        if not os.path.isdir(job_output_dir):
+            os.makedirs(job_output_dir)
+    except Exception as e:
+        return {
+            'job': line,
+            'status': 'failed',
+            'outputs': [],
+            'error_type': e.__class__.__name__,
+            'error': str(e),
+        }
+    return convert_one(aba_filename, job_output_dir, options, cache)
+
+
+def run_jobs(lines, out, output_dir='.', cache=None):
+    """
+    Run a job for every non blank line of lines, writing each result to the
+    text stream out as a json line as soon as it is done. Resubmitted files
+    are answered from cache, a cache.ConversionCache, when one is given.
+    Returns the number of jobs run.
+    """
+    count = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        result = run_job(line, output_dir, cache)
+        out.write(json.dumps(result, sort_keys=True) + '\n')
+        out.flush()
+        count += 1
+    return count
+
+
+class TextStream(object):
+    """
+    Writes text to a binary socket file as utf-8.
+    """
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        self.wfile.write(text.encode('utf-8'))
+
+    def flush(self):
+        self.wfile.flush()
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        lines = (line.decode('utf-8') for line in self.rfile)
+        run_jobs(lines, TextStream(self.wfile), self.server.output_dir,
+            self.server.cache)
+
+
+class JobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, output_dir='.', cache=None):
+        self.output_dir = output_dir
+        self.cache = cache
+        socketserver.UnixStreamServer.__init__(self, socket_path, JobHandler)
+
+
+def serve_socket(socket_path, output_dir='.', cache=None):
+    """
+    Answer jobs sent to a Unix socket at socket_path until interrupted.
+    Each connection can send any number of jobs. A socket left behind by an
+    earlier worker is replaced.
+    """
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = JobServer(socket_path, output_dir, cache)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
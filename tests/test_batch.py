@@ -0,0 +1,83 @@
+# test_batch.py
+#
+# python -m unittest discover tests
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+from banktransactionfile.batch import convert_batch
+from banktransactionfile.converter import ConversionOptions
+
+import synthetic
+
+
+class ConvertBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.workdir, 'out')
+        self.options = ConversionOptions()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def path(self, name):
+        return os.path.join(self.workdir, name)
+
+    def aba_file(self, name, transactions):
+        filename = self.path(name)
+        synthetic.generate(filename, transactions)
+        return filename
+
+    def test_files_with_the_same_afi_name_all_fail(self):
+        # x.aba and x.ABA both convert to x.afi
+        filenames = [self.aba_file('x.aba', 2000),
+            self.aba_file('x.ABA', 500), self.aba_file('y.aba', 10)]
+
+        results = convert_batch(filenames, self.output_dir, workers=2,
+            options=self.options)
+
+        self.assertEqual([result['file'] for result in results], filenames)
+        for result in results[:2]:
+            self.assertEqual(result['status'], 'failed')
+            self.assertEqual(result['outputs'], [])
+            self.assertIn('same afi name', result['error'])
+        self.assertEqual(results[2]['status'], 'converted')
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ['y.afi'])
+
+    def test_compressed_file_of_the_same_name_does_not_collide(self):
+        filenames = [self.aba_file('x.aba', 10), self.path('x.aba.gz')]
+        with open(filenames[0], 'rb') as src:
+            with gzip.open(filenames[1], 'wb') as dst:
+                dst.write(src.read())
+
+        results = convert_batch(filenames, self.output_dir, workers=2,
+            options=self.options)
+
+        self.assertEqual([result['status'] for result in results],
+            ['converted', 'converted'])
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+            ['x.afi', 'x.afi.gz'])
+
+    def test_file_named_twice_is_converted_once(self):
+        filename = self.aba_file('x.aba', 10)
+        again = self.path(os.path.join('.', 'x.aba'))
+
+        results = convert_batch([filename, again], self.output_dir,
+            workers=2, options=self.options)
+
+        self.assertEqual([(result['file'], result['status'])
+            for result in results], [(filename, 'converted')])
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ['x.afi'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# test_cache.py
+#
+# python -m unittest discover tests
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+from banktransactionfile.cache import ConversionCache
+from banktransactionfile.converter import ConversionOptions
+
+import synthetic
+
+
+# A cache whose entries are evicted by another process as soon as they are
+# found, the last afi file going before it is copied out
+class EvictingCache(ConversionCache):
+
+    def get(self, key):
+        entry = ConversionCache.get(self, key)
+        if entry is not None:
+            os.remove(entry[-1][0])
+        return entry
+
+
+class ConversionCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.workdir, 'out')
+        os.mkdir(self.output_dir)
+        self.options = ConversionOptions(creation_date='261018')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def read_parts(self, parts):
+        texts = []
+        for filename, totals in parts:
+            with open(filename) as f:
+                texts.append(f.read())
+        return texts
+
+    def test_entry_evicted_while_copied_is_converted_again(self):
+        aba_filename = os.path.join(self.workdir, 'x.aba')
+        synthetic.generate(aba_filename, 25)
+        afi_name = os.path.join(self.output_dir, 'x')
+        cache = EvictingCache(os.path.join(self.workdir, 'cache'))
+
+        first = self.read_parts(cache.convert_split(aba_filename, afi_name,
+            self.options, max_transactions=10, processes=1))
+        parts = cache.convert_split(aba_filename, afi_name, self.options,
+            max_transactions=10, processes=1)
+
+        self.assertEqual(self.read_parts(parts), first)
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+            ['x_1.afi', 'x_2.afi', 'x_3.afi'])
+
+
+if __name__ == '__main__':
+    unittest.main()
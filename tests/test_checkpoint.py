@@ -0,0 +1,112 @@
+# test_checkpoint.py
+#
+# python -m unittest discover tests
+
+import datetime
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+from banktransactionfile.checkpoint import (ResumableConversion,
+    convert_resumable)
+from banktransactionfile.converter import ConversionOptions
+from banktransactionfile.split import convert_split
+
+import synthetic
+
+
+# Stands in for the process being killed, which the conversion doesn't
+# clean up after
+class Killed(BaseException):
+    pass
+
+
+# A conversion killed as soon as it has saved its first checkpoint
+class KilledConversion(ResumableConversion):
+
+    def checkpoint(self, aba, afi):
+        ResumableConversion.checkpoint(self, aba, afi)
+        raise Killed()
+
+
+class ResumableConversionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.options = ConversionOptions()
+        synthetic.generate(self.path('x.aba'), 25)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def path(self, name):
+        return os.path.join(self.workdir, name)
+
+    def read_parts(self, parts):
+        texts = []
+        for filename, totals in parts:
+            if filename.endswith('.gz'):
+                with gzip.open(filename, 'rt') as f:
+                    texts.append(f.read())
+            else:
+                with open(filename) as f:
+                    texts.append(f.read())
+        return texts
+
+    # The afi files a conversion that was never stopped gives
+    def expected(self):
+        os.mkdir(self.path('expected'))
+        return self.read_parts(convert_split(self.path('x.aba'),
+            os.path.join(self.path('expected'), 'x'), self.options,
+            max_transactions=10, processes=1))
+
+    def kill(self):
+        with self.assertRaises(Killed):
+            KilledConversion(self.path('x.aba'), self.path('x'),
+                self.options, max_transactions=10, checkpoint_every=5).run()
+
+    def test_resumed_the_same_day(self):
+        self.kill()
+
+        parts = convert_resumable(self.path('x.aba'), self.path('x'),
+            self.options, max_transactions=10, checkpoint_every=5)
+
+        self.assertEqual(self.read_parts(parts), self.expected())
+
+    def test_resumed_on_another_day_starts_again(self):
+        self.kill()
+        # the checkpoint was saved yesterday
+        with open(self.path('x.checkpoint')) as f:
+            state = json.load(f)
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        state['creation_date'] = yesterday.strftime('%y%m%d')
+        state['header_line'] = 'not checked today'
+        with open(self.path('x.checkpoint'), 'w') as f:
+            json.dump(state, f)
+
+        parts = convert_resumable(self.path('x.aba'), self.path('x'),
+            self.options, max_transactions=10, checkpoint_every=5)
+
+        self.assertEqual(self.read_parts(parts), self.expected())
+        self.assertEqual(sorted(os.listdir(self.workdir)),
+            ['expected', 'x.aba', 'x_1.afi', 'x_2.afi', 'x_3.afi'])
+
+    def test_compressed(self):
+        parts = convert_resumable(self.path('x.aba'), self.path('x'),
+            self.options, max_transactions=10, compression='gz')
+
+        self.assertEqual([filename for filename, totals in parts],
+            [self.path('x_{}.afi.gz'.format(n)) for n in (1, 2, 3)])
+        self.assertEqual(self.read_parts(parts), self.expected())
+
+
+if __name__ == '__main__':
+    unittest.main()
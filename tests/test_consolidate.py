@@ -0,0 +1,62 @@
+# test_consolidate.py
+#
+# python -m unittest discover tests
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+from banktransactionfile.consolidate import consolidate_all
+from banktransactionfile.converter import ConversionOptions
+
+import synthetic
+
+
+class ConsolidateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.workdir, 'in')
+        self.output_dir = os.path.join(self.workdir, 'out')
+        os.makedirs(self.input_dir)
+        self.options = ConversionOptions()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_a_file_named_twice_is_converted_once(self):
+        filename = os.path.join(self.input_dir, 'a.aba')
+        synthetic.generate(filename, 3)
+
+        results = consolidate_all([filename,
+            os.path.join(self.input_dir, '..', 'in', 'a.aba')],
+            self.output_dir, self.options)
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['status'], 'converted')
+        self.assertEqual(results[0]['files'], [os.path.realpath(filename)])
+        self.assertEqual(results[0]['transaction_count'], 3)
+
+    def test_copies_of_a_file_fail_their_group(self):
+        filename = os.path.join(self.input_dir, 'a.aba')
+        synthetic.generate(filename, 3)
+        copy = os.path.join(self.input_dir, 'b.aba')
+        shutil.copyfile(filename, copy)
+
+        results = consolidate_all([filename, copy], self.output_dir,
+            self.options)
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['status'], 'failed')
+        self.assertIn('made twice', results[0]['error'])
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# test_mapped.py
+#
+# python -m unittest discover tests
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+from banktransactionfile.aba.file import InvalidFormatError
+from banktransactionfile.converter import ConversionOptions, convert
+
+import synthetic
+
+
+# Put text into record at start, keeping its length
+def put(record, start, text):
+    return record[:start] + text + record[start + len(text):]
+
+
+class MappedReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.aba_filename = os.path.join(self.workdir, 'x.aba')
+        synthetic.generate(self.aba_filename, 5)
+        with open(self.aba_filename) as f:
+            self.records = f.read().splitlines()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def write(self, records, line_ending='\n', encoding='utf-8'):
+        with open(self.aba_filename, 'w', newline='',
+            encoding=encoding) as f:
+            f.write(''.join(record + line_ending for record in records))
+
+    def convert(self, reader):
+        afi = io.StringIO()
+        try:
+            with open(self.aba_filename) as aba:
+                convert(aba, afi, ConversionOptions(reader=reader))
+        except Exception as e:
+            return e.__class__, str(e)
+        return afi.getvalue()
+
+    def assertSameAsStream(self):
+        expected = self.convert('stream')
+        self.assertEqual(self.convert('mmap'), expected)
+        return expected
+
+    def test_lone_cr_line_endings(self):
+        self.write(self.records, '\r')
+        self.assertIsInstance(self.assertSameAsStream(), str)
+
+    def test_non_ascii_names(self):
+        # still 120 characters, though more bytes
+        self.records[1] = put(self.records[1], 30, 'RENÉE')
+        self.write(self.records)
+        self.assertIn('REN', self.assertSameAsStream())
+
+    def test_bytes_that_do_not_decode(self):
+        self.records[1] = put(self.records[1], 30, 'RENÉE')
+        self.write(self.records, encoding='latin-1')
+        self.assertEqual(self.convert('mmap')[0], InvalidFormatError)
+
+    def test_errors_come_in_the_same_order(self):
+        bad_amount = put(self.records[1], 21, 'x')
+        for records in (
+            # a bad amount before a short line and a repeated header
+            [self.records[0], bad_amount, 'short'] + self.records[1:],
+            [self.records[0], bad_amount] + self.records,
+            # a repeated header before a missing control record
+            self.records[:2] + [self.records[0]],
+        ):
+            self.write(records)
+            self.assertIsInstance(self.assertSameAsStream(), tuple)
+
+
+if __name__ == '__main__':
+    unittest.main()
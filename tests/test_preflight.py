@@ -0,0 +1,50 @@
+# test_preflight.py
+#
+# python -m unittest discover tests
+
+import datetime
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+from banktransactionfile.converter import ConversionOptions
+from banktransactionfile.preflight import check_lines
+
+import synthetic
+
+
+class PreflightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.options = ConversionOptions(creation_date='990101')
+        last_year = datetime.date.today() - datetime.timedelta(days=400)
+        self.header = synthetic.header_record('ACME PAYROLL LTD', last_year)
+
+    def messages(self, errors, line_number):
+        return [message for number, message in errors
+            if number == line_number]
+
+    def test_a_header_only_file_has_its_header_checked(self):
+        errors = check_lines([self.header + '\n'], self.options)
+
+        header_errors = self.messages(errors, 1)
+        self.assertEqual(len(header_errors), 2)
+        self.assertTrue(header_errors[0].startswith('process_date: '))
+        self.assertTrue(header_errors[1].startswith('current_date: '))
+        self.assertIn('no transaction record', self.messages(errors, None))
+
+    def test_a_header_followed_by_a_short_line_has_its_header_checked(self):
+        errors = check_lines([self.header + '\n', '1' * 50 + '\n'],
+            self.options)
+
+        self.assertEqual(len(self.messages(errors, 1)), 2)
+        self.assertEqual(self.messages(errors, 2),
+            ['record is 50 characters long, not 120'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# test_service.py
+#
+# python -m unittest discover tests
+
+import asyncio
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from banktransactionfile.aba.file import InvalidFormatError
+from banktransactionfile.afi.field import ValidationError
+from banktransactionfile.service import get_options, read_batches
+
+
+async def blocks_of(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def read_all(blocks, batch_lines=2):
+    async def collect():
+        batches = []
+        try:
+            async for batch in read_batches(blocks, batch_lines):
+                batches.append(batch)
+        except InvalidFormatError as e:
+            return batches, e
+        return batches, None
+    return asyncio.run(collect())
+
+
+class ReadBatchesTest(unittest.TestCase):
+
+    def test_lines_are_batched(self):
+        batches, error = read_all(blocks_of(b'a\nb\nc', 1))
+        self.assertIsNone(error)
+        self.assertEqual(batches, [['a\n', 'b\n'], ['c']])
+
+    def test_a_line_without_an_end_fails_before_it_is_all_read(self):
+        read = []
+
+        async def endless():
+            yield b'a\n' + b'x' * 100
+            while True:
+                read.append(1)
+                yield b'x' * 100
+
+        batches, error = read_all(endless())
+        self.assertEqual(batches, [['a\n']])
+        self.assertIn('characters per line', str(error))
+        self.assertLess(len(read), 10)
+
+
+class GetOptionsTest(unittest.TestCase):
+
+    def test_options_are_checked(self):
+        for query in ('transaction_code=zz', 'transaction_code=99',
+            'file_type=9', 'creation_date=990101'):
+            with self.assertRaises(ValidationError):
+                get_options(query)
+
+    def test_valid_options(self):
+        options = get_options('transaction_code=52&file_type=7&other=1')
+        self.assertEqual(options.transaction_code, '52')
+        self.assertEqual(options.file_type, '7')
+
+
+if __name__ == '__main__':
+    unittest.main()
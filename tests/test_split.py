@@ -0,0 +1,122 @@
+# test_split.py
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+from banktransactionfile.converter import ConversionOptions
+from banktransactionfile.split import convert_split
+
+import synthetic
+
+
+class ConvertSplitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.options = ConversionOptions()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def path(self, name):
+        return os.path.join(self.workdir, name)
+
+    def read(self, name):
+        with open(self.path(name)) as f:
+            return f.read()
+
+    def write(self, name, text):
+        with open(self.path(name), 'w') as f:
+            f.write(text)
+
+    def test_one_part_removes_earlier_parts(self):
+        synthetic.generate(self.path('x.aba'), 10)
+        self.write('x_1.afi', 'earlier\n')
+        self.write('x_2.afi', 'earlier\n')
+
+        parts = convert_split(self.path('x.aba'), self.path('x'),
+            self.options)
+
+        self.assertEqual([filename for filename, totals in parts],
+            [self.path('x.afi')])
+        self.assertEqual(sorted(os.listdir(self.workdir)),
+            ['x.aba', 'x.afi'])
+
+    def test_fewer_parts_remove_earlier_parts(self):
+        synthetic.generate(self.path('x.aba'), 15)
+        for name in ('x.afi', 'x_1.afi', 'x_2.afi', 'x_3.afi'):
+            self.write(name, 'earlier\n')
+
+        convert_split(self.path('x.aba'), self.path('x'), self.options,
+            max_transactions=10, processes=1)
+
+        self.assertEqual(sorted(os.listdir(self.workdir)),
+            ['x.aba', 'x_1.afi', 'x_2.afi'])
+        self.assertNotEqual(self.read('x_2.afi'), 'earlier\n')
+
+    def test_failed_rename_puts_earlier_parts_back(self):
+        synthetic.generate(self.path('x.aba'), 25)
+        self.write('x_1.afi', 'earlier 1\n')
+        self.write('x_2.afi', 'earlier 2\n')
+        # the third part can't take its name
+        os.makedirs(os.path.join(self.path('x_3.afi'), 'in the way'))
+
+        with self.assertRaises(OSError):
+            convert_split(self.path('x.aba'), self.path('x'), self.options,
+                max_transactions=10, processes=1)
+
+        self.assertEqual(sorted(os.listdir(self.workdir)),
+            ['x.aba', 'x_1.afi', 'x_2.afi', 'x_3.afi'])
+        self.assertEqual(self.read('x_1.afi'), 'earlier 1\n')
+        self.assertEqual(self.read('x_2.afi'), 'earlier 2\n')
+
+    def test_failure_leaves_nothing_behind(self):
+        synthetic.generate(self.path('x.aba'), 30)
+        with open(self.path('x.aba')) as f:
+            lines = f.readlines()
+        # a bad amount in the last part
+        lines[-2] = lines[-2][:21] + 'x' + lines[-2][22:]
+        with open(self.path('x.aba'), 'w') as f:
+            f.writelines(lines)
+
+        with self.assertRaises(ValueError):
+            convert_split(self.path('x.aba'), self.path('x'), self.options,
+                max_transactions=10, processes=1)
+        self.assertEqual(os.listdir(self.workdir), ['x.aba'])
+
+    def test_conversions_to_the_same_name_do_not_mix(self):
+        synthetic.generate(self.path('a.aba'), 2000, seed=1)
+        synthetic.generate(self.path('b.aba'), 500, seed=2)
+        expected = []
+        for name in ('a', 'b'):
+            convert_split(self.path(name + '.aba'), self.path(name),
+                self.options, max_transactions=300, processes=1)
+            expected.append([self.read('{}_{}.afi'.format(name, n))
+                for n in (1, 2)])
+
+        threads = [threading.Thread(target=convert_split,
+            args=(self.path(name + '.aba'), self.path('out'), self.options),
+            kwargs={'max_transactions': 300, 'processes': 1})
+            for name in ('a', 'b')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        got = [self.read('out_{}.afi'.format(n)) for n in (1, 2)]
+        self.assertIn(got[0], (expected[0][0], expected[1][0]))
+        self.assertIn(got[1], (expected[0][1], expected[1][1]))
+        self.assertFalse([name for name in os.listdir(self.workdir)
+            if name.endswith('.partial')])
+
+
+if __name__ == '__main__':
+    unittest.main()
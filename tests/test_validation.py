@@ -0,0 +1,70 @@
+# test_validation.py
+#
+# python -m unittest discover tests
+
+import datetime
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+from banktransactionfile.afi import field
+from banktransactionfile.afi.field import ValidationError
+from banktransactionfile.converter import ConversionOptions, convert
+
+import synthetic
+
+
+class ValidValuesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.aba_filename = os.path.join(self.workdir, 'x.aba')
+        synthetic.generate(self.aba_filename, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def convert(self, options):
+        afi = io.StringIO()
+        with open(self.aba_filename) as aba:
+            convert(aba, afi, options)
+        return afi.getvalue()
+
+    def test_options_outside_the_valid_values_fail(self):
+        for options, name in (
+            (ConversionOptions(transaction_code=99), 'TransactionCode'),
+            (ConversionOptions(transaction_code=60), 'TransactionCode'),
+            (ConversionOptions(transaction_code='ab'), 'TransactionCode'),
+            (ConversionOptions(file_type=9), 'FileType'),
+            (ConversionOptions(creation_date='990101'), 'FileCreationDate'),
+        ):
+            with self.assertRaises(ValidationError) as raised:
+                self.convert(options)
+            self.assertEqual(str(raised.exception),
+                'invalid value in ' + name)
+
+    def test_valid_options_convert(self):
+        today = datetime.date.today().strftime('%y%m%d')
+        for options in (ConversionOptions(),
+            ConversionOptions(transaction_code=52),
+            ConversionOptions(transaction_code='61', file_type='7',
+                creation_date=today)):
+            self.assertTrue(self.convert(options))
+
+    def test_fields_check_their_valid_values(self):
+        for cls, value in ((field.RecordType, 4),
+            (field.TransactionCode, 99), (field.FileType, 9),
+            (field.FileCreationDate, '990101')):
+            with self.assertRaises(ValidationError):
+                cls(value).parse_to_string()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# test_worker.py
+#
+# python -m unittest discover tests
+
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+from banktransactionfile.batch import convert_one
+from banktransactionfile.worker import run_jobs
+
+import synthetic
+
+
+class RunJobsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_bad_jobs_fail_without_stopping_the_worker(self):
+        aba_filename = os.path.join(self.workdir, 'x.aba')
+        synthetic.generate(aba_filename, 10)
+        jobs = [
+            json.dumps({'file': 1}),
+            json.dumps({'file': aba_filename, 'output_dir': ['out']}),
+            json.dumps({'file': None}),
+            json.dumps({'file': aba_filename}),
+        ]
+        out = io.StringIO()
+
+        count = run_jobs(jobs, out, self.workdir)
+
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(count, 4)
+        self.assertEqual([result['status'] for result in results],
+            ['failed', 'failed', 'failed', 'converted'])
+        self.assertEqual(results[0]['error'], 'file must be a string')
+        self.assertEqual(results[1]['error'], 'output_dir must be a string')
+
+    def test_convert_one_fails_a_filename_that_is_not_a_string(self):
+        result = convert_one(1, self.workdir)
+        self.assertEqual(result['status'], 'failed')
+        self.assertEqual(result['outputs'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()